@@ -1,6 +1,10 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 import os
+import json
+import itertools
+import hmac
+import time
 from dotenv import load_dotenv
 import logging
 
@@ -14,19 +18,139 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)
 
+# 服務角色（ROLE）：calc 只提供計算與分析端點，ocr 只提供 OCR 端點，all（預設）提供全部端點；
+# 只有 ocr、all 會載入 OpenCV、Tesseract 等 OCR 相依套件，計算用的副本啟動較快、記憶體較少
+ROLES = {
+    'calc': ('calc',),
+    'ocr': ('ocr',),
+    'all': ('calc', 'ocr')
+}
+role = os.environ.get('ROLE', 'all').lower()
+if role not in ROLES:
+    raise ValueError(f"不支援的 ROLE: {role}（可用: {', '.join(ROLES)}）")
+
+ocr_routes = Blueprint('ocr', __name__)
+calc_routes = Blueprint('calc', __name__)
+
 # 導入服務模組
-from services.ocr_service import OCRService
-from services.carbon_calculator import CarbonCalculator
-from services.movement_analyzer import MovementAnalyzer
+from services.carbon_calculator import CarbonCalculator, InsightAccumulator
+from services.movement_analyzer import GPSTrace, MovementAnalyzer
+from services.geographic_analyzer import GeographicAnalyzer
 from services.recommendation_engine import RecommendationEngine
 from services.data_processor import DataProcessor
+from services.footprint_recompute import FootprintRecomputer, RecomputeRun
+from services.rollup_store import RollupStore
+from services.footprint_forecaster import FootprintForecaster
+from services import metrics
+from services.profiling import RequestProfiler
 
 # 初始化服務
-ocr_service = OCRService()
+# OCR 服務只在 ocr、all 角色載入（匯入 OpenCV、Tesseract），其他角色為 None
+ocr_cache = None
+ocr_service = None
+if 'ocr' in ROLES[role]:
+    from services.ocr_cache import OCRResultCache
+    from services.ocr_service import OCRService
+    
+    # OCR 引擎預設在第一次使用時才載入；OCR_PRELOAD=true 時在主行程預先載入，
+    # 搭配 fork 型 worker（例如 gunicorn --preload）可讓各 worker 共用引擎記憶體
+    ocr_preload = os.environ.get('OCR_PRELOAD', 'False').lower() == 'true'
+    # 各 OCR 引擎同時執行；設定 OCR_EARLY_EXIT_CONFIDENCE 時，第一個達到門檻的引擎勝出
+    ocr_early_exit = os.environ.get('OCR_EARLY_EXIT_CONFIDENCE')
+    # 圖片解碼時縮小到 OCR_MAX_LONG_EDGE（0 表示不限制）或 OCR_TARGET_DPI，預設直接解碼為灰度
+    # OCR 結果快取：OCR_CACHE_MAX_MB 為記憶體層上限，設定 OCR_CACHE_PATH 時啟用 SQLite 磁碟層
+    ocr_cache = OCRResultCache(
+        max_bytes=int(float(os.environ.get('OCR_CACHE_MAX_MB', 64)) * 1024 * 1024),
+        disk_path=os.environ.get('OCR_CACHE_PATH') or None
+    )
+    ocr_service = OCRService(
+        preload=ocr_preload,
+        cache=ocr_cache,
+        engine_timeout=float(os.environ.get('OCR_ENGINE_TIMEOUT', 30)),
+        early_exit_confidence=float(ocr_early_exit) if ocr_early_exit else None,
+        batch_workers=int(os.environ['OCR_BATCH_WORKERS']) if os.environ.get('OCR_BATCH_WORKERS') else None,
+        batch_chunk_size=int(os.environ.get('OCR_BATCH_CHUNK_SIZE', 4)),
+        max_long_edge=int(os.environ.get('OCR_MAX_LONG_EDGE', 2000)) or None,
+        target_dpi=int(os.environ['OCR_TARGET_DPI']) if os.environ.get('OCR_TARGET_DPI') else None,
+        decode_grayscale=os.environ.get('OCR_DECODE_GRAYSCALE', 'True').lower() == 'true'
+    )
+
+# 排放係數：設定 EMISSION_FACTORS_PATH 時以 mmap 載入係數檔，檔案替換後自動切換為新版本
 carbon_calculator = CarbonCalculator()
 movement_analyzer = MovementAnalyzer()
-recommendation_engine = RecommendationEngine()
-data_processor = DataProcessor()
+geographic_analyzer = GeographicAnalyzer()
+recommendation_engine = RecommendationEngine(carbon_calculator)
+# 資料處理管線：每段 DATA_CHUNK_SIZE 筆記錄
+data_processor = DataProcessor(carbon_calculator, chunk_size=int(os.environ.get('DATA_CHUNK_SIZE', 1000)))
+footprint_recomputer = FootprintRecomputer(carbon_calculator)
+# 用戶日、週、月彙總（記憶體內），日界線使用 ROLLUP_UTC_OFFSET 時區
+rollup_store = RollupStore(carbon_calculator, utc_offset=float(os.environ.get('ROLLUP_UTC_OFFSET', 8)))
+# 預測模型依用戶快取，新的日資料只增量更新，每 FORECAST_REFIT_DAYS 天重新選擇參數
+footprint_forecaster = FootprintForecaster(
+    rollup_store,
+    refit_every=int(os.environ.get('FORECAST_REFIT_DAYS', 28)),
+    utc_offset=rollup_store.utc_offset
+)
+
+def ocr_cache_metrics():
+    """OCR 結果快取的查詢次數與記憶體用量"""
+    stats = ocr_cache.stats()
+    return [
+        ('ai_service_ocr_cache_lookups_total', 'counter', 'OCR 結果快取查詢次數', [
+            ({'result': 'hit'}, stats['hits']),
+            ({'result': 'disk_hit'}, stats['disk_hits']),
+            ({'result': 'miss'}, stats['misses'])
+        ]),
+        ('ai_service_ocr_cache_memory_bytes', 'gauge', 'OCR 結果快取記憶體用量（位元組）', [({}, stats['memory_bytes'])])
+    ]
+
+if ocr_cache is not None:
+    metrics.registry.register_collector(ocr_cache_metrics)
+
+# 請求分析：依 PROFILING_SAMPLE_RATE 抽樣（預設 0，不分析），結果依端點寫入 PROFILING_DIR；
+# PROFILING_MODE 為 cprofile（.pstats）或 sampling（.collapsed，可繪製 flamegraph）
+request_profiler = RequestProfiler(
+    output_dir=os.environ.get('PROFILING_DIR', 'logs/profiles'),
+    sample_rate=float(os.environ.get('PROFILING_SAMPLE_RATE', 0)),
+    mode=os.environ.get('PROFILING_MODE', 'cprofile'),
+    interval=float(os.environ.get('PROFILING_INTERVAL_MS', 5)) / 1000,
+    max_files=int(os.environ.get('PROFILING_MAX_FILES', 50))
+)
+
+def admin_authorized(token) -> bool:
+    """管理端點需要與 ADMIN_TOKEN 相同的 X-Admin-Token；未設定 ADMIN_TOKEN 時停用"""
+    expected = os.environ.get('ADMIN_TOKEN')
+    return bool(expected) and token is not None and hmac.compare_digest(token.encode(), expected.encode())
+
+def configure_profiling(data: dict) -> dict:
+    """調整抽樣比例與分析模式；enabled 為 false 時停止抽樣"""
+    sample_rate = data.get('sample_rate')
+    if data.get('enabled') is False:
+        sample_rate = 0.0
+    return request_profiler.configure(sample_rate=sample_rate, mode=data.get('mode'))
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    session = request_profiler.sample()
+    if session is not None:
+        session.activate()
+        g.profile_session = session
+
+@app.teardown_request
+def finish_request_profile(error=None):
+    # 串流回應在產生完畢後才結束請求，分析包含串流的處理
+    session = g.pop('profile_session', None)
+    if session is not None:
+        session.deactivate()
+        request_profiler.finish(session, request.url_rule.rule if request.url_rule else 'unmatched')
+
+@app.after_request
+def record_request_latency(response):
+    # 以路由樣板作為標籤，避免路徑參數造成過多的時間序列
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.record_request(endpoint, request.method, response.status_code, time.perf_counter() - g.request_start)
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -34,10 +158,43 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'service': 'carbon-ai-service',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'role': role,
+        'ocr_engines': ocr_service.engine_status() if ocr_service is not None else {}
+    })
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """各請求與處理階段的耗時直方圖（Prometheus 文字格式）"""
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """查詢或調整請求分析的抽樣設定"""
+    if not admin_authorized(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': '沒有管理權限'}), 403
+    
+    if request.method == 'GET':
+        return jsonify({
+            'success': True,
+            'data': request_profiler.status()
+        })
+    
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': '沒有提供數據'}), 400
+    
+    try:
+        status = configure_profiling(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'無效的分析設定: {e}'}), 400
+    
+    return jsonify({
+        'success': True,
+        'data': status
     })
 
-@app.route('/api/ocr/process', methods=['POST'])
+@ocr_routes.route('/api/ocr/process', methods=['POST'])
 def process_invoice_ocr():
     """處理發票 OCR 識別"""
     try:
@@ -60,7 +217,44 @@ def process_invoice_ocr():
         logger.error(f'OCR 處理錯誤: {str(e)}')
         return jsonify({'error': 'OCR 處理失敗'}), 500
 
-@app.route('/api/carbon/calculate', methods=['POST'])
+@ocr_routes.route('/api/ocr/process/batch', methods=['POST'])
+def process_invoice_ocr_batch():
+    """批次處理多張發票 OCR（?stream=true 時每完成一張即以 NDJSON 回傳）"""
+    try:
+        image_files = [f for f in request.files.getlist('images') if f.filename]
+        if not image_files:
+            return jsonify({'error': '沒有上傳圖片'}), 400
+        
+        if request.args.get('stream', 'false').lower() == 'true':
+            images = [f.read() for f in image_files]
+            
+            def generate():
+                for index, result in ocr_service.process_invoices(images, ordered=False):
+                    yield json.dumps({'index': index, **result}, ensure_ascii=False) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        # 依輸入順序回傳
+        results = [result for _, result in ocr_service.process_invoices(image_files)]
+        
+        return jsonify({
+            'success': True,
+            'data': results
+        })
+    
+    except Exception as e:
+        logger.error(f'批次 OCR 處理錯誤: {str(e)}')
+        return jsonify({'error': '批次 OCR 處理失敗'}), 500
+
+@ocr_routes.route('/api/ocr/cache/stats', methods=['GET'])
+def ocr_cache_stats():
+    """OCR 結果快取統計"""
+    return jsonify({
+        'success': True,
+        'data': ocr_cache.stats()
+    })
+
+@calc_routes.route('/api/carbon/calculate', methods=['POST'])
 def calculate_carbon_footprint():
     """計算碳足跡"""
     try:
@@ -81,10 +275,182 @@ def calculate_carbon_footprint():
         logger.error(f'碳足跡計算錯誤: {str(e)}')
         return jsonify({'error': '碳足跡計算失敗'}), 500
 
-@app.route('/api/movement/analyze', methods=['POST'])
+def iter_ndjson_activities(lines):
+    """逐行解析 NDJSON 活動，產生 (index, activity, error)"""
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line), None
+        except ValueError as e:
+            yield index, None, f'無效的 JSON: {e}'
+        index += 1
+
+def iter_batch_activities():
+    """逐筆讀取批次活動（支援 NDJSON 串流與 JSON 陣列）
+    
+    產生 (index, activity, error)，解析失敗的項目以 error 回報而不中斷整批。
+    """
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        # NDJSON 逐行讀取，不需先載入整個請求
+        yield from iter_ndjson_activities(request.stream)
+        return
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('activities')
+    if not isinstance(data, list):
+        raise ValueError('請提供 NDJSON 或 JSON 陣列格式的活動資料')
+    
+    for index, activity in enumerate(data):
+        yield index, activity, None
+
+@calc_routes.route('/api/carbon/calculate/batch', methods=['POST'])
+def calculate_carbon_footprint_batch():
+    """批次計算碳足跡，以 NDJSON 逐筆串流回傳結果"""
+    try:
+        activities = iter_batch_activities()
+        first = next(activities, None)
+    except Exception as e:
+        logger.error(f'批次碳足跡請求解析錯誤: {str(e)}')
+        return jsonify({'error': str(e)}), 400
+    
+    if first is None:
+        return jsonify({'error': '沒有提供數據'}), 400
+    
+    def generate():
+        try:
+            for index, activity, error in itertools.chain([first], activities):
+                if error is None and not isinstance(activity, dict):
+                    error = '活動資料必須是 JSON 物件'
+                
+                if error is None:
+                    result = carbon_calculator.calculate_footprint(activity)
+                    if 'error' in result:
+                        error = result['error']
+                
+                if error is None:
+                    item = {'index': index, 'success': True, 'data': result}
+                else:
+                    item = {'index': index, 'success': False, 'error': error}
+                
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f'批次碳足跡串流錯誤: {str(e)}')
+            yield json.dumps({'success': False, 'error': '批次處理中斷'}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def iter_trace_chunks(lines):
+    """逐行讀取 NDJSON 格式的 GPS 軌跡點，每 chunk_size 個點產生一段
+    
+    每行可為單一點，或 {"points": [...]} 形式的一批點。
+    """
+    chunk_size = movement_analyzer.chunk_size
+    buffer = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, dict) and 'points' in item:
+            if buffer:
+                yield GPSTrace.from_points(buffer)
+                buffer = []
+            yield from GPSTrace.iter_chunks(item['points'], chunk_size)
+            continue
+        buffer.append(item)
+        if len(buffer) >= chunk_size:
+            yield GPSTrace.from_points(buffer)
+            buffer = []
+    if buffer:
+        yield GPSTrace.from_points(buffer)
+
+@calc_routes.route('/api/carbon/factors', methods=['GET'])
+def get_emission_factors():
+    """目前使用的排放係數與已發布的版本"""
+    return jsonify({
+        'success': True,
+        'data': {
+            'version': carbon_calculator.factors.version,
+            'versions': carbon_calculator.registry.versions(),
+            'factors': carbon_calculator.get_emission_factors(),
+            'product_categories': carbon_calculator.product_categories
+        }
+    })
+
+@calc_routes.route('/api/carbon/recompute', methods=['POST'])
+def recompute_footprints():
+    """以各時間點生效的排放係數重新計算歷史碳足跡，只回傳數值改變的記錄"""
+    try:
+        ndjson = request.mimetype in ('application/x-ndjson', 'application/jsonl')
+        if ndjson:
+            # 大量記錄以串流方式處理，參數由查詢字串提供（versions 為 JSON）
+            options = {
+                'versions': request.args.get('versions'),
+                'start': request.args.get('start'),
+                'end': request.args.get('end')
+            }
+            records = request.stream
+        else:
+            options = request.get_json()
+            if not options:
+                return jsonify({'error': '沒有提供數據'}), 400
+            records = options.get('records') or []
+        
+        try:
+            versions = options.get('versions')
+            if isinstance(versions, str):
+                versions = json.loads(versions)
+            timeline = footprint_recomputer.timeline(versions)
+            start = footprint_recomputer.parse_time(options.get('start'))
+            end = footprint_recomputer.parse_time(options.get('end'))
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'無效的係數版本或時間範圍: {e}'}), 400
+        
+        if not ndjson:
+            result = footprint_recomputer.recompute(records, versions, start, end)
+            return jsonify({
+                'success': True,
+                'data': result
+            })
+    
+    except Exception as e:
+        logger.error(f'碳足跡重新計算錯誤: {str(e)}')
+        return jsonify({'error': '碳足跡重新計算失敗'}), 500
+    
+    def generate():
+        # 每行一筆改變的記錄，最後一行為統計
+        run = RecomputeRun()
+        try:
+            for changes in footprint_recomputer.iter_changes(records, timeline, start, end, run, prefetch=True):
+                for change in changes:
+                    yield json.dumps(change, ensure_ascii=False) + '\n'
+            yield json.dumps({'summary': footprint_recomputer.summary(run, timeline)}, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f'碳足跡重新計算串流錯誤: {str(e)}')
+            yield json.dumps({'success': False, 'error': '重新計算中斷'}, ensure_ascii=False) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@calc_routes.route('/api/movement/analyze', methods=['POST'])
 def analyze_movement():
     """分析移動模式"""
     try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            # GPS 軌跡串流：逐段清理與壓縮，不需先載入整天的軌跡
+            include_compact = request.args.get('include_compact', 'false').lower() == 'true'
+            try:
+                trace = movement_analyzer.analyze_stream(iter_trace_chunks(request.stream), include_compact=include_compact)
+            except (ValueError, KeyError, TypeError) as e:
+                return jsonify({'error': f'無效的軌跡資料: {e}'}), 400
+            return jsonify({
+                'success': True,
+                'data': {'trace': trace}
+            })
+        
         data = request.get_json()
         
         if not data:
@@ -102,7 +468,102 @@ def analyze_movement():
         logger.error(f'移動分析錯誤: {str(e)}')
         return jsonify({'error': '移動分析失敗'}), 500
 
-@app.route('/api/recommendations/generate', methods=['POST'])
+def iter_geographic_chunks(lines):
+    """逐行讀取 NDJSON 格式的點（每行一點或 {"points": [...]}），每 chunk_size 個點產生一段"""
+    chunk_size = geographic_analyzer.chunk_size
+    buffer = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        item = json.loads(line)
+        if isinstance(item, dict) and 'points' in item:
+            yield from geographic_analyzer.iter_point_chunks(item['points'])
+            continue
+        buffer.append(item)
+        if len(buffer) >= chunk_size:
+            yield geographic_analyzer.to_columns(buffer)
+            buffer = []
+    if buffer:
+        yield geographic_analyzer.to_columns(buffer)
+
+@calc_routes.route('/api/analytics/geographic', methods=['POST'])
+def analyze_geographic():
+    """地理分析：熱力圖與熱點"""
+    try:
+        try:
+            if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+                # 大量點以串流方式分批加入空間索引；參數由查詢字串提供
+                result = geographic_analyzer.analyze_chunks(
+                    iter_geographic_chunks(request.stream),
+                    cell_size=request.args.get('cell_size', type=float),
+                    hotspot_radius=request.args.get('hotspot_radius', type=float),
+                    min_hotspot_points=request.args.get('min_hotspot_points', type=int)
+                )
+            else:
+                data = request.get_json()
+                if not data:
+                    return jsonify({'error': '沒有提供數據'}), 400
+                result = geographic_analyzer.analyze(data)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'無效的座標資料: {e}'}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    
+    except Exception as e:
+        logger.error(f'地理分析錯誤: {str(e)}')
+        return jsonify({'error': '地理分析失敗'}), 500
+
+def forecast_series(data: dict):
+    """請求的每日碳足跡；兩者皆未提供時回傳 None"""
+    if data.get('series'):
+        # 直接提供每日碳足跡：{用戶: [{date, value}]}
+        return {
+            user_id: footprint_forecaster.parse_series(points)
+            for user_id, points in data['series'].items()
+        }
+    # 未提供時讀取用戶彙總的每日碳足跡
+    user_ids = data.get('user_ids') or ([data['user_id']] if data.get('user_id') else [])
+    if not user_ids:
+        return None
+    return footprint_forecaster.series_from_rollups(user_ids)
+
+@calc_routes.route('/api/analytics/forecast', methods=['POST'])
+def forecast_footprint():
+    """預測用戶未來一週、一個月或一季的每日碳排放"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({'error': '沒有提供數據'}), 400
+        
+        try:
+            series = forecast_series(data)
+            if series is None:
+                return jsonify({'error': '沒有提供 user_id 或 series'}), 400
+            
+            result = footprint_forecaster.forecast(
+                series,
+                period=data.get('period', 'month'),
+                model=data.get('model', 'auto'),
+                start=data.get('start')
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': f'無效的預測參數: {e}'}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    
+    except Exception as e:
+        logger.error(f'碳足跡預測錯誤: {str(e)}')
+        return jsonify({'error': '碳足跡預測失敗'}), 500
+
+@calc_routes.route('/api/recommendations/generate', methods=['POST'])
 def generate_recommendations():
     """生成環保建議"""
     try:
@@ -123,17 +584,21 @@ def generate_recommendations():
         logger.error(f'建議生成錯誤: {str(e)}')
         return jsonify({'error': '建議生成失敗'}), 500
 
-@app.route('/api/data/process', methods=['POST'])
+@calc_routes.route('/api/data/process', methods=['POST'])
 def process_user_data():
     """處理用戶數據"""
     try:
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({'error': '沒有提供數據'}), 400
-        
-        # 處理數據
-        result = data_processor.process_data(data)
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            # 完整歷史匯出等大量記錄以串流方式逐段處理，每行一筆記錄
+            result = data_processor.process_stream(request.stream, utc_offset=request.args.get('utc_offset', type=float))
+        else:
+            data = request.get_json()
+            
+            if not data:
+                return jsonify({'error': '沒有提供數據'}), 400
+            
+            # 處理數據
+            result = data_processor.process_data(data)
         
         return jsonify({
             'success': True,
@@ -144,7 +609,158 @@ def process_user_data():
         logger.error(f'數據處理錯誤: {str(e)}')
         return jsonify({'error': '數據處理失敗'}), 500
 
-@app.route('/api/insights/generate', methods=['POST'])
+def ingest_rollup_records(data: dict) -> dict:
+    """加入 records；修改或刪除活動時，removed 為原本加入的記錄"""
+    result = rollup_store.ingest(data.get('records') or [])
+    if data.get('removed'):
+        removed = rollup_store.ingest(data['removed'], remove=True)
+        result['removed_count'] = removed['removed_count']
+        result['invalid_count'] += removed['invalid_count']
+    return result
+
+@calc_routes.route('/api/rollups/ingest', methods=['POST'])
+def ingest_rollups():
+    """新增活動時增量更新用戶的日、週、月彙總"""
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+            # 重新匯入歷史記錄等大量記錄以串流方式處理；remove=true 時扣除
+            remove = request.args.get('remove', 'false').lower() == 'true'
+            result = rollup_store.ingest(request.stream, remove=remove, prefetch=True)
+        else:
+            data = request.get_json()
+            
+            if not data:
+                return jsonify({'error': '沒有提供數據'}), 400
+            
+            result = ingest_rollup_records(data)
+        
+        return jsonify({
+            'success': True,
+            'data': result
+        })
+    
+    except Exception as e:
+        logger.error(f'彙總更新錯誤: {str(e)}')
+        return jsonify({'error': '彙總更新失敗'}), 500
+
+@calc_routes.route('/api/rollups/trends', methods=['GET'])
+def get_rollup_trends():
+    """用戶每日、每週或每月的碳排放趨勢"""
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': '沒有提供 user_id'}), 400
+        
+        trends = rollup_store.trends(
+            user_id,
+            request.args.get('start'),
+            request.args.get('end'),
+            group_by=request.args.get('group_by', 'day')
+        )
+        return jsonify({
+            'success': True,
+            'data': trends
+        })
+    
+    except ValueError as e:
+        return jsonify({'error': f'無效的查詢參數: {e}'}), 400
+    except Exception as e:
+        logger.error(f'趨勢查詢錯誤: {str(e)}')
+        return jsonify({'error': '趨勢查詢失敗'}), 500
+
+@calc_routes.route('/api/rollups/daily', methods=['GET'])
+def get_rollup_daily():
+    """用戶單日碳足跡"""
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id or not request.args.get('date'):
+            return jsonify({'error': '沒有提供 user_id 或 date'}), 400
+        
+        return jsonify({
+            'success': True,
+            'data': rollup_store.daily_footprint(user_id, request.args['date'])
+        })
+    
+    except ValueError as e:
+        return jsonify({'error': f'無效的查詢參數: {e}'}), 400
+    except Exception as e:
+        logger.error(f'每日碳足跡查詢錯誤: {str(e)}')
+        return jsonify({'error': '每日碳足跡查詢失敗'}), 500
+
+@calc_routes.route('/api/rollups/comparison', methods=['GET'])
+def get_rollup_comparison():
+    """用戶與前一個等長區間及所有用戶平均的比較"""
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({'error': '沒有提供 user_id'}), 400
+        
+        comparison = rollup_store.comparison(user_id, request.args.get('start'), request.args.get('end'))
+        return jsonify({
+            'success': True,
+            'data': comparison
+        })
+    
+    except ValueError as e:
+        return jsonify({'error': f'無效的查詢參數: {e}'}), 400
+    except Exception as e:
+        logger.error(f'比較查詢錯誤: {str(e)}')
+        return jsonify({'error': '比較查詢失敗'}), 500
+
+@calc_routes.route('/api/rollups/leaderboard', methods=['GET'])
+def get_rollup_leaderboard():
+    """區間內平均每日碳排放最低的用戶"""
+    try:
+        leaderboard = rollup_store.leaderboard(
+            request.args.get('start'),
+            request.args.get('end'),
+            limit=min(max(request.args.get('limit', 10, type=int), 1), 100)
+        )
+        return jsonify({
+            'success': True,
+            'data': leaderboard
+        })
+    
+    except ValueError as e:
+        return jsonify({'error': f'無效的查詢參數: {e}'}), 400
+    except Exception as e:
+        logger.error(f'排行榜查詢錯誤: {str(e)}')
+        return jsonify({'error': '排行榜查詢失敗'}), 500
+
+def build_insights(data: dict) -> dict:
+    """由碳足跡、移動資料生成洞察與建議"""
+    insights = []
+    
+    # 分析碳足跡趨勢
+    insight_state = None
+    if 'insight_state' in data:
+        # 增量模式：carbon_data 只需包含上次狀態之後的新記錄
+        accumulator = InsightAccumulator.from_dict(data['insight_state'])
+        accumulator.extend(data.get('carbon_data', []))
+        insights.extend(accumulator.generate_insights())
+        insight_state = accumulator.to_dict()
+    elif 'carbon_data' in data:
+        carbon_insights = carbon_calculator.generate_insights(data['carbon_data'])
+        insights.extend(carbon_insights)
+    
+    # 分析移動模式
+    if 'movement_data' in data:
+        movement_insights = movement_analyzer.generate_insights(data['movement_data'])
+        insights.extend(movement_insights)
+    
+    # 生成建議
+    recommendations = recommendation_engine.generate_recommendations(data)
+    
+    result = {
+        'insights': insights,
+        'recommendations': recommendations
+    }
+    if insight_state is not None:
+        result['insight_state'] = insight_state
+    
+    return result
+
+@calc_routes.route('/api/insights/generate', methods=['POST'])
 def generate_insights():
     """生成數據洞察"""
     try:
@@ -153,34 +769,21 @@ def generate_insights():
         if not data:
             return jsonify({'error': '沒有提供數據'}), 400
         
-        # 生成洞察
-        insights = []
-        
-        # 分析碳足跡趨勢
-        if 'carbon_data' in data:
-            carbon_insights = carbon_calculator.generate_insights(data['carbon_data'])
-            insights.extend(carbon_insights)
-        
-        # 分析移動模式
-        if 'movement_data' in data:
-            movement_insights = movement_analyzer.generate_insights(data['movement_data'])
-            insights.extend(movement_insights)
-        
-        # 生成建議
-        recommendations = recommendation_engine.generate_recommendations(data)
+        result = build_insights(data)
         
         return jsonify({
             'success': True,
-            'data': {
-                'insights': insights,
-                'recommendations': recommendations
-            }
+            'data': result
         })
     
     except Exception as e:
         logger.error(f'洞察生成錯誤: {str(e)}')
         return jsonify({'error': '洞察生成失敗'}), 500
 
+# 只註冊目前角色的端點
+for name in ROLES[role]:
+    app.register_blueprint({'calc': calc_routes, 'ocr': ocr_routes}[name])
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': '端點不存在'}), 404
@@ -0,0 +1,650 @@
+"""AI 服務的 ASGI 版本
+
+端點與請求、回應格式和 app.py（Flask）相同，服務實例也共用 app.py 的設定。
+OCR 與計算工作分別交給固定大小的執行緒池，每個端點有並行上限與等待佇列，
+慢速的 OCR 不會擋住 /api/carbon/calculate 等輕量請求。
+
+啟動方式:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5001
+
+服務狀態（彙總、預測模型、快取）保存在行程內，預設只啟動一個 worker。
+"""
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.datastructures import UploadFile
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from app import (
+    ROLES, admin_authorized, build_insights, carbon_calculator, configure_profiling, data_processor,
+    footprint_forecaster, footprint_recomputer, forecast_series, geographic_analyzer, ingest_rollup_records,
+    iter_geographic_chunks, iter_ndjson_activities, iter_trace_chunks, movement_analyzer, ocr_cache, ocr_service,
+    recommendation_engine, request_profiler, role, rollup_store
+)
+from services import metrics
+from services.concurrency import BoundedExecutor, EndpointLimiter, QueueFull, spool_lines
+from services.footprint_recompute import RecomputeRun
+from services.profiling import ProfileSession
+
+logger = logging.getLogger(__name__)
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl')
+
+# OCR 與計算使用不同的執行緒池
+executors = {
+    'ocr': BoundedExecutor('ocr', int(os.environ.get('OCR_WORKERS', 2))),
+    'compute': BoundedExecutor('compute', int(os.environ.get('COMPUTE_WORKERS', 4)))
+}
+
+# 端點: (執行緒池, 並行上限, 等待佇列上限)；可以 ASGI_LIMIT_<端點>=並行上限,佇列上限 覆寫
+# 並行上限是端點最多可佔用的執行緒名額（不超過執行緒池大小）；同一執行緒池的端點合計同時執行的工作數
+# 等於執行緒池大小，由 BoundedExecutor 限制
+ENDPOINT_LIMITS = {
+    'ocr': ('ocr', 2, 32),
+    'ocr_batch': ('ocr', 1, 4),
+    'carbon_batch': ('compute', 2, 16),
+    'recompute': ('compute', 1, 4),
+    'movement': ('compute', 2, 16),
+    'geographic': ('compute', 2, 16),
+    'recommendations': ('compute', 4, 64),
+    'data': ('compute', 2, 8),
+    'rollups': ('compute', 2, 32),
+    'rollup_queries': ('compute', 4, 64),
+    'forecast': ('compute', 2, 16),
+    'insights': ('compute', 4, 64)
+}
+
+def _limiter(name: str, executor: str, concurrency: int, queue: int) -> EndpointLimiter:
+    override = os.environ.get(f'ASGI_LIMIT_{name.upper()}')
+    if override:
+        concurrency, queue = (int(value) for value in override.split(','))
+    return EndpointLimiter(name, min(concurrency, executors[executor].workers), queue)
+
+limiters = {name: _limiter(name, *limits) for name, limits in ENDPOINT_LIMITS.items()}
+
+def concurrency_metrics():
+    """各端點與執行緒池的目前並行數、佇列深度與累計數量"""
+    endpoints = {name: limiter.stats() for name, limiter in limiters.items()}
+    pools = {name: executor.stats() for name, executor in executors.items()}
+    
+    def samples(stats, label, key):
+        return [({label: name}, values[key]) for name, values in stats.items()]
+    
+    return [
+        ('ai_service_endpoint_in_flight', 'gauge', '端點執行中的請求數', samples(endpoints, 'endpoint', 'in_flight')),
+        ('ai_service_endpoint_queued', 'gauge', '端點等待佇列中的請求數', samples(endpoints, 'endpoint', 'queued')),
+        ('ai_service_endpoint_completed_total', 'counter', '端點完成的請求數', samples(endpoints, 'endpoint', 'completed')),
+        ('ai_service_endpoint_rejected_total', 'counter', '端點佇列已滿而拒絕的請求數', samples(endpoints, 'endpoint', 'rejected')),
+        ('ai_service_executor_active', 'gauge', '執行緒池執行中的工作數', samples(pools, 'executor', 'active')),
+        ('ai_service_executor_queued', 'gauge', '執行緒池等待中的工作數', samples(pools, 'executor', 'queued')),
+        ('ai_service_executor_busy_seconds_total', 'counter', '執行緒池累計執行秒數', samples(pools, 'executor', 'busy_seconds')),
+        ('ai_service_executor_wait_seconds_total', 'counter', '工作等待執行緒名額的累計秒數', samples(pools, 'executor', 'wait_seconds'))
+    ]
+
+metrics.registry.register_collector(concurrency_metrics)
+
+class RequestTimer:
+    """記錄每個請求到開始回應的耗時（與 Flask 版的 after_request 相同），標籤為路由樣板"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        
+        start = time.perf_counter()
+        recorded = False
+        
+        def record(status: int):
+            nonlocal recorded
+            route = scope.get('route')
+            endpoint = getattr(route, 'path', None) or 'unmatched'
+            metrics.record_request(endpoint, scope['method'], status, time.perf_counter() - start)
+            recorded = True
+        
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                record(message['status'])
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_timed)
+        except Exception:
+            if not recorded:
+                record(500)
+            raise
+
+# 目前請求的分析（未被抽樣時為 None）；事件迴圈上的工作不分析，只分析交給執行緒池的工作
+profile_session: ContextVar[Optional[ProfileSession]] = ContextVar('profile_session', default=None)
+
+class RequestProfiling:
+    """依抽樣比例分析請求，請求（含串流回應）結束後依路由樣板寫入分析檔案"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        session = request_profiler.sample() if scope['type'] == 'http' else None
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+        
+        token = profile_session.set(session)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profile_session.reset(token)
+            endpoint = getattr(scope.get('route'), 'path', None) or 'unmatched'
+            await asyncio.to_thread(request_profiler.finish, session, endpoint)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    for executor in executors.values():
+        executor.shutdown()
+
+app = FastAPI(title='carbon-ai-service', version='1.0.0', lifespan=lifespan)
+app.add_middleware(RequestTimer)
+app.add_middleware(RequestProfiling)
+
+@app.exception_handler(QueueFull)
+async def queue_full(request: Request, error: QueueFull):
+    return JSONResponse({'error': '服務忙碌中，請稍後再試'}, status_code=503, headers={'Retry-After': '1'})
+
+@app.exception_handler(StarletteHTTPException)
+async def http_error(request: Request, error: StarletteHTTPException):
+    if error.status_code == 404:
+        return JSONResponse({'error': '端點不存在'}, status_code=404)
+    return JSONResponse({'error': str(error.detail)}, status_code=error.status_code)
+
+@app.exception_handler(Exception)
+async def internal_error(request: Request, error: Exception):
+    return JSONResponse({'error': '內部伺服器錯誤'}, status_code=500)
+
+# 端點依服務角色分組，只註冊 ROLE 需要的部分（與 app.py 的 Blueprint 相同）
+ocr_routes = APIRouter()
+calc_routes = APIRouter()
+
+def respond(result: Tuple[Dict, int]) -> JSONResponse:
+    body, status = result
+    return JSONResponse(body, status_code=status)
+
+def error(message: str, status: int = 400) -> JSONResponse:
+    return JSONResponse({'error': message}, status_code=status)
+
+def service_call(function, log: str, message: str, invalid: Optional[Tuple[str, tuple]] = None) -> Tuple[Dict, int]:
+    """執行服務方法並轉為 (回應內容, 狀態碼)；invalid 為 (訊息前綴, 視為請求錯誤的例外類型)"""
+    try:
+        return {'success': True, 'data': function()}, 200
+    except Exception as e:
+        if invalid is not None and isinstance(e, invalid[1]):
+            return {'error': f'{invalid[0]}: {e}'}, 400
+        logger.error(f'{log}: {str(e)}')
+        return {'error': message}, 500
+
+def profiled(function):
+    """被抽樣的請求在執行緒池中執行的工作納入分析"""
+    session = profile_session.get()
+    return function if session is None else session.wrap(function)
+
+async def offload(name: str, function, *args, **kwargs):
+    """在端點的並行上限內，把工作交給對應的執行緒池"""
+    async with limiters[name]:
+        return await executors[ENDPOINT_LIMITS[name][0]].run(profiled(function), *args, **kwargs)
+
+async def stream(name: str, iterator, batch_size: int = 1):
+    """在執行緒池中逐項產生串流回應"""
+    session = profile_session.get()
+    if session is not None:
+        iterator = session.wrap_iterator(iterator)
+    async for item in executors[ENDPOINT_LIMITS[name][0]].iterate(iterator, batch_size):
+        yield item
+
+class LimitedStreamingResponse(StreamingResponse):
+    """佔用端點並行名額的串流回應；名額在呼叫前取得，回應結束時釋放
+    
+    在 __call__ 中釋放而非在產生器的 finally：用戶端在第一段之前中斷時產生器不會開始執行。
+    """
+    
+    def __init__(self, name: str, iterator, batch_size: int = 1):
+        super().__init__(stream(name, iterator, batch_size), media_type='application/x-ndjson')
+        self.name = name
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            limiters[self.name].release()
+
+async def read_json(request: Request):
+    """與 Flask 的 get_json 相同：非 JSON 或無法解析時回傳 None"""
+    if request.headers.get('content-type', '').split(';')[0].strip() != 'application/json':
+        return None
+    try:
+        return json.loads(await request.body() or b'null')
+    except ValueError:
+        return None
+
+def is_ndjson(request: Request) -> bool:
+    return request.headers.get('content-type', '').split(';')[0].strip() in NDJSON_TYPES
+
+async def request_lines(request: Request):
+    """在事件迴圈中讀完的請求內容（逐行）；慢速上傳不佔用執行緒池"""
+    return await spool_lines(request.stream())
+
+def query_value(request: Request, name: str, cast):
+    """與 Flask 的 request.args.get(type=...) 相同：無法轉換時為 None"""
+    value = request.query_params.get(name)
+    try:
+        return cast(value) if value is not None else None
+    except ValueError:
+        return None
+
+@app.get('/health')
+async def health_check():
+    """健康檢查端點"""
+    return {
+        'status': 'healthy',
+        'service': 'carbon-ai-service',
+        'version': '1.0.0',
+        'role': role,
+        'ocr_engines': ocr_service.engine_status() if ocr_service is not None else {}
+    }
+
+@app.get('/api/admin/profiling')
+async def get_profiling_settings(request: Request):
+    """查詢請求分析的抽樣設定"""
+    if not admin_authorized(request.headers.get('X-Admin-Token')):
+        return error('沒有管理權限', 403)
+    return {'success': True, 'data': request_profiler.status()}
+
+@app.post('/api/admin/profiling')
+async def update_profiling_settings(request: Request):
+    """調整請求分析的抽樣設定"""
+    if not admin_authorized(request.headers.get('X-Admin-Token')):
+        return error('沒有管理權限', 403)
+    
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    try:
+        return {'success': True, 'data': configure_profiling(data)}
+    except (ValueError, TypeError) as e:
+        return error(f'無效的分析設定: {e}')
+
+@app.get('/api/concurrency/stats')
+async def concurrency_stats():
+    """各端點的並行數、等待佇列深度與執行緒池使用狀況"""
+    return {
+        'success': True,
+        'data': {
+            'endpoints': {name: limiter.stats() for name, limiter in limiters.items()},
+            'executors': {name: executor.stats() for name, executor in executors.items()}
+        }
+    }
+
+@app.get('/metrics')
+async def prometheus_metrics():
+    """各請求與處理階段的耗時直方圖、並行與快取狀態（Prometheus 文字格式）"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+@ocr_routes.post('/api/ocr/process')
+async def process_invoice_ocr(request: Request):
+    """處理發票 OCR 識別"""
+    form = await request.form()
+    image_file = form.get('image')
+    if not isinstance(image_file, UploadFile):
+        return error('沒有上傳圖片')
+    if not image_file.filename:
+        return error('沒有選擇檔案')
+    image = io.BytesIO(await image_file.read())
+    
+    return respond(await offload(
+        'ocr', service_call, lambda: ocr_service.process_invoice(image), 'OCR 處理錯誤', 'OCR 處理失敗'
+    ))
+
+@ocr_routes.post('/api/ocr/process/batch')
+async def process_invoice_ocr_batch(request: Request):
+    """批次處理多張發票 OCR（?stream=true 時每完成一張即以 NDJSON 回傳）"""
+    form = await request.form()
+    image_files = [f for f in form.getlist('images') if isinstance(f, UploadFile) and f.filename]
+    if not image_files:
+        return error('沒有上傳圖片')
+    images = [await f.read() for f in image_files]
+    
+    if request.query_params.get('stream', 'false').lower() == 'true':
+        def generate():
+            for index, result in ocr_service.process_invoices(images, ordered=False):
+                yield json.dumps({'index': index, **result}, ensure_ascii=False) + '\n'
+        
+        await limiters['ocr_batch'].acquire()
+        return LimitedStreamingResponse('ocr_batch', generate())
+    
+    # 依輸入順序回傳
+    return respond(await offload(
+        'ocr_batch', service_call, lambda: [result for _, result in ocr_service.process_invoices(images)],
+        '批次 OCR 處理錯誤', '批次 OCR 處理失敗'
+    ))
+
+@ocr_routes.get('/api/ocr/cache/stats')
+async def ocr_cache_stats():
+    """OCR 結果快取統計"""
+    return {'success': True, 'data': ocr_cache.stats()}
+
+@calc_routes.post('/api/carbon/calculate')
+async def calculate_carbon_footprint(request: Request):
+    """計算碳足跡"""
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    # 單筆計算只需數十微秒，直接在事件迴圈中執行，不會排在 OCR 等慢速工作之後
+    return respond(service_call(lambda: carbon_calculator.calculate_footprint(data), '碳足跡計算錯誤', '碳足跡計算失敗'))
+
+@calc_routes.post('/api/carbon/calculate/batch')
+async def calculate_carbon_footprint_batch(request: Request):
+    """批次計算碳足跡，以 NDJSON 逐筆串流回傳結果"""
+    await limiters['carbon_batch'].acquire()
+    try:
+        if is_ndjson(request):
+            activities = iter_ndjson_activities(await spool_lines(request.stream()))
+            first = await executors['compute'].run(profiled(next), activities, None)
+        else:
+            data = await read_json(request)
+            if isinstance(data, dict):
+                data = data.get('activities')
+            if not isinstance(data, list):
+                raise ValueError('請提供 NDJSON 或 JSON 陣列格式的活動資料')
+            activities = ((index, activity, None) for index, activity in enumerate(data))
+            first = next(activities, None)
+    except Exception as e:
+        limiters['carbon_batch'].release()
+        logger.error(f'批次碳足跡請求解析錯誤: {str(e)}')
+        return error(str(e))
+    
+    if first is None:
+        limiters['carbon_batch'].release()
+        return error('沒有提供數據')
+    
+    def generate():
+        try:
+            for index, activity, failure in itertools.chain([first], activities):
+                if failure is None and not isinstance(activity, dict):
+                    failure = '活動資料必須是 JSON 物件'
+                
+                if failure is None:
+                    result = carbon_calculator.calculate_footprint(activity)
+                    if 'error' in result:
+                        failure = result['error']
+                
+                if failure is None:
+                    item = {'index': index, 'success': True, 'data': result}
+                else:
+                    item = {'index': index, 'success': False, 'error': failure}
+                
+                yield json.dumps(item, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f'批次碳足跡串流錯誤: {str(e)}')
+            yield json.dumps({'success': False, 'error': '批次處理中斷'}, ensure_ascii=False) + '\n'
+    
+    # 每次在執行緒池中計算一批結果，減少切換執行緒的成本
+    return LimitedStreamingResponse('carbon_batch', generate(), batch_size=256)
+
+@calc_routes.get('/api/carbon/factors')
+async def get_emission_factors():
+    """目前使用的排放係數與已發布的版本"""
+    return {
+        'success': True,
+        'data': {
+            'version': carbon_calculator.factors.version,
+            'versions': carbon_calculator.registry.versions(),
+            'factors': carbon_calculator.get_emission_factors(),
+            'product_categories': carbon_calculator.product_categories
+        }
+    }
+
+@calc_routes.post('/api/carbon/recompute')
+async def recompute_footprints(request: Request):
+    """以各時間點生效的排放係數重新計算歷史碳足跡，只回傳數值改變的記錄"""
+    ndjson = is_ndjson(request)
+    if ndjson:
+        # 大量記錄以串流方式處理，參數由查詢字串提供（versions 為 JSON）
+        options = {name: request.query_params.get(name) for name in ('versions', 'start', 'end')}
+    else:
+        options = await read_json(request)
+        if not options:
+            return error('沒有提供數據')
+    
+    try:
+        versions = options.get('versions')
+        if isinstance(versions, str):
+            versions = json.loads(versions)
+        timeline = footprint_recomputer.timeline(versions)
+        start = footprint_recomputer.parse_time(options.get('start'))
+        end = footprint_recomputer.parse_time(options.get('end'))
+    except (ValueError, TypeError) as e:
+        return error(f'無效的係數版本或時間範圍: {e}')
+    
+    if not ndjson:
+        records = options.get('records') or []
+        return respond(await offload(
+            'recompute', service_call, lambda: footprint_recomputer.recompute(records, versions, start, end),
+            '碳足跡重新計算錯誤', '碳足跡重新計算失敗'
+        ))
+    
+    records = await spool_lines(request.stream())
+    
+    def generate():
+        # 每行一筆改變的記錄，最後一行為統計
+        run = RecomputeRun()
+        try:
+            for changes in footprint_recomputer.iter_changes(records, timeline, start, end, run, prefetch=True):
+                for change in changes:
+                    yield json.dumps(change, ensure_ascii=False) + '\n'
+            yield json.dumps({'summary': footprint_recomputer.summary(run, timeline)}, ensure_ascii=False) + '\n'
+        except Exception as e:
+            logger.error(f'碳足跡重新計算串流錯誤: {str(e)}')
+            yield json.dumps({'success': False, 'error': '重新計算中斷'}, ensure_ascii=False) + '\n'
+    
+    await limiters['recompute'].acquire()
+    return LimitedStreamingResponse('recompute', generate(), batch_size=256)
+
+@calc_routes.post('/api/movement/analyze')
+async def analyze_movement(request: Request):
+    """分析移動模式"""
+    if is_ndjson(request):
+        # GPS 軌跡串流：逐段清理與壓縮，不需先載入整天的軌跡
+        include_compact = request.query_params.get('include_compact', 'false').lower() == 'true'
+        lines = await request_lines(request)
+        return respond(await offload(
+            'movement', service_call,
+            lambda: {'trace': movement_analyzer.analyze_stream(iter_trace_chunks(lines), include_compact=include_compact)},
+            '移動分析錯誤', '移動分析失敗', invalid=('無效的軌跡資料', (ValueError, KeyError, TypeError))
+        ))
+    
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'movement', service_call, lambda: movement_analyzer.analyze_patterns(data), '移動分析錯誤', '移動分析失敗'
+    ))
+
+@calc_routes.post('/api/analytics/geographic')
+async def analyze_geographic(request: Request):
+    """地理分析：熱力圖與熱點"""
+    invalid = ('無效的座標資料', (ValueError, KeyError, TypeError))
+    if is_ndjson(request):
+        # 大量點以串流方式分批加入空間索引；參數由查詢字串提供
+        lines = await request_lines(request)
+        options = {
+            'cell_size': query_value(request, 'cell_size', float),
+            'hotspot_radius': query_value(request, 'hotspot_radius', float),
+            'min_hotspot_points': query_value(request, 'min_hotspot_points', int)
+        }
+        return respond(await offload(
+            'geographic', service_call,
+            lambda: geographic_analyzer.analyze_chunks(iter_geographic_chunks(lines), **options),
+            '地理分析錯誤', '地理分析失敗', invalid=invalid
+        ))
+    
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'geographic', service_call, lambda: geographic_analyzer.analyze(data), '地理分析錯誤', '地理分析失敗',
+        invalid=invalid
+    ))
+
+@calc_routes.post('/api/recommendations/generate')
+async def generate_recommendations(request: Request):
+    """生成環保建議"""
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'recommendations', service_call, lambda: recommendation_engine.generate_recommendations(data),
+        '建議生成錯誤', '建議生成失敗'
+    ))
+
+@calc_routes.post('/api/data/process')
+async def process_user_data(request: Request):
+    """處理用戶數據"""
+    if is_ndjson(request):
+        # 完整歷史匯出等大量記錄以串流方式逐段處理，每行一筆記錄
+        lines = await request_lines(request)
+        utc_offset = query_value(request, 'utc_offset', float)
+        return respond(await offload(
+            'data', service_call, lambda: data_processor.process_stream(lines, utc_offset=utc_offset),
+            '數據處理錯誤', '數據處理失敗'
+        ))
+    
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'data', service_call, lambda: data_processor.process_data(data), '數據處理錯誤', '數據處理失敗'
+    ))
+
+@calc_routes.post('/api/rollups/ingest')
+async def ingest_rollups(request: Request):
+    """新增活動時增量更新用戶的日、週、月彙總"""
+    if is_ndjson(request):
+        # 重新匯入歷史記錄等大量記錄以串流方式處理；remove=true 時扣除
+        remove = request.query_params.get('remove', 'false').lower() == 'true'
+        lines = await request_lines(request)
+        return respond(await offload(
+            'rollups', service_call, lambda: rollup_store.ingest(lines, remove=remove, prefetch=True), '彙總更新錯誤', '彙總更新失敗'
+        ))
+    
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'rollups', service_call, lambda: ingest_rollup_records(data), '彙總更新錯誤', '彙總更新失敗'
+    ))
+
+@calc_routes.get('/api/rollups/trends')
+async def get_rollup_trends(request: Request):
+    """用戶每日、每週或每月的碳排放趨勢"""
+    params = request.query_params
+    if not params.get('user_id'):
+        return error('沒有提供 user_id')
+    
+    return respond(await offload(
+        'rollup_queries', service_call,
+        lambda: rollup_store.trends(params['user_id'], params.get('start'), params.get('end'),
+                                    group_by=params.get('group_by', 'day')),
+        '趨勢查詢錯誤', '趨勢查詢失敗', invalid=('無效的查詢參數', (ValueError,))
+    ))
+
+@calc_routes.get('/api/rollups/daily')
+async def get_rollup_daily(request: Request):
+    """用戶單日碳足跡"""
+    params = request.query_params
+    if not params.get('user_id') or not params.get('date'):
+        return error('沒有提供 user_id 或 date')
+    
+    return respond(await offload(
+        'rollup_queries', service_call, lambda: rollup_store.daily_footprint(params['user_id'], params['date']),
+        '每日碳足跡查詢錯誤', '每日碳足跡查詢失敗', invalid=('無效的查詢參數', (ValueError,))
+    ))
+
+@calc_routes.get('/api/rollups/comparison')
+async def get_rollup_comparison(request: Request):
+    """用戶與前一個等長區間及所有用戶平均的比較"""
+    params = request.query_params
+    if not params.get('user_id'):
+        return error('沒有提供 user_id')
+    
+    return respond(await offload(
+        'rollup_queries', service_call,
+        lambda: rollup_store.comparison(params['user_id'], params.get('start'), params.get('end')),
+        '比較查詢錯誤', '比較查詢失敗', invalid=('無效的查詢參數', (ValueError,))
+    ))
+
+@calc_routes.get('/api/rollups/leaderboard')
+async def get_rollup_leaderboard(request: Request):
+    """區間內平均每日碳排放最低的用戶"""
+    params = request.query_params
+    limit = min(max(query_value(request, 'limit', int) or 10, 1), 100)
+    
+    return respond(await offload(
+        'rollup_queries', service_call,
+        lambda: rollup_store.leaderboard(params.get('start'), params.get('end'), limit=limit),
+        '排行榜查詢錯誤', '排行榜查詢失敗', invalid=('無效的查詢參數', (ValueError,))
+    ))
+
+@calc_routes.post('/api/analytics/forecast')
+async def forecast_footprint(request: Request):
+    """預測用戶未來一週、一個月或一季的每日碳排放"""
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    if not data.get('series') and not data.get('user_ids') and not data.get('user_id'):
+        return error('沒有提供 user_id 或 series')
+    
+    return respond(await offload(
+        'forecast', service_call,
+        lambda: footprint_forecaster.forecast(forecast_series(data), period=data.get('period', 'month'),
+                                              model=data.get('model', 'auto'), start=data.get('start')),
+        '碳足跡預測錯誤', '碳足跡預測失敗', invalid=('無效的預測參數', (ValueError, KeyError, TypeError))
+    ))
+
+@calc_routes.post('/api/insights/generate')
+async def generate_insights(request: Request):
+    """生成數據洞察"""
+    data = await read_json(request)
+    if not data:
+        return error('沒有提供數據')
+    
+    return respond(await offload(
+        'insights', service_call, lambda: build_insights(data), '洞察生成錯誤', '洞察生成失敗'
+    ))
+
+for name in ROLES[role]:
+    app.include_router({'calc': calc_routes, 'ocr': ocr_routes}[name])
+
+if __name__ == '__main__':
+    import uvicorn
+    
+    port = int(os.environ.get('PORT', 5001))
+    logger.info(f'啟動 AI 服務（ASGI），端口: {port}')
+    uvicorn.run(app, host='0.0.0.0', port=port)
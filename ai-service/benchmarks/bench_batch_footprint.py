@@ -0,0 +1,87 @@
+"""批次碳足跡計算效能測試
+
+比較 calculate_footprint / calculate_transportation_emission 逐筆計算與
+對應的欄位式批次計算，並確認兩者結果完全一致。
+
+使用方式:
+    python benchmarks/bench_batch_footprint.py
+    python benchmarks/bench_batch_footprint.py --sizes 10000 100000 1000000
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.carbon_calculator import CarbonCalculator
+
+def generate_activities(size: int, seed: int = 42):
+    """以固定種子產生欄位式活動資料"""
+    rng = np.random.default_rng(seed)
+    activity_types = rng.choice(['transportation', 'shopping', 'food', 'energy'], size=size)
+    distances = np.round(rng.uniform(0, 200, size=size), 2)
+    passengers = rng.integers(1, 5, size=size)
+    vehicle_types = rng.choice(['gasoline', 'diesel', 'electric'], size=size)
+    amounts = np.round(rng.uniform(0, 5000, size=size), 0)
+    transport_types = rng.choice(['walking', 'driving', 'public_transport', 'flying'], size=size)
+    return activity_types, distances, passengers, vehicle_types, amounts, transport_types
+
+def report(name: str, size: int, scalar_time: float, batch_time: float, match: bool):
+    print(f"{name:<16} {size:>10} {scalar_time:>12.3f} {batch_time:>12.3f} "
+          f"{scalar_time / batch_time:>9.1f}x {str(match):>7}")
+
+def run(sizes, scalar_limit: int):
+    calculator = CarbonCalculator()
+    print(f"{'benchmark':<16} {'rows':>10} {'scalar (s)':>12} {'batch (s)':>12} {'speedup':>10} {'match':>7}")
+    
+    for size in sizes:
+        activity_types, distances, passengers, vehicle_types, amounts, transport_types = generate_activities(size)
+        # 大量資料的逐筆計算以抽樣方式估算，避免測試時間過長
+        sample = min(size, scalar_limit)
+        
+        start = time.perf_counter()
+        batch = calculator.calculate_footprint_batch(activity_types, distances, amounts)
+        batch_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        scalar = [
+            calculator.calculate_footprint({
+                'type': str(activity_types[i]),
+                'distance': float(distances[i]),
+                'total_amount': float(amounts[i])
+            })['carbon_footprint']
+            for i in range(sample)
+        ]
+        scalar_time = (time.perf_counter() - start) * size / sample
+        match = np.array_equal(batch['carbon_footprint'][:sample], np.array(scalar))
+        report('footprint', size, scalar_time, batch_time, match)
+        
+        start = time.perf_counter()
+        batch = calculator.calculate_transportation_batch(transport_types, distances, passengers, vehicle_types)
+        batch_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        scalar = [
+            calculator.calculate_transportation_emission({
+                'type': str(transport_types[i]),
+                'distance': float(distances[i]),
+                'passengers': int(passengers[i]),
+                'vehicle_type': str(vehicle_types[i])
+            })
+            for i in range(sample)
+        ]
+        scalar_time = (time.perf_counter() - start) * size / sample
+        match = np.array_equal(batch[:sample], np.array(scalar))
+        report('transportation', size, scalar_time, batch_time, match)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='批次碳足跡計算效能測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--scalar-limit', type=int, default=200_000, help='逐筆計算的最大抽樣筆數')
+    args = parser.parse_args()
+    run(args.sizes, args.scalar_limit)
@@ -0,0 +1,64 @@
+"""資料處理管線效能測試
+
+以合成的完整歷史匯出（NDJSON）比較一次載入全部記錄與 DataProcessor 串流處理的
+峰值記憶體（tracemalloc）與處理量，確認兩者結果一致，且串流處理的記憶體不隨輸入大小增加。
+
+使用方式:
+    python benchmarks/bench_data_processor.py
+    python benchmarks/bench_data_processor.py --sizes 10000 100000 1000000 --chunk-size 2000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import iter_history_export
+from services.data_processor import DataProcessor
+
+def measure(function):
+    """回傳 (結果, 秒數, 峰值記憶體 MB)"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+def run(sizes, chunk_size: int, load_limit: int):
+    processor = DataProcessor(chunk_size=chunk_size)
+    print(f"{'records':>10} {'mode':<8} {'seconds':>9} {'records/s':>11} {'peak MB':>9} {'total kg':>12} {'invalid':>8}")
+    
+    for size in sizes:
+        streamed, elapsed, peak = measure(lambda: processor.process_stream(iter_history_export(size)))
+        print(f"{size:>10} {'stream':<8} {elapsed:>9.2f} {size / elapsed:>11.0f} {peak:>9.1f} "
+              f"{streamed['total_emission']:>12.1f} {streamed['invalid_count']:>8}")
+        
+        if size <= load_limit:
+            # 一次載入：先解析全部記錄再處理
+            loaded, elapsed, peak = measure(
+                lambda: processor.process_data({'records': [json.loads(line) for line in iter_history_export(size)]})
+            )
+            print(f"{size:>10} {'load':<8} {elapsed:>9.2f} {size / elapsed:>11.0f} {peak:>9.1f} "
+                  f"{loaded['total_emission']:>12.1f} {loaded['invalid_count']:>8}")
+            assert loaded['total_emission'] == streamed['total_emission']
+            assert loaded['daily'] == streamed['daily']
+    
+    print('\n最後一次串流處理的各階段處理量:')
+    for name, stage in streamed['stages'].items():
+        print(f"  {name:<10} {stage['records_in']:>10} records {stage['seconds']:>8.2f} s "
+              f"{stage['records_per_second'] or 0:>12.0f} records/s  blocked {stage['blocked_seconds']:.2f} s")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='資料處理管線效能測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--load-limit', type=int, default=100_000, help='一次載入比較的最大筆數')
+    args = parser.parse_args()
+    run(args.sizes, args.chunk_size, args.load_limit)
@@ -0,0 +1,92 @@
+"""排放係數登錄表效能測試
+
+測量計算器建立、小批次交通計算（衍生係數表每版本只建立一次 vs 每次重建）、
+係數檔載入（memory map vs 完整讀取）與版本替換的成本，並確認替換後立即使用新係數。
+
+使用方式:
+    python benchmarks/bench_emission_factors.py
+    python benchmarks/bench_emission_factors.py --batches 5000 --factors 1000000
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.carbon_calculator import CarbonCalculator
+from services.emission_factors import DEFAULT_FACTORS, FactorRegistry, FactorSnapshot
+
+def timed(function, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+def run(batches: int, batch_size: int, factors: int):
+    registry = FactorRegistry()
+    calculator = CarbonCalculator(registry)
+    
+    _, elapsed = timed(lambda: CarbonCalculator(registry), 10000)
+    print(f'CarbonCalculator()            {elapsed * 1e6:10.2f} µs')
+    
+    _, elapsed = timed(lambda: calculator.calculate_energy_emission({'type': 'electricity', 'consumption': 10}), 100000)
+    print(f'scalar energy emission        {elapsed * 1e6:10.2f} µs')
+    _, elapsed = timed(lambda: calculator.calculate_food_emission({'items': [{'type': '牛排', 'weight': 1}]}), 100000)
+    print(f'scalar food emission          {elapsed * 1e6:10.2f} µs')
+    
+    rng = np.random.default_rng(42)
+    types = rng.choice(['walking', 'driving', 'public_transport', 'flying'], size=batch_size)
+    distances = rng.uniform(0, 50, size=batch_size)
+    vehicles = rng.choice(['gasoline', 'diesel', 'electric'], size=batch_size)
+    
+    def batch():
+        return calculator.calculate_transportation_batch(types, distances, vehicle_types=vehicles)
+    
+    def rebuilt():
+        # 每次呼叫重建衍生係數表（版本化之前的行為）
+        calculator.factors._derived.pop('transport_table', None)
+        return calculator.calculate_transportation_batch(types, distances, vehicle_types=vehicles)
+    
+    expected, cached_time = timed(batch, batches)
+    actual, rebuilt_time = timed(rebuilt, batches)
+    assert np.array_equal(expected, actual)
+    print(f'transport batch ({batch_size} rows)  cached {cached_time * 1e6:8.1f} µs   '
+          f'rebuilt {rebuilt_time * 1e6:8.1f} µs   ({rebuilt_time / cached_time:.1f}x)')
+    
+    # 大型係數表的載入：memory map 只讀取標頭，欄位在使用時才分頁載入
+    records = [(f'activity_{i}', float(i % 1000) / 100, 'kg', 'synthetic', 0.9, 'food') for i in range(factors)]
+    snapshot = FactorSnapshot.from_records(DEFAULT_FACTORS + records, version='large')
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'factors.bin')
+        _, elapsed = timed(lambda: snapshot.save(path))
+        print(f'save {len(snapshot)} factors        {elapsed * 1000:10.2f} ms ({os.path.getsize(path) / 1e6:.1f} MB)')
+        for mmap in (True, False):
+            loaded, elapsed = timed(lambda: FactorSnapshot.load(path, mmap=mmap))
+            _, lookup = timed(lambda: loaded.factor_of('activity_12345'), 10000)
+            print(f'load mmap={str(mmap):<5}              {elapsed * 1000:10.2f} ms   lookup {lookup * 1e6:.2f} µs')
+        
+        # 版本替換：寫入新係數檔後下一次取用即切換
+        path = os.path.join(directory, 'current.bin')
+        FactorSnapshot.from_records(DEFAULT_FACTORS).save(path)
+        registry = FactorRegistry(path=path, check_interval=0)
+        calculator = CarbonCalculator(registry)
+        before = calculator.calculate_energy_emission({'type': 'electricity', 'consumption': 100})
+        calculator.factors.with_factors({'electricity_taiwan': 0.494}, version='2025').save(path)
+        after, elapsed = timed(lambda: calculator.calculate_energy_emission({'type': 'electricity', 'consumption': 100}))
+        print(f'hot swap                      {elapsed * 1000:10.2f} ms   100 kWh: {before:.1f} -> {after:.1f} kg '
+              f'(version {calculator.factors.version})')
+        assert after != before
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='排放係數登錄表效能測試')
+    parser.add_argument('--batches', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--factors', type=int, default=200_000, help='大型係數表的係數數量')
+    args = parser.parse_args()
+    run(args.batches, args.batch_size, args.factors)
@@ -0,0 +1,86 @@
+"""碳足跡預測效能測試
+
+以合成的多用戶每日碳足跡（星期週期、緩慢趨勢與缺漏的日子）比較逐一擬合各用戶與
+一次批次擬合的耗時，測量新增一天資料後的增量更新，並以保留的最後 30 天評估預測誤差。
+
+使用方式:
+    python benchmarks/bench_footprint_forecaster.py
+    python benchmarks/bench_footprint_forecaster.py --users 20000 --days 730
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.footprint_forecaster import FootprintForecaster
+
+HOLDOUT = 30
+
+def daily_footprints(users: int, days: int, seed: int = 42):
+    """回傳日序號、(用戶, 日) 碳排放與是否有記錄"""
+    rng = np.random.default_rng(seed)
+    day_numbers = np.arange(19723, 19723 + days)
+    values = (rng.uniform(5, 20, users)[:, None]
+              + rng.normal(0, 3, (users, 7))[:, day_numbers % 7]
+              + np.linspace(0, 2, days)
+              + rng.normal(0, 1.5, (users, days)))
+    return day_numbers, np.maximum(values, 0), rng.random((users, days)) >= 0.1
+
+def series_until(day_numbers, values, logged, end: int):
+    return {
+        f'user_{user}': (day_numbers[:end][logged[user, :end]], values[user, :end][logged[user, :end]])
+        for user in range(len(values))
+    }
+
+def run(users: int, days: int, sample: int):
+    day_numbers, values, logged = daily_footprints(users, days)
+    end = days - HOLDOUT
+    history = series_until(day_numbers, values, logged, end)
+    
+    # 逐一擬合：每位用戶各自建立矩陣並搜尋參數
+    sampled = dict(list(history.items())[:sample])
+    start = time.perf_counter()
+    for user_id, series in sampled.items():
+        FootprintForecaster().update({user_id: series})
+    single = (time.perf_counter() - start) / len(sampled)
+    print(f'per-user fit    {single * 1000:8.2f} ms/user   {users} users ≈ {single * users:8.1f} s')
+    
+    forecaster = FootprintForecaster(refit_every=10_000)
+    start = time.perf_counter()
+    forecaster.update(history)
+    batch = time.perf_counter() - start
+    print(f'batch fit       {batch / users * 1000:8.3f} ms/user   {users} users   {batch:8.2f} s  ({single * users / batch:.0f}x)')
+    
+    # 新增一天：只從快取的狀態接續更新
+    next_day = series_until(day_numbers, values, logged, end + 1)
+    start = time.perf_counter()
+    result = forecaster.update(next_day)
+    print(f'incremental     {(time.perf_counter() - start) * 1000:8.1f} ms for {users} users   {result}')
+    
+    forecaster = FootprintForecaster()
+    actual = values[:, end:]
+    for model in ('seasonal_naive', 'ets', 'auto'):
+        start = time.perf_counter()
+        result = forecaster.forecast(history, period='month', model=model, start=int(day_numbers[end]))
+        elapsed = time.perf_counter() - start
+        predicted = np.array([[item['value'] for item in result['forecasts'][f'user_{user}']['daily']]
+                              for user in range(users)])
+        totals = actual.sum(axis=1)
+        intervals = np.array([result['forecasts'][f'user_{user}']['total_interval'] for user in range(users)])
+        coverage = np.mean((totals >= intervals[:, 0]) & (totals <= intervals[:, 1]))
+        print(f'{model:<15} MAE {np.mean(np.abs(predicted - actual)):6.3f} kg/day   '
+              f'80% total interval coverage {coverage:5.1%}   {elapsed:6.2f} s')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='碳足跡預測效能測試')
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=400)
+    parser.add_argument('--sample', type=int, default=200, help='逐一擬合的用戶數')
+    args = parser.parse_args()
+    run(args.users, args.days, args.sample)
@@ -0,0 +1,75 @@
+"""歷史碳足跡重新計算效能測試
+
+以合成的完整歷史匯出建立已儲存的碳足跡（內建係數），再以年中生效的新電力係數重新計算，
+確認只有生效時間之後的能源記錄改變，並列出各階段的處理量。
+
+使用方式:
+    python benchmarks/bench_footprint_recompute.py
+    python benchmarks/bench_footprint_recompute.py --records 10000000 --chunk-size 100000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import iter_history_export
+from services.carbon_calculator import CarbonCalculator
+from services.emission_factors import FactorRegistry
+from services.footprint_recompute import FootprintRecomputer, RecomputeRun
+
+VALID_FROM = '2024-07-01T00:00:00+08:00'
+
+def stored_history(recomputer: FootprintRecomputer, records: int):
+    """以內建係數計算每筆記錄的碳足跡，回傳加上 id 與 carbon_footprint 的 NDJSON 行"""
+    lines = [json.loads(line) for line in iter_history_export(records)]
+    for index, record in enumerate(lines):
+        record['id'] = index
+    timeline = recomputer.timeline()
+    for changes in recomputer.iter_changes(lines, timeline):
+        for change in changes:
+            lines[change['index']]['carbon_footprint'] = change['carbon_footprint']
+    return [json.dumps(record).encode('utf-8') for record in lines]
+
+def run(records: int, chunk_size: int, factor: float):
+    recomputer = FootprintRecomputer(CarbonCalculator(FactorRegistry()), chunk_size=chunk_size)
+    start = time.perf_counter()
+    lines = stored_history(recomputer, records)
+    print(f'records={records}  stored history built in {time.perf_counter() - start:.1f} s')
+    
+    versions = {'builtin': None, '2024H2': {'valid_from': VALID_FROM, 'factors': {'electricity_taiwan': factor}}}
+    timeline = recomputer.timeline(versions)
+    valid_from = recomputer.parse_time(VALID_FROM)
+    
+    recompute_run = RecomputeRun()
+    changed = []
+    start = time.perf_counter()
+    for changes in recomputer.iter_changes(lines, timeline, run=recompute_run):
+        changed.extend(change['index'] for change in changes)
+    elapsed = time.perf_counter() - start
+    
+    # 預期改變：新係數生效後、用電量不為 0 的能源記錄
+    expected = []
+    for index, line in enumerate(lines):
+        record = json.loads(line)
+        if record['type'] == 'energy' and record.get('timestamp', 0) >= valid_from \
+                and round(record['consumption'] / 1000 * factor, 3) != record['carbon_footprint']:
+            expected.append(index)
+    assert sorted(changed) == expected, (len(changed), len(expected))
+    
+    print(f'recompute  {elapsed:8.2f} s  {records / elapsed:10.0f} records/s   changed {len(changed)} '
+          f'(invalid {sum(recompute_run.error_counts.values())})   10M records ≈ {1e7 / records * elapsed / 60:.1f} min')
+    for name, stage in recompute_run.stages.items():
+        print(f'  {name:<10} {stage.seconds:8.2f} s  {stage.to_dict()["records_per_second"] or 0:10.0f} records/s')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='歷史碳足跡重新計算效能測試')
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    parser.add_argument('--factor', type=float, default=0.494, help='新的 electricity_taiwan 係數')
+    args = parser.parse_args()
+    run(args.records, args.chunk_size, args.factor)
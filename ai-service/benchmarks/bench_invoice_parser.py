@@ -0,0 +1,98 @@
+"""發票解析效能測試
+
+以合成的台灣收據語料比較舊版逐一 re.search 的解析方式與 InvoiceParser 單次掃描解析，
+並確認兩者結果一致。
+
+使用方式:
+    python benchmarks/bench_invoice_parser.py
+    python benchmarks/bench_invoice_parser.py --receipts 2000 --max-items 400
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import generate_receipt_corpus
+from services.invoice_parser import InvoiceParser
+
+def legacy_parse_invoice_data(text: str) -> dict:
+    """舊版 parse_invoice_data 的解析邏輯（僅供比較；連鎖店名樣式補上擷取群組）"""
+    invoice_data = {'store_name': '', 'total_amount': 0.0, 'date': '', 'items': [], 'confidence': 0.0}
+    
+    store_patterns = [
+        r'([^\n]+(?:商店|超市|便利商店|百貨|商場|市場|店))',
+        r'([^\n]+(?:Store|Market|Shop|Mall))',
+        r'(統一超商|7-ELEVEN|全家|萊爾富|OK超商)',
+        r'(家樂福|大潤發|愛買|全聯|頂好)'
+    ]
+    for pattern in store_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            invoice_data['store_name'] = match.group(1).strip()
+            break
+    
+    amount_patterns = [
+        r'總計[：:]\s*(\d+(?:\.\d{2})?)',
+        r'合計[：:]\s*(\d+(?:\.\d{2})?)',
+        r'總額[：:]\s*(\d+(?:\.\d{2})?)',
+        r'Total[：:]\s*(\d+(?:\.\d{2})?)',
+        r'NT\$\s*(\d+(?:\.\d{2})?)',
+        r'\$\s*(\d+(?:\.\d{2})?)'
+    ]
+    for pattern in amount_patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            invoice_data['total_amount'] = float(match.group(1))
+            break
+    
+    date_patterns = [
+        r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
+        r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})',
+        r'(\d{4}年\d{1,2}月\d{1,2}日)'
+    ]
+    for pattern in date_patterns:
+        match = re.search(pattern, text)
+        if match:
+            invoice_data['date'] = match.group(1)
+            break
+    
+    items = []
+    for line in text.split('\n'):
+        line = line.strip()
+        price_match = re.search(r'(\d+(?:\.\d{2})?)', line)
+        if price_match and len(line) > 5:
+            item_name = re.sub(r'\d+(?:\.\d{2})?', '', line).strip()
+            if item_name and len(item_name) > 1:
+                items.append({'name': item_name, 'price': float(price_match.group(1)), 'quantity': 1})
+    invoice_data['items'] = items[:10]
+    
+    return invoice_data
+
+def run(receipts: int, max_items: int, repeat: int):
+    corpus = generate_receipt_corpus(receipts, max_items=max_items)
+    parser = InvoiceParser()
+    total_chars = sum(len(text) for text in corpus)
+    print(f'receipts={receipts} max_items={max_items} chars={total_chars}')
+    
+    mismatches = sum(1 for text in corpus if legacy_parse_invoice_data(text) != parser.parse(text))
+    print(f'mismatches: {mismatches}')
+    
+    for name, parse in [('legacy', legacy_parse_invoice_data), ('single-pass', parser.parse)]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in corpus:
+                parse(text)
+            best = min(best, time.perf_counter() - start)
+        print(f'{name:<12} {best:8.3f}s  {receipts / best:10.0f} receipts/s  {total_chars / best / 1e6:6.1f} MB/s')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='發票解析效能測試')
+    parser.add_argument('--receipts', type=int, default=1000)
+    parser.add_argument('--max-items', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.receipts, args.max_items, args.repeat)
@@ -0,0 +1,83 @@
+"""移動軌跡分析效能測試
+
+以合成的一天 GPS 軌跡（含步行、公車、自行車、開車與停留）測量 MovementAnalyzer 的處理時間
+（未壓縮與串流壓縮後分析）與壓縮率，
+並列出偵測到的段落與交通方式，方便與軌跡的實際交通方式對照。
+
+使用方式:
+    python benchmarks/bench_movement_analyzer.py
+    python benchmarks/bench_movement_analyzer.py --points 1000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import generate_gps_trace
+from services.movement_analyzer import GPSTrace, MovementAnalyzer, format_timestamp, parse_timestamps
+from services.trajectory_compactor import CompactTrace
+
+def check_multi_week(points: int, weeks: int = 3, gap_days: float = 30.0):
+    """跨多週的軌跡：相鄰兩點相隔超過 int32 毫秒（約 24.8 天）時仍須能壓縮、序列化與還原"""
+    day = generate_gps_trace(points)
+    data = {key: np.concatenate([day[key] + (week * gap_days * 86400 if key == 'timestamp' else 0)
+                                 for week in range(weeks)])
+            for key in ('latitude', 'longitude', 'timestamp', 'accuracy')}
+    
+    result = MovementAnalyzer().analyze_stream(GPSTrace.iter_chunks(data, 10000), include_compact=True)
+    decoded = CompactTrace.from_dict(result['compact_trace']).decode()
+    span = (decoded['timestamp'][-1] - decoded['timestamp'][0]) / 86400
+    expected = (data['timestamp'][-1] - data['timestamp'][0]) / 86400
+    assert abs(span - expected) < 1e-6, f'跨週軌跡還原後的時間範圍不符: {span} != {expected}'
+    print(f'multi-week: {weeks} days {gap_days:g} days apart, {result["compaction"]["output_points"]} points, '
+          f'{span:.1f} days restored')
+
+def run(points: int, repeat: int):
+    data = generate_gps_trace(points)
+    analyzer = MovementAnalyzer()
+    trace = GPSTrace(data['latitude'], data['longitude'], data['timestamp'], data['accuracy'])
+    
+    raw_analyzer = MovementAnalyzer(compact_tolerance=None)
+    for name, analyze in [('raw arrays', lambda: raw_analyzer.analyze_trace(trace)),
+                          ('streamed+compacted', lambda: analyzer.analyze_stream(GPSTrace.iter_chunks(data, 10000)))]:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = analyze()
+            best = min(best, time.perf_counter() - start)
+        print(f'points={points}  {name:<20} {best * 1000:8.1f} ms  ({points / best / 1e6:.1f} M points/s)')
+    
+    compaction = result['compaction']
+    print(f'compaction: {compaction["output_points"]} points (x{compaction["ratio"]}), '
+          f'{compaction["encoded_bytes"] / 1e3:.1f} kB vs {points * 4 * 8 / 1e3:.1f} kB float64 columns')
+    check_multi_week(min(points, 20000))
+    
+    # API 請求格式：點列表與 ISO 8601 時間字串
+    payload = {'points': [
+        {'latitude': lat, 'longitude': lon, 'timestamp': format_timestamp(ts), 'accuracy': acc}
+        for lat, lon, ts, acc in zip(data['latitude'].tolist(), data['longitude'].tolist(),
+                                     data['timestamp'].tolist(), data['accuracy'].tolist())
+    ]}
+    start = time.perf_counter()
+    analyzer.analyze_patterns(payload)
+    print(f'points={points}  {"JSON points":<20} {(time.perf_counter() - start) * 1000:8.1f} ms')
+    
+    print(f'\n{"detected":<18}{"actual":<18}{"start":<12}{"km":>8}{"min":>8}{"km/h":>8}')
+    for segment in result['segments']:
+        # 段落中點的實際交通方式
+        middle = parse_timestamps([segment['start_time']])[0] + segment['duration'] * 30
+        actual = data['mode'][min(np.searchsorted(data['timestamp'], middle), points - 1)]
+        print(f'{segment["type"]:<18}{actual:<18}{segment["start_time"][11:19]:<12}'
+              f'{segment["distance"]:8.2f}{segment["duration"]:8.1f}{segment["average_speed"]:8.1f}')
+    print(f'stops: {len(result["stops"])}  total distance: {result["total_distance"]} km')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='移動軌跡分析效能測試')
+    parser.add_argument('--points', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.points, args.repeat)
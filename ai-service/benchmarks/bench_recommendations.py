@@ -0,0 +1,65 @@
+"""環保建議效能測試
+
+測量 RecommendationEngine 在快取命中、未命中（每次不同用戶）時的單次延遲，
+以及以矩陣一次為多位用戶計算所有候選行動的減碳量。
+
+使用方式:
+    python benchmarks/bench_recommendations.py
+    python benchmarks/bench_recommendations.py --users 100000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from services.recommendation_engine import RecommendationEngine
+
+def generate_profiles(users: int, seed: int = 42):
+    """產生各用戶的類別排放分布（kg CO2）"""
+    rng = np.random.default_rng(seed)
+    amounts = rng.gamma(2.0, 2.0, size=(users, 4))
+    return [
+        {
+            'user_id': f'user-{i}',
+            'carbon_data': {
+                'breakdown': {'transportation': a[0], 'shopping': a[1], 'food': a[2], 'energy': a[3]}
+            }
+        }
+        for i, a in enumerate(amounts.round(2).tolist())
+    ]
+
+def run(users: int, repeat: int):
+    engine = RecommendationEngine(max_entries=users)
+    profiles = generate_profiles(users)
+    print(f'users={users} candidates={len(engine.candidates)} activities={len(engine.activities)}')
+    
+    start = time.perf_counter()
+    for profile in profiles:
+        engine.generate_recommendations(profile)
+    cold = time.perf_counter() - start
+    
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for profile in profiles:
+            engine.generate_recommendations(profile)
+        best = min(best, time.perf_counter() - start)
+    print(f'miss   {cold / users * 1e6:8.1f} us/request')
+    print(f'hit    {best / users * 1e6:8.1f} us/request   {engine.stats()}')
+    
+    exposure = np.vstack([engine.exposure(profile)[0] for profile in profiles])
+    start = time.perf_counter()
+    saving, _ = engine.score(exposure)
+    elapsed = time.perf_counter() - start
+    print(f'matrix {elapsed / users * 1e6:8.3f} us/user   ({saving.shape[0]} x {saving.shape[1]})')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='環保建議效能測試')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.users, args.repeat)
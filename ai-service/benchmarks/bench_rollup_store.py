@@ -0,0 +1,78 @@
+"""用戶彙總效能測試
+
+以合成的多用戶歷史記錄建立日、週、月彙總，比較趨勢、排行榜查詢讀取彙總與每次掃描原始活動
+（DataProcessor 重新計算）的耗時，並確認兩者的每月碳排放一致。
+
+使用方式:
+    python benchmarks/bench_rollup_store.py
+    python benchmarks/bench_rollup_store.py --records 1000000 --users 1000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import iter_history_export
+from services.data_processor import DataProcessor
+from services.rollup_store import RollupStore
+
+def timed(function, repeat: int = 1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - start) / repeat
+
+def run(records: int, users: int, queries: int):
+    rng = random.Random(7)
+    history = []
+    for line in iter_history_export(records):
+        record = json.loads(line)
+        record['user_id'] = f'user_{rng.randrange(users)}'
+        history.append(record)
+    by_user = {}
+    for record in history:
+        by_user.setdefault(record['user_id'], []).append(record)
+    
+    store = RollupStore(chunk_size=20000)
+    _, elapsed = timed(lambda: store.ingest(history))
+    print(f'ingest {records} records ({users} users)  {elapsed:8.2f} s  {records / elapsed:10.0f} records/s')
+    
+    # 增量新增一筆活動
+    new = dict(history[0], timestamp='2024-12-31T12:00:00+08:00')
+    _, elapsed = timed(lambda: store.ingest([new]), queries)
+    print(f'incremental insert (1 record)          {elapsed * 1000:8.3f} ms')
+    store.ingest([new] * queries, remove=True)
+    
+    processor = DataProcessor(chunk_size=20000)
+    user_ids = [f'user_{i}' for i in range(min(users, queries))]
+    scanned, scan_time = timed(lambda: [processor.process_data(by_user.get(user_id, [])) for user_id in user_ids])
+    rolled, rollup_time = timed(lambda: [store.trends(user_id, group_by='month') for user_id in user_ids])
+    for raw, trend in zip(scanned, rolled):
+        assert [item['month'] for item in raw['monthly']] == [item['period'] for item in trend]
+        # 彙總以每筆活動四捨五入後的碳排放累加
+        assert all(abs(item['emission'] - period['total_emission']) < 0.001 * item['count'] + 1e-6
+                   for item, period in zip(raw['monthly'], trend))
+    print(f'monthly trend per user   scan {scan_time / len(user_ids) * 1000:8.2f} ms   '
+          f'rollup {rollup_time / len(user_ids) * 1000:8.3f} ms   ({scan_time / rollup_time:.0f}x)')
+    
+    _, elapsed = timed(lambda: store.trends(user_ids[0], '2024-02-10', '2024-11-20', 'week'), queries)
+    print(f'weekly trend (partial range)           {elapsed * 1000:8.3f} ms')
+    _, elapsed = timed(lambda: store.comparison(user_ids[0], '2024-06-01', '2024-06-30'), 10)
+    print(f'comparison (all users)                 {elapsed * 1000:8.2f} ms')
+    _, scan_time = timed(lambda: processor.process_data(history))
+    _, elapsed = timed(lambda: store.leaderboard('2024-01-15', '2024-12-15', limit=10), 10)
+    print(f'leaderboard              scan {scan_time * 1000:8.1f} ms   rollup {elapsed * 1000:8.2f} ms')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='用戶彙總效能測試')
+    parser.add_argument('--records', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=100)
+    args = parser.parse_args()
+    run(args.records, args.users, args.queries)
@@ -0,0 +1,123 @@
+"""空間索引效能測試
+
+以合成的全市 GPS 點比較逐點比對（O(n²)）的半徑查詢與 DBSCAN 和 SpatialIndex，
+並確認半徑查詢結果一致、聚類的核心點一致且群集對應。
+
+使用方式:
+    python benchmarks/bench_spatial_index.py
+    python benchmarks/bench_spatial_index.py --naive-points 10000 --points 2000000
+"""
+import argparse
+import os
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import generate_city_points
+from services.spatial_index import NOISE, SpatialIndex, haversine_m
+
+def naive_query_radius(latitude, longitude, lat, lon, radius):
+    """逐點計算距離的半徑查詢"""
+    distance = haversine_m(lat, lon, latitude, longitude)
+    return np.flatnonzero(distance <= radius)
+
+def naive_dbscan(latitude, longitude, eps, min_points):
+    """逐點比對所有點的 DBSCAN（僅供比較），回傳 (群集編號, 核心點遮罩)"""
+    n = len(latitude)
+    neighbors = [naive_query_radius(latitude, longitude, latitude[i], longitude[i], eps) for i in range(n)]
+    core = np.array([len(found) >= min_points for found in neighbors])
+    labels = np.full(n, NOISE)
+    cluster = 0
+    for i in range(n):
+        if not core[i] or labels[i] != NOISE:
+            continue
+        labels[i] = cluster
+        queue = deque([i])
+        while queue:
+            point = queue.popleft()
+            for neighbor in neighbors[point]:
+                if labels[neighbor] == NOISE:
+                    labels[neighbor] = cluster
+                    if core[neighbor]:
+                        queue.append(neighbor)
+        cluster += 1
+    return labels, core
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def compare_clusters(expected, actual, core):
+    """以核心點比較兩組群集：回傳 (被切開的 DBSCAN 群集數, 被合併的 DBSCAN 群集數)"""
+    pairs = np.unique(np.column_stack((expected[core], actual[core])), axis=0)
+    _, per_expected = np.unique(pairs[:, 0], return_counts=True)
+    _, per_actual = np.unique(pairs[:, 1], return_counts=True)
+    return int((per_expected > 1).sum()), int((per_actual - 1).sum())
+
+def run(points: int, naive_points: int, eps: float, min_points: int, queries: int, radius: float):
+    # 與逐點比對版本比較（少量點）
+    data = generate_city_points(naive_points, extent_km=5.0)
+    latitude, longitude = data['latitude'], data['longitude']
+    index = SpatialIndex(cell_size=radius)
+    index.insert(latitude, longitude)
+    rng = np.random.default_rng(0)
+    sample = rng.integers(0, naive_points, queries)
+    
+    _, naive_time = timed(lambda: [naive_query_radius(latitude, longitude, latitude[i], longitude[i], radius)
+                                   for i in sample])
+    _, index_time = timed(lambda: [index.query_radius(latitude[i], longitude[i], radius) for i in sample])
+    mismatches = sum(
+        not np.array_equal(np.sort(index.query_radius(latitude[i], longitude[i], radius)),
+                           naive_query_radius(latitude, longitude, latitude[i], longitude[i], radius))
+        for i in sample
+    )
+    print(f'points={naive_points} queries={queries} radius={radius}m')
+    print(f'  query_radius  naive {naive_time * 1000 / queries:8.3f} ms/query   '
+          f'index {index_time * 1000 / queries:8.3f} ms/query   mismatches={mismatches}')
+    
+    (expected, expected_core), naive_time = timed(naive_dbscan, latitude, longitude, eps, min_points)
+    labels, index_time = timed(index.cluster, eps, min_points)
+    actual_core = labels != NOISE
+    split, merged = compare_clusters(expected, labels, expected_core)
+    print(f'  dbscan        naive {naive_time:8.3f} s          index {index_time:8.3f} s   '
+          f'clusters {expected.max() + 1} / {labels.max() + 1}  split={split} merged={merged} '
+          f'noise {int((expected == NOISE).sum())} / {int((labels == NOISE).sum())}')
+    assert actual_core[expected_core].all()
+    
+    # 大量點：分批插入、半徑查詢、熱力圖與聚類
+    data = generate_city_points(points)
+    latitude, longitude = data['latitude'], data['longitude']
+    index = SpatialIndex(cell_size=radius)
+    start = time.perf_counter()
+    for i in range(0, points, 100_000):
+        index.insert(latitude[i:i + 100_000], longitude[i:i + 100_000])
+    index.query_radius(latitude[0], longitude[0], radius)
+    build_time = time.perf_counter() - start
+    sample = rng.integers(0, points, queries)
+    _, naive_time = timed(lambda: [naive_query_radius(latitude, longitude, latitude[i], longitude[i], radius)
+                                   for i in sample])
+    _, query_time = timed(lambda: [index.query_radius(latitude[i], longitude[i], radius) for i in sample])
+    heatmap, heatmap_time = timed(index.heatmap, 500.0)
+    labels, cluster_time = timed(index.cluster, eps, min_points)
+    print(f'points={points}')
+    print(f'  query_radius  naive {naive_time * 1000 / queries:8.3f} ms/query   '
+          f'index {query_time * 1000 / queries:8.3f} ms/query')
+    print(f'  insert+index {build_time:8.3f} s   '
+          f'heatmap(500m) {heatmap_time:8.3f} s ({len(heatmap["count"])} cells)   '
+          f'dbscan {cluster_time:8.3f} s ({labels.max() + 1} clusters, {(labels == NOISE).mean():.1%} noise)')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='空間索引效能測試')
+    parser.add_argument('--points', type=int, default=1_000_000)
+    parser.add_argument('--naive-points', type=int, default=5000)
+    parser.add_argument('--eps', type=float, default=50.0)
+    parser.add_argument('--min-points', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--radius', type=float, default=200.0)
+    args = parser.parse_args()
+    run(args.points, args.naive_points, args.eps, args.min_points, args.queries, args.radius)
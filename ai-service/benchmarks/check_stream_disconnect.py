@@ -0,0 +1,95 @@
+"""串流端點在用戶端中斷時釋放並行名額的檢查
+
+直接以 ASGI 介面呼叫 asgi_app：send 在送出回應標頭（或第一段內容）時拋出 OSError，模擬用戶端
+在收到任何內容前中斷。每次中斷後端點的 in_flight 必須回到 0，之後的請求仍可在時限內完成。
+
+使用方式:
+    python benchmarks/check_stream_disconnect.py
+    python benchmarks/check_stream_disconnect.py --requests 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+os.environ.setdefault('ROLE', 'calc')
+
+import asgi_app
+
+RECORD = {'type': 'electricity', 'consumption': 10, 'timestamp': '2024-03-01T10:00:00Z', 'carbon_footprint': 5.0}
+
+# 端點: (路徑, Content-Type, 請求內容)
+ENDPOINTS = {
+    'carbon_batch': ('/api/carbon/calculate/batch', 'application/json', json.dumps({'activities': [RECORD]}).encode()),
+    'recompute': ('/api/carbon/recompute', 'application/x-ndjson', json.dumps(RECORD).encode() + b'\n')
+}
+
+async def call(path: str, content_type: str, body: bytes, disconnect_on=None):
+    """送出請求；disconnect_on 為 ASGI 訊息類型時，送出該訊息時拋出 OSError"""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 80)
+    }
+    received = False
+    status = None
+    
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        await asyncio.Event().wait()
+    
+    async def send(message):
+        nonlocal status
+        if message['type'] == disconnect_on:
+            raise OSError('用戶端已中斷')
+        if message['type'] == 'http.response.start':
+            status = message['status']
+    
+    try:
+        await asgi_app.app(scope, receive, send)
+    except OSError:
+        pass
+    return status
+
+async def check(name: str, requests: int, timeout: float) -> bool:
+    request = ENDPOINTS[name]
+    limiter = asgi_app.limiters[name]
+    ok = True
+    for disconnect_on in ('http.response.start', 'http.response.body'):
+        try:
+            for _ in range(requests):
+                await asyncio.wait_for(call(*request, disconnect_on), timeout)
+        except asyncio.TimeoutError:
+            print(f'{name}: 中斷於 {disconnect_on} 後的請求在 {timeout}s 內未取得並行名額（in_flight={limiter.in_flight}）')
+            return False
+        if limiter.in_flight != 0:
+            print(f'{name}: 中斷於 {disconnect_on} 後 in_flight={limiter.in_flight}（應為 0）')
+            ok = False
+    try:
+        status = await asyncio.wait_for(call(*request), timeout)
+    except asyncio.TimeoutError:
+        print(f'{name}: 中斷後的請求在 {timeout}s 內未取得並行名額')
+        return False
+    print(f'{name}: {2 * requests} 次中斷後 in_flight={limiter.in_flight}, completed={limiter.completed}, '
+          f'下一個請求 {status}')
+    return ok and status == 200
+
+async def main(args) -> bool:
+    results = [await check(name, args.requests, args.timeout) for name in ENDPOINTS]
+    return all(results)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='串流端點在用戶端中斷時釋放並行名額的檢查')
+    parser.add_argument('--requests', type=int, default=3, help='每種中斷時機的請求數')
+    parser.add_argument('--timeout', type=float, default=5.0)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args)) else 1)
@@ -0,0 +1,218 @@
+"""效能測試用的合成資料（以固定種子產生，結果可重現）"""
+import json
+import random
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+STORES = ['全聯福利中心', '統一超商', '7-ELEVEN', '全家便利商店', '家樂福', '好市多商店', 'Jason Market', '頂好超市']
+PRODUCTS = ['有機蔬菜', '鮮奶', '雞蛋10入', '台灣豬肉片', '進口牛排', '鮭魚切片', '白米 2kg', '全麥麵包',
+            '香蕉', '豆腐', '洗衣精', '衛生紙', '礦泉水', '綠茶', '咖啡豆', '優格', '雞胸肉', '蘋果']
+TOTAL_LABELS = ['總計', '合計', '總額', 'Total']
+
+def generate_receipt_text(rng: random.Random, n_items: int = 20) -> str:
+    """產生一張台灣收據的 OCR 文字"""
+    lines = [rng.choice(STORES)]
+    lines.append(f'統一編號 {rng.randint(10000000, 99999999)}')
+    year = rng.choice([2023, 2024, 2025])
+    month, day = rng.randint(1, 12), rng.randint(1, 28)
+    if rng.random() < 0.7:
+        lines.append(f'{year}-{month:02d}-{day:02d} {rng.randint(8, 22):02d}:{rng.randint(0, 59):02d}')
+    else:
+        lines.append(f'{year}年{month}月{day}日')
+    
+    total = 0
+    for _ in range(n_items):
+        price = rng.randint(10, 999)
+        quantity = rng.randint(1, 3)
+        total += price * quantity
+        lines.append(f'{rng.choice(PRODUCTS)} x{quantity} {price * quantity}')
+    
+    label = rng.choice(TOTAL_LABELS)
+    if rng.random() < 0.1:
+        lines.append(f'{label}:')
+        lines.append(f'  {total}')
+    else:
+        lines.append(f'{label}: {total}')
+    lines.append(f'現金 NT$ {total + rng.randint(0, 100)}')
+    lines.append('謝謝光臨')
+    return '\n'.join(lines)
+
+def generate_receipt_corpus(size: int, seed: int = 42, min_items: int = 5, max_items: int = 200) -> List[str]:
+    """產生收據文字語料（包含多頁長收據）"""
+    rng = random.Random(seed)
+    return [generate_receipt_text(rng, rng.randint(min_items, max_items)) for _ in range(size)]
+
+# (交通方式, 速度 km/h, 持續分鐘, 每分鐘停靠秒數)；速度 0 為停留
+DAY_SCHEDULE = [
+    ('stop', 0, 420, 0), ('walking', 5, 12, 0), ('public_transport', 30, 35, 15), ('walking', 5, 8, 0),
+    ('stop', 0, 240, 0), ('cycling', 16, 20, 0), ('stop', 0, 60, 0), ('cycling', 16, 20, 0),
+    ('stop', 0, 180, 0), ('driving', 45, 40, 0), ('stop', 0, 120, 0), ('driving', 45, 40, 0), ('stop', 0, 245, 0)
+]
+
+def generate_gps_trace(points: int = 100_000, seed: int = 42, start: float = 1704067200.0,
+                       jitter_m: float = 5.0) -> Dict[str, np.ndarray]:
+    """產生一天的欄位式 GPS 軌跡（依 DAY_SCHEDULE 移動，含定位雜訊）
+    
+    回傳 {'latitude', 'longitude', 'timestamp', 'accuracy', 'mode'}；mode 為每個點所屬的交通方式，
+    供驗證交通方式推斷使用。
+    """
+    rng = np.random.default_rng(seed)
+    total_minutes = sum(minutes for _, _, minutes, _ in DAY_SCHEDULE)
+    interval = total_minutes * 60 / points
+    
+    timestamps = start + np.arange(points) * interval
+    speeds = np.zeros(points)
+    modes = np.empty(points, dtype=object)
+    boundary = start
+    for mode, speed, minutes, dwell in DAY_SCHEDULE:
+        selected = (timestamps >= boundary) & (timestamps < boundary + minutes * 60)
+        modes[selected] = mode
+        speeds[selected] = speed
+        if dwell:
+            # 每分鐘前 dwell 秒停靠站點
+            seconds = (timestamps[selected] - boundary) % 60
+            speeds[np.flatnonzero(selected)[seconds < dwell]] = 0
+        boundary += minutes * 60
+    
+    heading = np.cumsum(rng.normal(0, 0.02, points))
+    step_km = speeds * interval / 3600
+    north_km = np.cumsum(step_km * np.cos(heading))
+    east_km = np.cumsum(step_km * np.sin(heading))
+    north_km += rng.normal(0, jitter_m / 1000, points)
+    east_km += rng.normal(0, jitter_m / 1000, points)
+    
+    base_lat, base_lon = 25.0330, 121.5654
+    latitude = base_lat + north_km / 111.32
+    longitude = base_lon + east_km / (111.32 * np.cos(np.radians(base_lat)))
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'timestamp': timestamps,
+        'accuracy': np.full(points, jitter_m * 2),
+        'mode': modes
+    }
+
+def generate_city_points(points: int = 1_000_000, seed: int = 42, hotspots: int = 200,
+                         hotspot_share: float = 0.7, extent_km: float = 20.0) -> Dict[str, np.ndarray]:
+    """產生全市範圍的 GPS 點（以台北為中心）
+    
+    hotspot_share 比例的點集中在 hotspots 個熱點（住家、辦公室、車站等，半徑數十公尺），
+    其餘均勻分布在 extent_km 見方的範圍內。回傳 {'latitude', 'longitude', 'hotspot'}，
+    hotspot 為各點所屬熱點編號（背景點為 -1）。
+    """
+    rng = np.random.default_rng(seed)
+    base_lat, base_lon = 25.0330, 121.5654
+    km_per_lon = 111.32 * np.cos(np.radians(base_lat))
+    
+    centers = rng.uniform(-extent_km / 2, extent_km / 2, size=(hotspots, 2))
+    spread_km = rng.uniform(0.01, 0.06, size=hotspots)
+    popularity = rng.pareto(1.5, size=hotspots) + 1
+    
+    clustered = int(points * hotspot_share)
+    hotspot = np.full(points, -1)
+    hotspot[:clustered] = rng.choice(hotspots, size=clustered, p=popularity / popularity.sum())
+    north_km = rng.uniform(-extent_km / 2, extent_km / 2, size=points)
+    east_km = rng.uniform(-extent_km / 2, extent_km / 2, size=points)
+    selected = hotspot[:clustered]
+    north_km[:clustered] = centers[selected, 0] + rng.normal(0, 1, clustered) * spread_km[selected]
+    east_km[:clustered] = centers[selected, 1] + rng.normal(0, 1, clustered) * spread_km[selected]
+    
+    shuffle = rng.permutation(points)
+    return {
+        'latitude': base_lat + north_km[shuffle] / 111.32,
+        'longitude': base_lon + east_km[shuffle] / km_per_lon,
+        'hotspot': hotspot[shuffle]
+    }
+
+def iter_history_export(records: int = 1_000_000, seed: int = 42, start: float = 1704067200.0,
+                        days: int = 365, invalid_share: float = 0.001):
+    """逐行產生完整歷史匯出（NDJSON bytes），不一次建立全部記錄
+    
+    包含交通（後端移動記錄格式與 transportation 記錄）、能源、飲食與購物記錄，
+    invalid_share 比例的行為無效資料。
+    """
+    rng = random.Random(seed)
+    transport_types = ['walking', 'cycling', 'driving', 'public_transport', 'flying']
+    for _ in range(records):
+        timestamp = start + rng.random() * days * 86400
+        kind = rng.random()
+        if rng.random() < invalid_share:
+            record = {'type': 'driving', 'distance': -1, 'timestamp': timestamp}
+        elif kind < 0.5:
+            record = {
+                'type': rng.choice(transport_types),
+                'distance': round(rng.uniform(0.2, 30), 2),
+                'startLocation': {'timestamp': int(timestamp * 1000)},
+                'metadata': {'fuelType': rng.choice(['gasoline', 'diesel', 'electric']), 'passengers': rng.randint(1, 4)}
+            }
+        elif kind < 0.6:
+            record = {'type': 'transportation', 'transport_type': 'public_transport', 'mode': 'metro',
+                      'distance': rng.randint(500, 20000), 'unit': 'm', 'timestamp': timestamp}
+        elif kind < 0.75:
+            record = {'type': 'energy', 'consumption': rng.randint(100, 5000), 'unit': 'Wh', 'timestamp': timestamp}
+        elif kind < 0.9:
+            record = {'type': 'food', 'timestamp': timestamp,
+                      'items': [{'type': rng.choice(['beef', 'pork', 'chicken', 'vegetables']),
+                                 'weight': rng.randint(100, 800), 'unit': 'g'}]}
+        else:
+            record = {'type': 'shopping', 'total_amount': rng.randint(50, 3000), 'timestamp': timestamp}
+        yield json.dumps(record).encode('utf-8') + b'\n'
+
+def generate_receipt_image(text: str, seed: int = 42, width: int = 1200, height: int = 1600) -> bytes:
+    """將收據文字繪製成帶有紙張雜訊的手機照片 JPEG
+    
+    OpenCV 無法繪製中文，非 ASCII 字元以 # 代替；影像只供解碼與預處理使用，
+    文字內容由測試用的 OCR 引擎替身回傳。
+    """
+    rng = np.random.default_rng(seed)
+    image = rng.integers(150, 230, size=(height, width, 3), dtype=np.uint8)
+    lines = text.split('\n')
+    scale = min(1.0, height / (len(lines) + 2) / 30)
+    for row, line in enumerate(lines):
+        y = int((row + 1) * height / (len(lines) + 2))
+        ascii_line = ''.join(c if ord(c) < 128 else '#' for c in line)
+        cv2.putText(image, ascii_line, (int(width * 0.08), y), cv2.FONT_HERSHEY_SIMPLEX, scale,
+                    (20, 20, 20), max(1, int(scale * 2)))
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return encoded.tobytes()
+
+FOOD_TYPES = ['beef', 'pork', 'chicken', 'fish', 'rice', 'vegetables', 'milk', 'eggs', 'tofu', 'fruit']
+SHOPPING_CATEGORIES = ['electronics', 'clothing', 'food', 'household', 'other']
+
+def generate_activity_records(size: int, seed: int = 42) -> List[Dict]:
+    """產生 calculate_footprint 格式的活動記錄（交通、購物、飲食、能源混合）"""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(size):
+        kind = rng.random()
+        if kind < 0.45:
+            record = {
+                'type': 'transportation',
+                'transport_type': rng.choice(['walking', 'cycling', 'driving', 'public_transport', 'flying']),
+                'distance': round(rng.uniform(0.5, 60), 2),
+                'passengers': rng.randint(1, 4),
+                'vehicle_type': rng.choice(['gasoline', 'diesel', 'electric', 'hybrid']),
+                'mode': rng.choice(['bus', 'metro', 'train'])
+            }
+            record['distance'] *= 20 if record['transport_type'] == 'flying' else 1
+        elif kind < 0.65:
+            items = [{'category': rng.choice(SHOPPING_CATEGORIES), 'price': rng.randint(20, 2000),
+                      'quantity': rng.randint(1, 3)} for _ in range(rng.randint(0, 8))]
+            record = {'type': 'shopping', 'total_amount': sum(i['price'] * i['quantity'] for i in items) or
+                      rng.randint(50, 3000), 'items': items}
+        elif kind < 0.9:
+            record = {'type': 'food', 'items': [{'type': rng.choice(FOOD_TYPES), 'weight': round(rng.uniform(0.1, 1.0), 2)}
+                                                for _ in range(rng.randint(1, 5))]}
+        else:
+            record = {'type': 'energy', 'consumption': round(rng.uniform(1, 30), 1)}
+        records.append(record)
+    return records
+
+def generate_carbon_records(size: int, seed: int = 42) -> List[Dict]:
+    """產生 generate_insights 格式的碳足跡記錄（type 與 carbon_footprint）"""
+    rng = random.Random(seed)
+    types = ['transportation', 'shopping', 'food', 'energy']
+    return [{'type': rng.choices(types, weights=[4, 2, 3, 1])[0], 'carbon_footprint': round(rng.lognormvariate(0.5, 1.0), 3)}
+            for _ in range(size)]
@@ -0,0 +1,89 @@
+"""服務啟動的匯入時間與記憶體報告
+
+在獨立的子行程中以 python -X importtime 匯入 app（或 asgi_app），依 ROLE 比較啟動時間、
+常駐記憶體峰值與已載入的重量級套件，並列出累計匯入時間最長的模組。
+
+使用方式:
+    python benchmarks/import_report.py
+    python benchmarks/import_report.py --module asgi_app --roles calc all --top 25
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# 計算用副本不應載入的套件
+HEAVY_MODULES = ['cv2', 'PIL', 'pytesseract', 'easyocr', 'torch', 'tensorflow', 'transformers',
+                 'google.cloud.vision', 'pandas', 'sklearn', 'matplotlib']
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{'seconds': seconds, 'max_rss_kb': rss, 'modules': len(sys.modules), 'heavy': heavy}}))
+"""
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """解析 -X importtime 輸出，回傳 (模組, 自身微秒, 累計微秒, 巢狀深度)"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+def probe(module: str, role: str) -> Dict:
+    env = dict(os.environ, ROLE=role)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        cwd=SERVICE_DIR, env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f'ROLE={role} 匯入 {module} 失敗:\n{completed.stderr[-2000:]}')
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(completed.stderr)
+    return result
+
+def top_packages(imports: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    """依最上層套件彙總自身匯入時間（微秒）"""
+    totals: Dict[str, int] = {}
+    for name, self_us, _, _ in imports:
+        package = name.split('.')[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+def run(module: str, roles: List[str], top: int):
+    results = {role: probe(module, role) for role in roles}
+    
+    print(f"{'ROLE':<6} {'import (ms)':>12} {'max RSS (MB)':>13} {'modules':>8}  heavy modules")
+    for role, result in results.items():
+        print(f"{role:<6} {result['seconds'] * 1000:>12.1f} {result['max_rss_kb'] / 1024:>13.1f} "
+              f"{result['modules']:>8}  {', '.join(result['heavy']) or '-'}")
+    
+    for role, result in results.items():
+        print(f'\nROLE={role}: 累計匯入時間最長的直接匯入（ms）')
+        direct = sorted((row for row in result['imports'] if row[3] <= 1), key=lambda row: row[2], reverse=True)
+        for name, _, cumulative_us, _ in direct[:top]:
+            print(f'  {cumulative_us / 1000:>9.1f}  {name}')
+        print(f'ROLE={role}: 依套件彙總的匯入時間（ms）')
+        for package, self_us in list(top_packages(result['imports']).items())[:top]:
+            print(f'  {self_us / 1000:>9.1f}  {package}')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='服務啟動的匯入時間與記憶體報告')
+    parser.add_argument('--module', default='app', choices=['app', 'asgi_app'])
+    parser.add_argument('--roles', nargs='+', default=['calc', 'ocr', 'all'])
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+    run(args.module, args.roles, args.top)
@@ -0,0 +1,391 @@
+"""AI 服務壓力測試（容量規劃）
+
+以合成的請求組合（發票照片、單筆碳足跡計算、洞察）對 /api/ocr/process、
+/api/carbon/calculate、/api/insights/generate 施加負載，回報各端點的延遲分位數
+（p50/p95/p99）、吞吐量與每核心每秒請求數（requests per second per core）。
+
+負載模式:
+    封閉式（預設）: --concurrency 個用戶端連續送出請求
+    開放式: --rate 每秒平均請求數（Poisson 到達），延遲自預定送出時間起算，
+            用戶端來不及送出的排隊時間也計入（避免 coordinated omission）
+
+情境:
+    isolated（預設）: 依序單獨測試每個端點，得到各端點的每核心每秒請求數
+    mixed: 依 --mix 權重同時測試所有端點
+
+每核心每秒請求數 = 完成的請求數 / 伺服器行程使用的 CPU 秒數（以 --spawn 啟動或以 --server-pid
+指定時，由 /proc 讀取）；無法讀取時以 吞吐量 / --server-cores 估算（需在伺服器 CPU 飽和時才準確）。
+
+以 --spawn 啟動的服務使用 Google Vision 離線替身（GOOGLE_VISION_BACKEND=fake），延遲由
+--vision-latency-ms 與 --vision-jitter-ms 設定；未安裝 Tesseract、EasyOCR 時這些引擎直接回傳空白，
+OCR 的耗時為解碼、預處理、Vision 替身延遲與解析。
+
+使用方式:
+    python benchmarks/load_test.py --spawn flask --duration 20
+    python benchmarks/load_test.py --spawn asgi --concurrency 16 --vision-latency-ms 300 --vision-jitter-ms 100
+    python benchmarks/load_test.py --spawn asgi --scenario mixed --rate 40 --mix ocr=1,calculate=8,insights=2
+    python benchmarks/load_test.py --url http://10.0.0.5:5001 --server-cores 2 --output load.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchmarks.datasets import (
+    generate_activity_records, generate_carbon_records, generate_receipt_corpus, generate_receipt_image
+)
+
+SERVICE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+ENDPOINTS = {
+    'ocr': '/api/ocr/process',
+    'calculate': '/api/carbon/calculate',
+    'insights': '/api/insights/generate'
+}
+
+# (寬, 高, 權重)：手機直拍、橫拍與掃描的收據照片
+PHOTO_SIZES = [(1512, 2016, 3), (3024, 4032, 1), (1200, 1600, 2), (2480, 3508, 1)]
+
+# (方法, 路徑, 內容, Content-Type)
+Request = Tuple[str, str, bytes, str]
+
+def multipart_image(image_bytes: bytes, filename: str) -> Tuple[bytes, str]:
+    boundary = 'loadtest' + os.urandom(8).hex()
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+        f'Content-Type: image/jpeg\r\n\r\n'
+    ).encode('utf-8') + image_bytes + f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+def build_payloads(endpoints: List[str], seed: int, receipts: int) -> Dict[str, List[Request]]:
+    """以固定種子產生各端點的請求內容"""
+    rng = random.Random(seed)
+    payloads = {}
+    if 'calculate' in endpoints:
+        payloads['calculate'] = [
+            ('POST', ENDPOINTS['calculate'], json.dumps(activity).encode('utf-8'), 'application/json')
+            for activity in generate_activity_records(500, seed=seed)
+        ]
+    if 'insights' in endpoints:
+        requests = []
+        for i in range(100):
+            # 一週到一年的記錄；部分請求帶有用戶 ID 與偏好（個人化建議）
+            data = {'carbon_data': generate_carbon_records(rng.choice([7, 30, 90, 365]), seed=seed + i)}
+            if rng.random() < 0.5:
+                data['user_id'] = f'user-{rng.randint(1, 200)}'
+                data['user_preferences'] = {'limit': rng.choice([3, 5, 10])}
+            requests.append(('POST', ENDPOINTS['insights'], json.dumps(data).encode('utf-8'), 'application/json'))
+        payloads['insights'] = requests
+    if 'ocr' in endpoints:
+        requests = []
+        weights = [weight for _, _, weight in PHOTO_SIZES]
+        for i, text in enumerate(generate_receipt_corpus(receipts, seed=seed, min_items=3, max_items=40)):
+            width, height, _ = rng.choices(PHOTO_SIZES, weights=weights)[0]
+            image = generate_receipt_image(text, seed=seed + i, width=width, height=height)
+            body, content_type = multipart_image(image, f'receipt-{i}.jpg')
+            requests.append(('POST', ENDPOINTS['ocr'], body, content_type))
+        payloads['ocr'] = requests
+    return payloads
+
+class ProcessCPU:
+    """由 /proc 讀取行程（含已結束的子行程）累計使用的 CPU 秒數；非 Linux 時回傳 None"""
+    
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+    
+    def seconds(self) -> Optional[float]:
+        try:
+            with open(f'/proc/{self.pid}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+        except OSError:
+            return None
+        # utime, stime, cutime, cstime（第 14–17 欄）
+        return sum(int(value) for value in fields[11:15]) / self.ticks
+
+class Client:
+    """單一用戶端的 HTTP 連線（keep-alive，伺服器關閉連線時自動重新連線）"""
+    
+    def __init__(self, host: str, port: int, timeout: float):
+        self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    
+    def send(self, request: Request) -> int:
+        method, path, body, content_type = request
+        try:
+            self.connection.request(method, path, body=body, headers={'Content-Type': content_type})
+            response = self.connection.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            return 0
+    
+    def close(self):
+        self.connection.close()
+
+class LoadRun:
+    """一段負載測試；記錄每個請求的 (端點, 開始時間, 延遲秒數, 狀態碼)"""
+    
+    def __init__(self, url: str, payloads: Dict[str, List[Request]], mix: Dict[str, float], concurrency: int,
+                 rate: Optional[float], duration: float, warmup: float, seed: int,
+                 cpu: Optional[ProcessCPU] = None, timeout: float = 60.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.payloads = payloads
+        self.names = [name for name in mix if mix[name] > 0]
+        self.weights = [mix[name] for name in self.names]
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.warmup = warmup
+        self.seed = seed
+        self.timeout = timeout
+        self.cpu = cpu
+        self.cpu_start: Optional[float] = None
+        self.lock = threading.Lock()
+        self.records: List[Tuple[str, float, float, int]] = []
+        self.max_backlog = 0
+    
+    def pick(self, rng: random.Random) -> Tuple[str, Request]:
+        name = rng.choices(self.names, weights=self.weights)[0]
+        return name, rng.choice(self.payloads[name])
+    
+    def record(self, name: str, start: float, latency: float, status: int):
+        with self.lock:
+            self.records.append((name, start, latency, status))
+    
+    def closed_worker(self, index: int, deadline: float):
+        rng = random.Random(self.seed * 1000 + index)
+        client = Client(self.host, self.port, self.timeout)
+        while time.perf_counter() < deadline:
+            name, request = self.pick(rng)
+            start = time.perf_counter()
+            status = client.send(request)
+            self.record(name, start, time.perf_counter() - start, status)
+        client.close()
+    
+    def open_worker(self, index: int, arrivals: queue.Queue):
+        client = Client(self.host, self.port, self.timeout)
+        while True:
+            item = arrivals.get()
+            if item is None:
+                break
+            scheduled, name, request = item
+            status = client.send(request)
+            self.record(name, scheduled, time.perf_counter() - scheduled, status)
+        client.close()
+    
+    def run(self) -> Tuple[float, float]:
+        """執行負載，回傳量測區間 (開始, 結束)（perf_counter，不含暖機）；伺服器 CPU 秒數自暖機結束時計算"""
+        begin = time.perf_counter()
+        measure_start = begin + self.warmup
+        deadline = measure_start + self.duration
+        if self.rate is None:
+            workers = [threading.Thread(target=self.closed_worker, args=(i, deadline), daemon=True)
+                       for i in range(self.concurrency)]
+            for worker in workers:
+                worker.start()
+            time.sleep(max(0.0, measure_start - time.perf_counter()))
+            self.cpu_start = self.cpu.seconds() if self.cpu else None
+        else:
+            arrivals: queue.Queue = queue.Queue()
+            workers = [threading.Thread(target=self.open_worker, args=(i, arrivals), daemon=True)
+                       for i in range(self.concurrency)]
+            for worker in workers:
+                worker.start()
+            rng = random.Random(self.seed)
+            scheduled = begin
+            marked = False
+            while True:
+                scheduled += rng.expovariate(self.rate)
+                if scheduled >= deadline:
+                    break
+                if not marked and scheduled >= measure_start:
+                    time.sleep(max(0.0, measure_start - time.perf_counter()))
+                    self.cpu_start = self.cpu.seconds() if self.cpu else None
+                    marked = True
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                arrivals.put((scheduled, *self.pick(rng)))
+                self.max_backlog = max(self.max_backlog, arrivals.qsize())
+            for _ in workers:
+                arrivals.put(None)
+        for worker in workers:
+            worker.join()
+        return measure_start, max(deadline, time.perf_counter())
+    
+    def summary(self, window: Tuple[float, float], server_cores: int) -> Dict:
+        start, end = window
+        elapsed = end - start
+        cpu_end = self.cpu.seconds() if self.cpu else None
+        cpu_seconds = cpu_end - self.cpu_start if cpu_end is not None and self.cpu_start is not None else None
+        measured = [record for record in self.records if record[1] >= start]
+        
+        def percentile(latencies: np.ndarray, q: float) -> Optional[float]:
+            return round(float(np.percentile(latencies, q)) * 1000, 2) if len(latencies) else None
+        
+        def stats(rows) -> Dict:
+            latencies = np.array([latency for _, _, latency, status in rows if 200 <= status < 300])
+            ok = len(latencies)
+            throughput = ok / elapsed if elapsed > 0 else 0.0
+            return {
+                'requests': ok,
+                'errors': len(rows) - ok,
+                'throughput_rps': round(throughput, 2),
+                'rps_per_core': round(ok / cpu_seconds if cpu_seconds else throughput / server_cores, 2),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'mean_ms': round(float(latencies.mean()) * 1000, 2) if ok else None
+            }
+        
+        report = {name: stats([record for record in measured if record[0] == name]) for name in self.names}
+        if len(self.names) > 1:
+            # 混合情境的 CPU 無法分攤到各端點，每核心每秒請求數只對全部請求計算
+            for name in self.names:
+                report[name]['rps_per_core'] = None
+            report['total'] = stats(measured)
+        return {
+            'seconds': round(elapsed, 2),
+            'server_cpu_seconds': round(cpu_seconds, 2) if cpu_seconds is not None else None,
+            'max_client_backlog': self.max_backlog,
+            'endpoints': report
+        }
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'未知的端點 {name}（可用: {", ".join(ENDPOINTS)}）')
+        mix[name] = float(weight or 1)
+    return mix
+
+def spawn_server(kind: str, port: int, args) -> subprocess.Popen:
+    """啟動本機的 AI 服務（使用 Vision 離線替身）"""
+    env = dict(os.environ)
+    env.update({
+        'PORT': str(port),
+        'GOOGLE_VISION_BACKEND': 'fake',
+        'FAKE_VISION_LATENCY_MS': str(args.vision_latency_ms),
+        'FAKE_VISION_JITTER_MS': str(args.vision_jitter_ms)
+    })
+    if not args.ocr_cache:
+        # 實際上傳的照片幾乎不會重複，預設停用快取以量測完整的 OCR 流程
+        env['OCR_CACHE_MAX_MB'] = '0'
+    if kind == 'flask':
+        command = [sys.executable, 'app.py']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1', '--port', str(port),
+                   '--log-level', 'warning', '--no-access-log']
+    log = open(args.server_log, 'ab') if args.server_log else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=SERVICE_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def wait_ready(url: str, process: Optional[subprocess.Popen], timeout: float = 60.0):
+    parsed = urlparse(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'服務啟動失敗（結束碼 {process.returncode}）')
+        try:
+            connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=2)
+            connection.request('GET', '/health')
+            if connection.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'{url} 在 {timeout:.0f}s 內沒有回應')
+
+def print_report(phase: str, result: Dict):
+    cpu = result['server_cpu_seconds']
+    print(f"\n[{phase}] {result['seconds']}s, server CPU {cpu if cpu is not None else '-'}s, "
+          f"max client backlog {result['max_client_backlog']}")
+    print(f"{'endpoint':<10} {'ok':>7} {'err':>5} {'rps':>8} {'rps/core':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'p99 ms':>9} {'mean ms':>9}")
+    for name, stats in result['endpoints'].items():
+        cells = [stats[key] if stats[key] is not None else '-'
+                 for key in ('rps_per_core', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms')]
+        print(f"{name:<10} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+              + ' '.join(f'{cell:>9}' for cell in cells))
+
+def main(args):
+    mix = args.mix
+    process = None
+    url = args.url
+    if args.spawn:
+        url = f'http://127.0.0.1:{args.port}'
+        process = spawn_server(args.spawn, args.port, args)
+    try:
+        wait_ready(url, process)
+        pid = process.pid if process is not None else args.server_pid
+        cpu = ProcessCPU(pid) if pid else None
+        
+        print(f'產生請求內容（OCR 收據照片 {args.receipts} 張）...')
+        payloads = build_payloads(list(mix), args.seed, args.receipts)
+        
+        if args.scenario == 'isolated':
+            phases = [(name, {name: 1.0}) for name in mix]
+        else:
+            phases = [('mixed', mix)]
+        
+        load = f'rate {args.rate}/s' if args.rate else f'concurrency {args.concurrency}'
+        print(f'{url}  {load}  duration {args.duration}s (+{args.warmup}s warmup)')
+        results = {}
+        for phase, phase_mix in phases:
+            run = LoadRun(url, payloads, phase_mix, args.concurrency, args.rate, args.duration, args.warmup,
+                          args.seed, cpu=cpu)
+            window = run.run()
+            results[phase] = run.summary(window, args.server_cores)
+            print_report(phase, results[phase])
+        
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'url': url, 'server': args.spawn or 'external', 'load': load,
+                           'vision_latency_ms': args.vision_latency_ms, 'phases': results}, f, indent=2)
+            print(f'\n已寫入 {args.output}')
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='AI 服務壓力測試')
+    parser.add_argument('--url', default='http://127.0.0.1:5001', help='受測服務（未使用 --spawn 時）')
+    parser.add_argument('--spawn', choices=['flask', 'asgi'], help='在本機啟動受測服務（app.py 或 uvicorn asgi_app）')
+    parser.add_argument('--port', type=int, default=5099, help='--spawn 啟動的服務埠號')
+    parser.add_argument('--server-pid', type=int, help='外部服務的行程 ID（同一台機器時，用於量測 CPU 秒數）')
+    parser.add_argument('--server-cores', type=int, default=os.cpu_count() or 1,
+                        help='無法量測 CPU 秒數時，以吞吐量除以此核心數估算')
+    parser.add_argument('--server-log', help='--spawn 的服務輸出寫入此檔案')
+    parser.add_argument('--scenario', choices=['isolated', 'mixed'], default='isolated')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('ocr=1,calculate=8,insights=2'),
+                        help='端點與權重，例如 ocr=1,calculate=8,insights=2')
+    parser.add_argument('--concurrency', type=int, default=8, help='用戶端數（開放式負載時為送出請求的執行緒數）')
+    parser.add_argument('--rate', type=float, help='開放式負載的每秒平均請求數')
+    parser.add_argument('--duration', type=float, default=15.0, help='每個階段量測秒數')
+    parser.add_argument('--warmup', type=float, default=3.0, help='每個階段的暖機秒數（不計入結果）')
+    parser.add_argument('--receipts', type=int, default=24, help='不同的收據照片數')
+    parser.add_argument('--vision-latency-ms', type=float, default=250.0, help='Vision 替身的平均延遲')
+    parser.add_argument('--vision-jitter-ms', type=float, default=100.0, help='Vision 替身延遲的上下浮動')
+    parser.add_argument('--ocr-cache', action='store_true', help='--spawn 的服務啟用 OCR 結果快取（預設停用）')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='結果 JSON 檔案')
+    main(parser.parse_args())
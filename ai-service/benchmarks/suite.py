@@ -0,0 +1,278 @@
+"""熱點路徑效能測試套件（含基準線比較）
+
+以固定種子的合成資料量測碳足跡計算、洞察、圖像預處理、發票解析與完整發票 OCR 流程，
+OCR 引擎以替身取代（不需 Tesseract、EasyOCR 模型或 Google Vision 憑證），結果可重現。
+
+每個測試以 timeit 的方式自動決定每輪呼叫次數（每輪至少 --min-time 秒），重複 --repeat 輪，
+記錄每次呼叫的最短與中位數耗時。結果可存為 JSON 基準線，之後的執行與基準線比較，
+中位數變慢超過 --threshold 時列為退化並以結束碼 1 結束（可用於 CI）。
+
+使用方式:
+    python benchmarks/suite.py                                  # 執行並與 benchmarks/baselines/main.json 比較
+    python benchmarks/suite.py --save-baseline main             # 更新基準線
+    python benchmarks/suite.py --filter ocr --repeat 10
+    python benchmarks/suite.py --output results.json --baseline benchmarks/baselines/main.json
+    python benchmarks/suite.py --list
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# Google Vision 改用離線替身（需在載入 OCR 服務前設定）
+os.environ['GOOGLE_VISION_BACKEND'] = 'fake'
+
+import numpy as np
+
+from benchmarks.datasets import (
+    generate_activity_records, generate_carbon_records, generate_receipt_corpus, generate_receipt_image
+)
+from services import fake_vision
+from services.carbon_calculator import CarbonCalculator
+from services.ocr_service import OCRService
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+SEED = 42
+
+class StubEasyOCRReader:
+    """EasyOCR Reader 替身：逐行回傳目前收據的文字"""
+    
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.text = ''
+    
+    def readtext(self, image) -> List:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return [([[0, 0], [1, 0], [1, 1], [0, 1]], line, 0.9) for line in self.text.split('\n') if line]
+
+class StubOCRService(OCRService):
+    """OCR 引擎替身：Tesseract 與 EasyOCR 回傳目前收據的文字，Google Vision 使用 fake_vision
+    
+    解碼、預處理、引擎排程、合併與解析都是實際的程式碼；latency 模擬各引擎耗時（秒）。
+    """
+    
+    def __init__(self, latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.latency = latency
+        self.reader = StubEasyOCRReader(latency)
+        self.client = fake_vision.ImageAnnotatorClient(latency=latency, jitter=0.0)
+    
+    @property
+    def easyocr_reader(self):
+        return self.reader
+    
+    @property
+    def vision_client(self):
+        return self.client
+    
+    def set_text(self, text: str):
+        self.reader.text = text
+        self.client.text = text
+        self.text = text
+    
+    def extract_text_tesseract(self, image: np.ndarray) -> str:
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self.text
+
+class CarbonBenchmarks:
+    """CarbonCalculator 的單筆、每日彙總與洞察"""
+    
+    def setup(self):
+        self.calculator = CarbonCalculator()
+        self.activities = generate_activity_records(1000, seed=SEED)
+        self.daily = [generate_activity_records(30, seed=SEED + day) for day in range(30)]
+        self.records = generate_carbon_records(10000, seed=SEED)
+    
+    def time_calculate_footprint_1k(self):
+        for activity in self.activities:
+            self.calculator.calculate_footprint(activity)
+    
+    def time_calculate_daily_footprint_30x30(self):
+        for activities in self.daily:
+            self.calculator.calculate_daily_footprint(activities)
+    
+    def time_generate_insights_10k(self):
+        self.calculator.generate_insights(self.records)
+
+class OCRBenchmarks:
+    """發票 OCR：預處理、解析與完整流程（引擎為替身）"""
+    
+    RECEIPTS = 8
+    
+    def setup(self):
+        self.service = StubOCRService()
+        texts = generate_receipt_corpus(self.RECEIPTS, seed=SEED, min_items=5, max_items=40)
+        self.receipts = [(generate_receipt_image(text, seed=SEED + i), text) for i, text in enumerate(texts)]
+        self.images = [self.service._decode_image(image_bytes) for image_bytes, _ in self.receipts]
+        self.corpus = generate_receipt_corpus(200, seed=SEED)
+    
+    def teardown(self):
+        self.service.executor.shutdown(wait=True)
+    
+    def time_preprocess_image_8(self):
+        for image in self.images:
+            self.service.preprocess_image(image)
+    
+    def time_parse_invoice_data_200(self):
+        for text in self.corpus:
+            self.service.parse_invoice_data(text)
+    
+    def time_process_invoice_8(self):
+        for image_bytes, text in self.receipts:
+            self.service.set_text(text)
+            result = self.service.process_invoice(io.BytesIO(image_bytes))
+            assert result['success'], result.get('error')
+
+SUITES = [CarbonBenchmarks, OCRBenchmarks]
+
+def discover(pattern: Optional[str]) -> Dict[str, List[str]]:
+    """回傳 {測試類別名稱: [time_ 方法名稱]}，pattern 為名稱的正規表示式"""
+    found = {}
+    for suite in SUITES:
+        names = [name for name in dir(suite) if name.startswith('time_')
+                 if pattern is None or re.search(pattern, f'{suite.__name__}.{name}', re.IGNORECASE)]
+        if names:
+            found[suite.__name__] = names
+    return found
+
+def measure(function: Callable, repeat: int, min_time: float) -> Dict:
+    """自動決定每輪呼叫次數後重複量測，回傳每次呼叫的秒數統計"""
+    function()  # 預熱
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    
+    samples = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter() - start) / number)
+    return {
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'stdev': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat
+    }
+
+def machine_info() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'commit': commit
+    }
+
+def run(pattern: Optional[str], repeat: int, min_time: float) -> Dict:
+    suites = {suite.__name__: suite for suite in SUITES}
+    results = {}
+    for suite_name, names in discover(pattern).items():
+        instance = suites[suite_name]()
+        instance.setup()
+        try:
+            for name in names:
+                key = f'{suite_name}.{name}'
+                results[key] = measure(getattr(instance, name), repeat, min_time)
+                print(f"{key:<52} {results[key]['median'] * 1000:>10.3f} ms  "
+                      f"(min {results[key]['min'] * 1000:.3f}, n={results[key]['number']}x{repeat})")
+        finally:
+            if hasattr(instance, 'teardown'):
+                instance.teardown()
+    return {'machine': machine_info(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+def compare(current: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """印出與基準線的比較，回傳退化的測試名稱"""
+    if baseline['machine'].get('platform') != current['machine'].get('platform') or \
+            baseline['machine'].get('python') != current['machine'].get('python'):
+        print(f"注意: 基準線的環境不同（{baseline['machine'].get('platform')}, "
+              f"Python {baseline['machine'].get('python')}），比較結果僅供參考")
+    
+    print(f"\n{'benchmark':<52} {'baseline (ms)':>14} {'current (ms)':>13} {'ratio':>7}")
+    regressions = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            print(f"{key:<52} {'-':>14} {result['median'] * 1000:>13.3f} {'new':>7}")
+            continue
+        ratio = result['median'] / base['median']
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        elif ratio < 1 / (1 + threshold):
+            flag = '  faster'
+        print(f"{key:<52} {base['median'] * 1000:>14.3f} {result['median'] * 1000:>13.3f} {ratio:>6.2f}x{flag}")
+    
+    missing = sorted(set(baseline['results']) - set(current['results']))
+    if missing:
+        print(f"基準線中有、本次未執行的測試: {', '.join(missing)}")
+    return regressions
+
+def save(data: Dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f'已寫入 {path}')
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='熱點路徑效能測試套件')
+    parser.add_argument('--filter', help='只執行名稱符合此正規表示式的測試')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2, help='每輪最短秒數')
+    parser.add_argument('--output', help='結果 JSON 檔案')
+    parser.add_argument('--baseline', default=os.path.join(BASELINE_DIR, 'main.json'), help='比較用的基準線 JSON')
+    parser.add_argument('--save-baseline', metavar='NAME', help='將結果存為 benchmarks/baselines/<NAME>.json')
+    parser.add_argument('--threshold', type=float, default=0.15, help='中位數變慢超過此比例視為退化')
+    parser.add_argument('--list', action='store_true', help='列出測試名稱')
+    args = parser.parse_args()
+    
+    if args.list:
+        for suite_name, names in discover(args.filter).items():
+            for name in names:
+                print(f'{suite_name}.{name}')
+        sys.exit(0)
+    
+    current = run(args.filter, args.repeat, args.min_time)
+    if args.output:
+        save(current, args.output)
+    if args.save_baseline:
+        save(current, os.path.join(BASELINE_DIR, f'{args.save_baseline}.json'))
+        sys.exit(0)
+    
+    if not os.path.exists(args.baseline):
+        print(f'\n沒有基準線 {args.baseline}（以 --save-baseline 建立）')
+        sys.exit(0)
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} 個測試退化超過 {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
@@ -1,97 +1,264 @@
 import logging
 import json
+import re
+import unicodedata
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
 import numpy as np
-from dataclasses import dataclass
+from collections import deque
+
+from services import metrics
+from services.emission_factors import (EmissionFactor, FactorRegistry, FactorSnapshot, SHOPPING_PREFIX,
+                                       default_registry)
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class EmissionFactor:
-    """碳排放係數數據類"""
-    activity: str
-    factor: float  # kg CO2 per unit
-    unit: str
-    source: str
-    reliability: float  # 0-1, 數據可靠性
+class FoodTypeMatcher:
+    """食物類型比對器
+    
+    將食物關鍵字與中文同義詞預先編譯為單一正規表示式，一次掃描即可找出
+    最長（最具體）的匹配，例如「雞蛋」會對應 eggs 而不是 chicken。
+    
+    英文關鍵字需為完整單字（可加複數 s），避免 eggplant 對應 eggs、donut 對應 nuts；
+    STANDALONE 中的單字同義詞常是其他食物名稱的一部分，只在前後不是中文字時匹配，
+    避免「玉米」對應 rice、「蛋糕」對應 eggs。
+    """
+    
+    # 中英文同義詞 -> 食物類型
+    SYNONYMS = {
+        'beef': ['牛肉', '牛排', '牛'],
+        'pork': ['豬肉', '豬排', '豬', '培根', 'bacon', 'ham'],
+        'chicken': ['雞肉', '雞腿', '雞胸', '雞'],
+        'fish': ['魚肉', '鮭魚', '鮪魚', '魚', '海鮮', 'salmon', 'tuna'],
+        'dairy': ['牛奶', '鮮奶', '乳製品', '起司', '乳酪', '優格', '優酪乳', 'milk', 'cheese', 'yogurt'],
+        'eggs': ['雞蛋', '荷包蛋', '炒蛋', '滷蛋', '蒸蛋', '皮蛋', '蛋', 'egg'],
+        'rice': ['白米', '糙米', '米飯', '米粉', '米', '飯'],
+        'wheat': ['小麥', '麵包', '麵粉', '麵', 'bread', 'flour', 'noodle'],
+        'vegetables': ['蔬菜', '青菜', '玉米', '菜', 'vegetable', 'corn'],
+        'fruits': ['水果', '果', 'fruit'],
+        'nuts': ['堅果', '花生', '杏仁', 'nut'],
+        'legumes': ['豆類', '豆腐', '豆漿', '黃豆', '黑豆', '毛豆', '紅豆', '綠豆', '豆', 'bean', 'tofu']
+    }
+    
+    # 只單獨出現時才匹配的單字同義詞（玉米、蛋糕、咖啡豆）
+    STANDALONE = {'米', '蛋', '豆'}
+    
+    def __init__(self, food_emission_factors: Dict[str, float], cache_size: int = 4096):
+        self.food_emission_factors = food_emission_factors
+        
+        self.keyword_to_food = {}
+        for food_key in food_emission_factors:
+            self.keyword_to_food[food_key] = food_key
+            for synonym in self.SYNONYMS.get(food_key, []):
+                self.keyword_to_food.setdefault(synonym.lower(), food_key)
+        for keyword, food_key in list(self.keyword_to_food.items()):
+            if keyword.isascii() and not keyword.endswith('s'):
+                self.keyword_to_food.setdefault(keyword + 's', food_key)
+        
+        # 依長度排序，讓每個位置優先匹配最長的關鍵字；前瞻斷言可取得重疊的匹配
+        keywords = sorted(self.keyword_to_food, key=lambda k: (-len(k), k))
+        self.pattern = re.compile('(?=(' + '|'.join(self._keyword_pattern(k) for k in keywords) + '))')
+        
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+    
+    @classmethod
+    def _keyword_pattern(cls, keyword: str) -> str:
+        """關鍵字的正規表示式；邊界條件為零寬度，擷取的內容仍是關鍵字本身"""
+        escaped = re.escape(keyword)
+        if keyword.isascii():
+            return rf'(?<![a-z0-9]){escaped}(?![a-z0-9])'
+        if keyword in cls.STANDALONE:
+            return rf'(?<![\u4e00-\u9fff]){escaped}(?![\u4e00-\u9fff])'
+        return escaped
+    
+    @staticmethod
+    def normalize(food_type: str) -> str:
+        """正規化食物名稱（全形轉半形、小寫、去除空白）"""
+        return unicodedata.normalize('NFKC', food_type).lower().strip()
+    
+    def _match(self, normalized: str) -> Optional[str]:
+        """找出最長的匹配，長度相同時取最早出現者"""
+        best = None
+        for match in self.pattern.finditer(normalized):
+            keyword = match.group(1)
+            if best is None or len(keyword) > len(best):
+                best = keyword
+        return self.keyword_to_food[best] if best is not None else None
+    
+    def lookup(self, food_type: str) -> Optional[float]:
+        """查詢食物類型的排放係數，無匹配時回傳 None"""
+        food_key = self.match(self.normalize(food_type))
+        return self.food_emission_factors[food_key] if food_key is not None else None
 
-class CarbonCalculator:
-    """碳足跡計算器"""
+class InsightAccumulator:
+    """增量式碳足跡洞察累加器
     
-    def __init__(self):
-        self.emission_factors = self._load_emission_factors()
-        self.product_categories = self._load_product_categories()
-        self.food_emission_factors = self._load_food_emission_factors()
+    保存總量、筆數、最近 14 筆的環形緩衝區與各類型累計，新增一筆記錄為 O(1)，
+    產生的洞察與對完整歷史呼叫 CarbonCalculator.generate_insights 相同。
+    狀態可透過 to_dict / from_dict 序列化，服務不需每次重新掃描歷史記錄。
+    """
     
-    def _load_emission_factors(self) -> Dict[str, EmissionFactor]:
-        """載入碳排放係數"""
-        return {
-            # 交通運輸
-            'walking': EmissionFactor('walking', 0.0, 'km', 'IPCC', 1.0),
-            'cycling': EmissionFactor('cycling', 0.0, 'km', 'IPCC', 1.0),
-            'driving_gasoline': EmissionFactor('driving_gasoline', 0.192, 'km', 'EPA', 0.9),
-            'driving_diesel': EmissionFactor('driving_diesel', 0.171, 'km', 'EPA', 0.9),
-            'driving_electric': EmissionFactor('driving_electric', 0.053, 'km', 'EPA', 0.8),
-            'bus': EmissionFactor('bus', 0.089, 'km', 'IPCC', 0.9),
-            'train': EmissionFactor('train', 0.041, 'km', 'IPCC', 0.9),
-            'metro': EmissionFactor('metro', 0.041, 'km', 'IPCC', 0.9),
-            'flight_domestic': EmissionFactor('flight_domestic', 0.285, 'km', 'IPCC', 0.9),
-            'flight_international': EmissionFactor('flight_international', 0.255, 'km', 'IPCC', 0.9),
-            
-            # 能源使用
-            'electricity_taiwan': EmissionFactor('electricity_taiwan', 0.509, 'kWh', '台電', 0.95),
-            'natural_gas': EmissionFactor('natural_gas', 1.96, 'm³', 'IPCC', 0.9),
-            'lpg': EmissionFactor('lpg', 1.51, 'kg', 'IPCC', 0.9),
-            
-            # 食物
-            'beef': EmissionFactor('beef', 27.0, 'kg', 'Poore & Nemecek', 0.9),
-            'pork': EmissionFactor('pork', 12.1, 'kg', 'Poore & Nemecek', 0.9),
-            'chicken': EmissionFactor('chicken', 6.9, 'kg', 'Poore & Nemecek', 0.9),
-            'fish': EmissionFactor('fish', 5.1, 'kg', 'Poore & Nemecek', 0.8),
-            'dairy': EmissionFactor('dairy', 3.2, 'kg', 'Poore & Nemecek', 0.9),
-            'eggs': EmissionFactor('eggs', 4.2, 'kg', 'Poore & Nemecek', 0.9),
-            'rice': EmissionFactor('rice', 2.7, 'kg', 'Poore & Nemecek', 0.9),
-            'wheat': EmissionFactor('wheat', 1.4, 'kg', 'Poore & Nemecek', 0.9),
-            'vegetables': EmissionFactor('vegetables', 0.4, 'kg', 'Poore & Nemecek', 0.8),
-            'fruits': EmissionFactor('fruits', 0.4, 'kg', 'Poore & Nemecek', 0.8),
-        }
+    WINDOW = 7
     
-    def _load_product_categories(self) -> Dict[str, float]:
-        """載入商品類別碳排放係數 (kg CO2 per NT$ 100)"""
-        return {
-            'food': 0.8,
-            'clothing': 1.2,
-            'electronics': 2.5,
-            'home': 1.5,
-            'health': 1.0,
-            'beauty': 1.8,
-            'sports': 1.3,
-            'books': 0.6,
-            'toys': 1.4,
-            'automotive': 3.0,
-            'garden': 0.9,
-            'office': 1.1,
-            'other': 1.0
-        }
+    def __init__(self, daily_goal: float = 20.0):
+        self.daily_goal = daily_goal  # kg CO2
+        self.total_emission = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=self.WINDOW * 2)
+        self.type_totals = {}
+    
+    def add(self, record: Dict):
+        """新增一筆碳足跡記錄"""
+        emission = record.get('carbon_footprint', 0)
+        activity_type = record.get('type', 'other')
+        
+        self.total_emission += emission
+        self.count += 1
+        self.recent.append(emission)
+        self.type_totals[activity_type] = self.type_totals.get(activity_type, 0) + emission
+    
+    def extend(self, records: List[Dict]):
+        """依序新增多筆記錄"""
+        for record in records:
+            self.add(record)
+    
+    def generate_insights(self) -> List[Dict]:
+        """根據累計狀態生成洞察"""
+        try:
+            insights = []
+            
+            if not self.count:
+                return insights
+            
+            total_emission = self.total_emission
+            avg_emission = total_emission / self.count
+            
+            # 分析趨勢（最近一週 vs 前一週）
+            if self.count >= self.WINDOW:
+                window = list(self.recent)
+                recent_week = window[-self.WINDOW:]
+                previous_week = window[-self.WINDOW * 2:-self.WINDOW] if self.count >= self.WINDOW * 2 else []
+                
+                if previous_week:
+                    recent_avg = sum(recent_week) / self.WINDOW
+                    previous_avg = sum(previous_week) / self.WINDOW
+                    
+                    change_percent = ((recent_avg - previous_avg) / previous_avg) * 100
+                    
+                    if change_percent > 10:
+                        insights.append({
+                            'type': 'warning',
+                            'title': '碳排放增加',
+                            'description': f'最近一週的碳排放比前一週增加了 {change_percent:.1f}%',
+                            'priority': 'high'
+                        })
+                    elif change_percent < -10:
+                        insights.append({
+                            'type': 'achievement',
+                            'title': '碳排放減少',
+                            'description': f'最近一週的碳排放比前一週減少了 {abs(change_percent):.1f}%',
+                            'priority': 'medium'
+                        })
+            
+            # 分析主要排放源
+            if self.type_totals:
+                max_activity = max(self.type_totals, key=self.type_totals.get)
+                max_emission = self.type_totals[max_activity]
+                
+                if max_emission > total_emission * 0.5:
+                    insights.append({
+                        'type': 'tip',
+                        'title': '主要排放源',
+                        'description': f'{max_activity} 佔總碳排放的 {(max_emission/total_emission)*100:.1f}%',
+                        'priority': 'medium'
+                    })
+            
+            # 目標達成分析
+            if avg_emission > self.daily_goal:
+                insights.append({
+                    'type': 'warning',
+                    'title': '超過每日目標',
+                    'description': f'平均每日碳排放 {avg_emission:.1f}kg 超過目標 {self.daily_goal}kg',
+                    'priority': 'high'
+                })
+            elif avg_emission < self.daily_goal * 0.8:
+                insights.append({
+                    'type': 'achievement',
+                    'title': '達成環保目標',
+                    'description': f'平均每日碳排放 {avg_emission:.1f}kg 低於目標',
+                    'priority': 'medium'
+                })
+            
+            return insights
+            
+        except Exception as e:
+            logger.error(f"洞察生成失敗: {e}")
+            return []
     
-    def _load_food_emission_factors(self) -> Dict[str, float]:
-        """載入食物碳排放係數 (kg CO2 per kg)"""
+    def to_dict(self) -> Dict:
+        """序列化累加器狀態"""
         return {
-            'beef': 27.0,
-            'pork': 12.1,
-            'chicken': 6.9,
-            'fish': 5.1,
-            'dairy': 3.2,
-            'eggs': 4.2,
-            'rice': 2.7,
-            'wheat': 1.4,
-            'vegetables': 0.4,
-            'fruits': 0.4,
-            'nuts': 0.3,
-            'legumes': 0.6
+            'daily_goal': self.daily_goal,
+            'total_emission': self.total_emission,
+            'count': self.count,
+            'recent': list(self.recent),
+            'type_totals': dict(self.type_totals)
         }
     
+    @classmethod
+    def from_dict(cls, state: Dict) -> 'InsightAccumulator':
+        """由序列化狀態還原累加器"""
+        accumulator = cls(daily_goal=state.get('daily_goal', 20.0))
+        accumulator.total_emission = state.get('total_emission', 0.0)
+        accumulator.count = state.get('count', 0)
+        accumulator.recent.extend(state.get('recent', []))
+        accumulator.type_totals = dict(state.get('type_totals', {}))
+        return accumulator
+
+class CarbonCalculator:
+    """碳足跡計算器
+    
+    排放係數來自 FactorRegistry（預設為行程共用的登錄表），每次計算取得目前的版本，
+    係數表替換後下一次計算即使用新係數。
+    """
+    
+    def __init__(self, registry: Optional[FactorRegistry] = None):
+        self.registry = registry or default_registry()
+    
+    @property
+    def factors(self) -> FactorSnapshot:
+        """目前使用的係數版本"""
+        return self.registry.current
+    
+    @property
+    def emission_factors(self) -> Dict[str, EmissionFactor]:
+        """交通、能源與食物的排放係數"""
+        return self.factors.derived('emission_factors', lambda snapshot: {
+            name: snapshot.get(name)
+            for category in ('transportation', 'energy', 'food') for name in snapshot.names(category)
+        })
+    
+    @property
+    def product_categories(self) -> Dict[str, float]:
+        """商品類別碳排放係數 (kg CO2 per NT$ 100)"""
+        return self.factors.derived('product_categories', lambda snapshot: {
+            name[len(SHOPPING_PREFIX):]: snapshot.factor_of(name) for name in snapshot.names('shopping')
+        })
+    
+    @property
+    def food_emission_factors(self) -> Dict[str, float]:
+        """食物碳排放係數 (kg CO2 per kg)"""
+        return self.factors.derived('food_emission_factors', lambda snapshot: {
+            name: snapshot.factor_of(name) for name in snapshot.names('food')
+        })
+    
+    @property
+    def food_matcher(self) -> FoodTypeMatcher:
+        return self.factors.derived('food_matcher', lambda snapshot: FoodTypeMatcher({
+            name: snapshot.factor_of(name) for name in snapshot.names('food')
+        }))
+    
     def calculate_transportation_emission(self, data: Dict) -> float:
         """計算交通運輸碳排放"""
         try:
@@ -99,6 +266,7 @@ class CarbonCalculator:
             distance = data.get('distance', 0)  # km
             passengers = data.get('passengers', 1)
             vehicle_type = data.get('vehicle_type', 'gasoline')
+            factors = self.factors
             
             # 根據交通類型選擇排放係數
             if transport_type == 'walking' or transport_type == 'cycling':
@@ -106,26 +274,24 @@ class CarbonCalculator:
             
             elif transport_type == 'driving':
                 factor_key = f'driving_{vehicle_type}'
-                if factor_key not in self.emission_factors:
+                if factor_key not in factors:
                     factor_key = 'driving_gasoline'  # 預設
                 
-                factor = self.emission_factors[factor_key]
-                emission = distance * factor.factor
+                emission = distance * factors.factor_of(factor_key)
                 
                 # 考慮載客數（分攤碳排放）
                 return emission / passengers
             
             elif transport_type == 'public_transport':
                 transport_mode = data.get('mode', 'bus')
-                factor_key = transport_mode if transport_mode in self.emission_factors else 'bus'
-                factor = self.emission_factors[factor_key]
-                return distance * factor.factor
+                transport_names = factors.derived('transport_table', self._transport_factor_table)['names']
+                factor_key = transport_mode if transport_mode in transport_names else 'bus'
+                return distance * factors.factor_of(factor_key)
             
             elif transport_type == 'flying':
                 flight_type = data.get('flight_type', 'domestic')
                 factor_key = f'flight_{flight_type}'
-                factor = self.emission_factors[factor_key]
-                return distance * factor.factor
+                return distance * factors.factor_of(factor_key)
             
             else:
                 # 未知交通類型，使用預設值
@@ -146,6 +312,7 @@ class CarbonCalculator:
                 return total_amount * 0.01  # 1% 的碳排放係數
             
             total_emission = 0.0
+            product_categories = self.product_categories
             
             for item in items:
                 category = item.get('category', 'other')
@@ -153,10 +320,10 @@ class CarbonCalculator:
                 quantity = item.get('quantity', 1)
                 
                 # 根據商品類別計算碳排放
-                if category in self.product_categories:
-                    emission_factor = self.product_categories[category]
+                if category in product_categories:
+                    emission_factor = product_categories[category]
                 else:
-                    emission_factor = self.product_categories['other']
+                    emission_factor = product_categories['other']
                 
                 item_emission = (price * quantity) * (emission_factor / 100)
                 total_emission += item_emission
@@ -171,20 +338,17 @@ class CarbonCalculator:
         """計算食物碳排放"""
         try:
             food_items = data.get('items', [])
+            food_matcher = self.food_matcher
             total_emission = 0.0
             
             for item in food_items:
                 food_type = item.get('type', '')
                 weight = item.get('weight', 0)  # kg
                 
-                # 尋找匹配的食物類型
-                emission_factor = 0.0
-                for food_key, factor in self.food_emission_factors.items():
-                    if food_key in food_type.lower():
-                        emission_factor = factor
-                        break
+                # 尋找最具體的匹配食物類型
+                emission_factor = food_matcher.lookup(food_type)
                 
-                if emission_factor == 0.0:
+                if not emission_factor:
                     # 使用平均食物排放係數
                     emission_factor = 2.0
                 
@@ -202,17 +366,16 @@ class CarbonCalculator:
             energy_type = data.get('type', 'electricity')
             consumption = data.get('consumption', 0)
             
+            factors = self.factors
+            
             if energy_type == 'electricity':
-                factor = self.emission_factors['electricity_taiwan']
-                return consumption * factor.factor
+                return consumption * factors.factor_of('electricity_taiwan')
             
             elif energy_type == 'natural_gas':
-                factor = self.emission_factors['natural_gas']
-                return consumption * factor.factor
+                return consumption * factors.factor_of('natural_gas')
             
             elif energy_type == 'lpg':
-                factor = self.emission_factors['lpg']
-                return consumption * factor.factor
+                return consumption * factors.factor_of('lpg')
             
             else:
                 return 0.0
@@ -221,6 +384,7 @@ class CarbonCalculator:
             logger.error(f"能源碳排放計算失敗: {e}")
             return 0.0
     
+    @metrics.timed('carbon', 'calculate')
     def calculate_footprint(self, data: Dict) -> Dict:
         """計算總碳足跡"""
         try:
@@ -256,6 +420,217 @@ class CarbonCalculator:
                 'timestamp': datetime.now().isoformat()
             }
     
+    def _encode_column(self, values, size: int, lookup: Dict[str, int], default_code: int) -> np.ndarray:
+        """將字串欄位編碼為整數代碼（未知值使用預設代碼）"""
+        if values is None or isinstance(values, str):
+            code = lookup.get(values, default_code)
+            return np.full(size, code, dtype=np.intp)
+        column = np.asarray(values)
+        if column.dtype.kind in 'US':
+            # 字串陣列：對每個已知值做一次向量化比對，避免逐筆 Python 查詢
+            codes = np.full(size, default_code, dtype=np.intp)
+            for key, code in lookup.items():
+                codes[column == key] = code
+            return codes
+        return np.fromiter((lookup.get(v, default_code) for v in values), dtype=np.intp, count=size)
+    
+    def _numeric_column(self, values, size: int, default: float) -> np.ndarray:
+        """將數值欄位轉換為 float64 陣列（None 使用預設值）"""
+        if values is None:
+            return np.full(size, default, dtype=np.float64)
+        column = np.asarray(values, dtype=np.float64)
+        if column.ndim == 0:
+            return np.full(size, float(column), dtype=np.float64)
+        return column
+    
+    def _round_batch(self, emissions: np.ndarray, decimals: int = 3) -> np.ndarray:
+        """批次四捨五入，結果與 Python round() 完全一致"""
+        rounded = np.round(emissions, decimals)
+        # np.round 以乘法近似，僅在接近 .5 邊界時可能與 round() 不同，這些值逐筆修正
+        scaled = np.abs(emissions) * (10 ** decimals)
+        ambiguous = np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0]
+        for i in ambiguous:
+            rounded[i] = round(float(emissions[i]), decimals)
+        return rounded
+    
+    @staticmethod
+    def _transport_factor_table(snapshot: FactorSnapshot) -> Dict:
+        """建立交通排放係數編碼表（每個係數版本建立一次）
+        
+        包含交通類型代碼、子類型代碼、係數表[類型, 子類型]、是否按載客數分攤[類型]，
+        以及 vehicle_type / mode / flight_type 各自會影響係數的子類型代碼，
+        分派邏輯與 calculate_transportation_emission 相同。
+        """
+        transport_codes = {'walking': 0, 'cycling': 1, 'driving': 2, 'public_transport': 3, 'flying': 4}
+        unknown_code = len(transport_codes)
+        names = set(snapshot.names('transportation'))
+        
+        # 子類型涵蓋 vehicle_type / mode / flight_type 的所有已知值
+        subtypes = sorted({key[len('driving_'):] for key in names if key.startswith('driving_')}
+                          | {key[len('flight_'):] for key in names if key.startswith('flight_')}
+                          | names)
+        subtype_codes = {name: i for i, name in enumerate(subtypes)}
+        unknown_subtype = len(subtypes)
+        
+        factors = np.zeros((unknown_code + 1, unknown_subtype + 1), dtype=np.float64)
+        per_passenger = np.zeros(unknown_code + 1, dtype=bool)
+        
+        for name, j in list(subtype_codes.items()) + [(None, unknown_subtype)]:
+            # 開車：未知車種使用汽油車係數
+            driving_key = f'driving_{name}'
+            if driving_key not in names:
+                driving_key = 'driving_gasoline'
+            factors[transport_codes['driving'], j] = snapshot.factor_of(driving_key)
+            
+            # 大眾運輸：未知模式使用公車係數
+            mode_key = name if name in names else 'bus'
+            factors[transport_codes['public_transport'], j] = snapshot.factor_of(mode_key)
+            
+            # 飛行：未知航班類型在純量路徑會失敗並回傳 0
+            flight_key = f'flight_{name}'
+            if flight_key in names:
+                factors[transport_codes['flying'], j] = snapshot.factor_of(flight_key)
+            
+            # 未知交通類型使用預設值
+            factors[unknown_code, j] = 0.1
+        
+        per_passenger[transport_codes['driving']] = True
+        
+        # 只比對會影響係數的子類型，其餘值與未知子類型結果相同
+        return {
+            'names': names,
+            'transport_codes': transport_codes,
+            'subtype_codes': subtype_codes,
+            'factors': factors,
+            'per_passenger': per_passenger,
+            'vehicle_codes': {name: code for name, code in subtype_codes.items() if f'driving_{name}' in names},
+            'flight_codes': {name: code for name, code in subtype_codes.items() if f'flight_{name}' in names},
+            'mode_codes': {name: code for name, code in subtype_codes.items() if name in names}
+        }
+    
+    def calculate_transportation_batch(self, transport_types, distances, passengers=None,
+                                       vehicle_types=None, modes=None, flight_types=None) -> np.ndarray:
+        """批次計算交通運輸碳排放（欄位式輸入）
+        
+        每一列的結果與 calculate_transportation_emission 逐筆計算相同（未四捨五入），
+        適合重新計算大量移動記錄。
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        size = len(distances)
+        
+        table = self.factors.derived('transport_table', self._transport_factor_table)
+        transport_codes = table['transport_codes']
+        unknown_subtype = len(table['subtype_codes'])
+        
+        type_idx = self._encode_column(transport_types, size, transport_codes, len(transport_codes))
+        passengers = self._numeric_column(passengers, size, 1.0)
+        
+        # 每種交通類型使用各自的子類型欄位，預設值與純量路徑相同
+        vehicle_idx = self._encode_column(vehicle_types if vehicle_types is not None else 'gasoline',
+                                          size, table['vehicle_codes'], unknown_subtype)
+        mode_idx = self._encode_column(modes if modes is not None else 'bus', size, table['mode_codes'],
+                                       unknown_subtype)
+        flight_idx = self._encode_column(flight_types if flight_types is not None else 'domestic',
+                                         size, table['flight_codes'], unknown_subtype)
+        subtype_idx = np.where(type_idx == transport_codes['driving'], vehicle_idx,
+                               np.where(type_idx == transport_codes['flying'], flight_idx, mode_idx))
+        
+        emissions = distances * table['factors'][type_idx, subtype_idx]
+        
+        # 開車按載客數分攤；載客數為 0 時純量路徑會失敗並回傳 0
+        shared = table['per_passenger'][type_idx]
+        valid = shared & (passengers != 0)
+        np.divide(emissions, passengers, out=emissions, where=valid)
+        emissions[shared & ~valid] = 0.0
+        
+        return emissions
+    
+    def calculate_energy_batch(self, energy_types, consumptions) -> np.ndarray:
+        """批次計算能源使用碳排放，每一列與 calculate_energy_emission 相同"""
+        consumptions = np.asarray(consumptions, dtype=np.float64)
+        factors = self.factors.derived('energy_table', lambda snapshot: np.array(
+            [snapshot.value(key, 0.0) for key in ('electricity_taiwan', 'natural_gas', 'lpg')] + [0.0]
+        ))
+        codes = self._encode_column(energy_types, len(consumptions), {'electricity': 0, 'natural_gas': 1, 'lpg': 2}, 3)
+        return consumptions * factors[codes]
+    
+    def calculate_food_batch(self, owners, food_types, weights, size: int) -> np.ndarray:
+        """批次計算食物碳排放
+        
+        每個品項一列，owners 為品項所屬記錄的位置；回傳 size 筆記錄各自的排放，
+        與 calculate_food_emission 逐筆計算相同。每種食物名稱只比對一次。
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        names, inverse = np.unique(np.asarray(food_types, dtype=str), return_inverse=True)
+        food_matcher = self.food_matcher
+        # 無匹配時使用平均食物排放係數
+        factors = np.array([food_matcher.lookup(name) or 2.0 for name in names.tolist()], dtype=np.float64)
+        return np.bincount(np.asarray(owners, dtype=np.intp), weights=weights * factors[inverse].reshape(-1),
+                           minlength=size)
+    
+    def calculate_shopping_batch(self, owners, categories, prices, quantities, total_amounts,
+                                 has_items) -> np.ndarray:
+        """批次計算購物碳排放
+        
+        每個商品一列，owners 為商品所屬記錄的位置；沒有商品明細的記錄（has_items 為 False）
+        以 total_amounts 的平均係數計算，與 calculate_shopping_emission 逐筆計算相同。
+        """
+        total_amounts = np.asarray(total_amounts, dtype=np.float64)
+        size = len(total_amounts)
+        prices = np.asarray(prices, dtype=np.float64)
+        product_categories = self.product_categories
+        codes = {name: i for i, name in enumerate(product_categories)}
+        factors = np.array(list(product_categories.values()) + [product_categories['other']], dtype=np.float64)
+        category_idx = self._encode_column(categories, len(prices), codes, len(codes))
+        item_emissions = (prices * np.asarray(quantities, dtype=np.float64)) * (factors[category_idx] / 100)
+        emissions = np.bincount(np.asarray(owners, dtype=np.intp), weights=item_emissions, minlength=size)
+        return np.where(np.asarray(has_items, dtype=bool), emissions, total_amounts * 0.01)
+    
+    @metrics.timed('carbon', 'calculate_batch')
+    def calculate_footprint_batch(self, activity_types, distances=None, amounts=None) -> Dict:
+        """批次計算碳足跡（欄位式輸入）
+        
+        以單次 NumPy 運算計算沒有商品明細的活動，每一列的 carbon_footprint 與
+        calculate_footprint 逐筆計算的結果完全一致。calculate_footprint 以活動類型
+        作為交通類型，不會用到車種與載客數；依車種計算請使用 calculate_transportation_batch。
+        """
+        try:
+            size = len(activity_types)
+            activity_codes = {'transportation': 0, 'shopping': 1, 'food': 2, 'energy': 3}
+            type_idx = self._encode_column(activity_types, size, activity_codes, len(activity_codes))
+            
+            distances = self._numeric_column(distances, size, 0.0)
+            amounts = self._numeric_column(amounts, size, 0.0)
+            
+            # calculate_footprint 以活動類型作為交通類型，因此交通活動一律走預設係數分支
+            transport_emissions = self.calculate_transportation_batch('transportation', distances)
+            
+            # 沒有商品明細的購物使用平均係數；食物與能源在沒有明細時為 0
+            emissions = np.zeros(size, dtype=np.float64)
+            is_transport = type_idx == activity_codes['transportation']
+            is_shopping = type_idx == activity_codes['shopping']
+            emissions[is_transport] = transport_emissions[is_transport]
+            emissions[is_shopping] = amounts[is_shopping] * 0.01
+            
+            return {
+                'carbon_footprint': self._round_batch(emissions),
+                'activity_count': size,
+                'calculation_method': 'standard_emission_factors',
+                'confidence': 0.8,
+                'timestamp': datetime.now().isoformat()
+            }
+        
+        except Exception as e:
+            logger.error(f"批次碳足跡計算失敗: {e}")
+            return {
+                'carbon_footprint': np.zeros(len(activity_types), dtype=np.float64),
+                'activity_count': len(activity_types),
+                'calculation_method': 'error',
+                'confidence': 0.0,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
+    
     def calculate_daily_footprint(self, activities: List[Dict]) -> Dict:
         """計算每日碳足跡"""
         try:
@@ -308,78 +683,10 @@ class CarbonCalculator:
     def generate_insights(self, carbon_data: List[Dict]) -> List[Dict]:
         """生成碳足跡洞察"""
         try:
-            insights = []
-            
-            if not carbon_data:
-                return insights
-            
-            # 計算統計數據
-            total_emission = sum(item.get('carbon_footprint', 0) for item in carbon_data)
-            avg_emission = total_emission / len(carbon_data)
+            accumulator = InsightAccumulator()
+            accumulator.extend(carbon_data)
             
-            # 分析趨勢
-            if len(carbon_data) >= 7:
-                recent_week = carbon_data[-7:]
-                previous_week = carbon_data[-14:-7] if len(carbon_data) >= 14 else []
-                
-                if previous_week:
-                    recent_avg = sum(item.get('carbon_footprint', 0) for item in recent_week) / 7
-                    previous_avg = sum(item.get('carbon_footprint', 0) for item in previous_week) / 7
-                    
-                    change_percent = ((recent_avg - previous_avg) / previous_avg) * 100
-                    
-                    if change_percent > 10:
-                        insights.append({
-                            'type': 'warning',
-                            'title': '碳排放增加',
-                            'description': f'最近一週的碳排放比前一週增加了 {change_percent:.1f}%',
-                            'priority': 'high'
-                        })
-                    elif change_percent < -10:
-                        insights.append({
-                            'type': 'achievement',
-                            'title': '碳排放減少',
-                            'description': f'最近一週的碳排放比前一週減少了 {abs(change_percent):.1f}%',
-                            'priority': 'medium'
-                        })
-            
-            # 分析主要排放源
-            activity_types = {}
-            for item in carbon_data:
-                activity_type = item.get('type', 'other')
-                emission = item.get('carbon_footprint', 0)
-                activity_types[activity_type] = activity_types.get(activity_type, 0) + emission
-            
-            if activity_types:
-                max_activity = max(activity_types, key=activity_types.get)
-                max_emission = activity_types[max_activity]
-                
-                if max_emission > total_emission * 0.5:
-                    insights.append({
-                        'type': 'tip',
-                        'title': '主要排放源',
-                        'description': f'{max_activity} 佔總碳排放的 {(max_emission/total_emission)*100:.1f}%',
-                        'priority': 'medium'
-                    })
-            
-            # 目標達成分析
-            daily_goal = 20.0  # kg CO2
-            if avg_emission > daily_goal:
-                insights.append({
-                    'type': 'warning',
-                    'title': '超過每日目標',
-                    'description': f'平均每日碳排放 {avg_emission:.1f}kg 超過目標 {daily_goal}kg',
-                    'priority': 'high'
-                })
-            elif avg_emission < daily_goal * 0.8:
-                insights.append({
-                    'type': 'achievement',
-                    'title': '達成環保目標',
-                    'description': f'平均每日碳排放 {avg_emission:.1f}kg 低於目標',
-                    'priority': 'medium'
-                })
-            
-            return insights
+            return accumulator.generate_insights()
             
         except Exception as e:
             logger.error(f"洞察生成失敗: {e}")
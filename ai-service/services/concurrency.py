@@ -0,0 +1,188 @@
+import asyncio
+import itertools
+import logging
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_SECONDS = metrics.registry.histogram(
+    'ai_service_queue_wait_seconds', '請求在端點等待佇列中的時間（秒）', ('endpoint',)
+)
+
+class QueueFull(Exception):
+    """端點的等待佇列已滿"""
+
+class EndpointLimiter:
+    """單一端點的並行上限與等待佇列
+    
+    同時最多 max_concurrency 個請求執行，其餘在佇列中等待；等待中的請求超過 max_queue 時
+    直接拒絕（QueueFull），避免慢速請求無限累積。記錄佇列深度、等待時間與完成、拒絕的數量。
+    """
+    
+    def __init__(self, name: str, max_concurrency: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+    
+    async def acquire(self):
+        if self.max_queue is not None and self.semaphore.locked() and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f'{self.name} 等待佇列已滿（{self.queued}）')
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        start = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            waited = time.perf_counter() - start
+            self.queued -= 1
+            self.wait_seconds += waited
+            QUEUE_WAIT_SECONDS.observe(waited, self.name)
+        self.in_flight += 1
+    
+    def release(self):
+        self.in_flight -= 1
+        self.completed += 1
+        self.semaphore.release()
+    
+    async def __aenter__(self) -> 'EndpointLimiter':
+        await self.acquire()
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        self.release()
+    
+    def stats(self) -> Dict:
+        return {
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'in_flight': self.in_flight,
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_seconds': round(self.wait_seconds, 4)
+        }
+
+class BoundedExecutor:
+    """固定執行緒數的執行器，讓 CPU 密集或阻塞的工作不佔用事件迴圈
+    
+    OCR 與計算分別使用不同的執行器，慢速的 OCR 不會佔滿輕量計算的執行緒。
+    所有端點合計同時交給執行器的工作數等於執行緒數，其餘在事件迴圈中等待（可取消），
+    不會排在 ThreadPoolExecutor 的內部佇列。記錄等待執行緒（queued）與執行中（active）的工作數。
+    """
+    
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self.slots = asyncio.Semaphore(workers)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+    
+    def _call(self, function: Callable, args, kwargs):
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.completed += 1
+                self.busy_seconds += time.perf_counter() - start
+    
+    async def run(self, function: Callable, *args, **kwargs):
+        """取得執行緒名額後在執行器中執行 function 並等待結果"""
+        with self.lock:
+            self.queued += 1
+        start = time.perf_counter()
+        try:
+            await self.slots.acquire()
+        except asyncio.CancelledError:
+            with self.lock:
+                self.queued -= 1
+            raise
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+        
+        # 名額在工作實際結束（或取消成功）時才釋放，執行中的工作被中斷時不會多送出工作
+        loop = asyncio.get_running_loop()
+        future = self.executor.submit(self._call, function, args, kwargs)
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self.slots.release))
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # 用戶端中斷時，尚未開始的工作直接取消
+            if future.cancel():
+                with self.lock:
+                    self.queued -= 1
+            raise
+    
+    async def iterate(self, iterator: Iterator, batch_size: int = 1) -> AsyncIterator:
+        """在執行器中逐項取出同步產生器的結果（例如串流回應）
+        
+        每次在執行器中取出最多 batch_size 項，減少輕量項目切換執行緒的成本。
+        """
+        def take():
+            return list(itertools.islice(iterator, batch_size))
+        
+        while True:
+            items = await self.run(take)
+            if not items:
+                return
+            for item in items:
+                yield item
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return {
+                'workers': self.workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'busy_seconds': round(self.busy_seconds, 4),
+                'wait_seconds': round(self.wait_seconds, 4)
+            }
+    
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+async def spool_lines(chunks: AsyncIterator[bytes], max_memory: int = 8 * 1024 * 1024) -> Iterator[bytes]:
+    """先讀完請求內容（超過 max_memory 時暫存到磁碟），回傳逐行讀取的同步迭代器
+    
+    請求內容在事件迴圈中讀取，慢速上傳不佔用執行緒池；串流回應期間 ASGI 伺服器會接收
+    用戶端中斷的訊息，不能同時讀取請求內容，因此回應與請求都是串流的端點也先以此讀完請求。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    try:
+        async for chunk in chunks:
+            spool.write(chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    
+    def lines() -> Iterator[bytes]:
+        with spool:
+            yield from spool
+    
+    return lines()
@@ -0,0 +1,571 @@
+import json
+import logging
+import math
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from services import metrics
+from services.carbon_calculator import CarbonCalculator
+from services.movement_analyzer import parse_timestamps
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('parse', 'validate', 'normalize', 'enrich', 'aggregate')
+CATEGORIES = ('transportation', 'shopping', 'food', 'energy', 'other')
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORIES)}
+TRANSPORT_TYPES = ('walking', 'cycling', 'driving', 'public_transport', 'flying', 'unknown')
+
+# 其他名稱對應的 (類別, 子類型)
+TYPE_ALIASES = {
+    'transport': ('transportation', None),
+    'electricity': ('energy', 'electricity'),
+    'natural_gas': ('energy', 'natural_gas'),
+    'lpg': ('energy', 'lpg'),
+    'invoice': ('shopping', None)
+}
+
+# 單位換算為 km、kWh、kg
+DISTANCE_UNITS = {'km': 1.0, 'm': 0.001, 'mi': 1.609344, 'mile': 1.609344}
+ENERGY_UNITS = {'kwh': 1.0, 'wh': 0.001, 'mwh': 1000.0}
+WEIGHT_UNITS = {'kg': 1.0, 'g': 0.001, 'lb': 0.45359237}
+
+NUMERIC_FIELDS = ('distance', 'consumption', 'total_amount', 'amount', 'carbon_footprint')
+
+class InvalidRecord(ValueError):
+    """記錄驗證失敗；reason 為錯誤類別"""
+    
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+@dataclass
+class StageStats:
+    """管線單一階段的處理量"""
+    name: str
+    records_in: int = 0
+    records_out: int = 0
+    chunks: int = 0
+    # 處理時間（不含等待上游），以及等待下游取用的時間（背壓）
+    seconds: float = 0.0
+    blocked_seconds: float = 0.0
+    
+    def to_dict(self) -> Dict:
+        return {
+            'records_in': self.records_in,
+            'records_out': self.records_out,
+            'chunks': self.chunks,
+            'seconds': round(self.seconds, 4),
+            'blocked_seconds': round(self.blocked_seconds, 4),
+            'records_per_second': round(self.records_in / self.seconds, 1) if self.seconds > 0 else None
+        }
+
+@dataclass
+class RecordChunk:
+    """正規化後的一段記錄：records 為計算碳排放用的字典，其餘為對應的欄位陣列"""
+    index: np.ndarray
+    records: List[Dict]
+    category: np.ndarray
+    timestamp: np.ndarray
+    distance: np.ndarray
+    transport_type: List[Optional[str]]
+    emission: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return len(self.records)
+    
+    def take(self, rows: np.ndarray) -> 'RecordChunk':
+        """取出部分記錄（rows 為位置陣列）"""
+        return RecordChunk(
+            index=self.index[rows],
+            records=[self.records[i] for i in rows],
+            category=self.category[rows],
+            timestamp=self.timestamp[rows],
+            distance=self.distance[rows],
+            transport_type=[self.transport_type[i] for i in rows],
+            emission=self.emission[rows] if self.emission is not None else None
+        )
+
+@dataclass
+class ProcessingRun:
+    """一次處理的統計：各階段處理量與驗證錯誤"""
+    stages: Dict[str, StageStats] = field(default_factory=dict)
+    error_counts: Dict[str, int] = field(default_factory=dict)
+    error_samples: List[Dict] = field(default_factory=list)
+    max_errors: int = 100
+    
+    def stage(self, name: str) -> StageStats:
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+    
+    def reject(self, index: int, reason: str, message: str):
+        self.error_counts[reason] = self.error_counts.get(reason, 0) + 1
+        if len(self.error_samples) < self.max_errors:
+            self.error_samples.append({'index': index, 'reason': reason, 'error': message})
+
+class DataProcessor:
+    """用戶資料處理管線
+    
+    以產生器串接 parse → validate → normalize → enrich → aggregate，每段最多 chunk_size 筆記錄，
+    下游取用時才讀取上游，因此記憶體用量與輸入大小無關。parse 可在背景執行緒預先讀取，
+    與計算重疊；兩者之間的佇列最多 queue_size 段，佇列滿時讀取端暫停（背壓）。
+    每個階段記錄處理筆數、段數與耗時。
+    """
+    
+    def __init__(self, carbon_calculator: Optional[CarbonCalculator] = None, chunk_size: int = 1000,
+                 queue_size: int = 4, max_errors: int = 100, utc_offset: float = 8.0):
+        self.carbon_calculator = carbon_calculator or CarbonCalculator()
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.max_errors = max_errors
+        # 日、月統計使用的時區（小時），預設為台灣時間
+        self.utc_offset = utc_offset
+    
+    def process_data(self, data: Dict) -> Dict:
+        """處理 data['records']（或 activities / movements）並回傳彙總結果"""
+        try:
+            records = data if isinstance(data, list) else data.get('records')
+            if records is None:
+                records = (data.get('activities') or []) + (data.get('movements') or [])
+            return self.process_stream(records, prefetch=False,
+                                       utc_offset=None if isinstance(data, list) else data.get('utc_offset'))
+        except Exception as e:
+            logger.error(f"數據處理失敗: {e}")
+            return {'record_count': 0, 'processed_count': 0, 'invalid_count': 0, 'error': str(e)}
+    
+    def process_stream(self, items: Iterable, prefetch: bool = True, utc_offset: Optional[float] = None) -> Dict:
+        """處理記錄串流（字典，或 NDJSON 的 str / bytes 行）並回傳彙總結果"""
+        run = ProcessingRun(max_errors=self.max_errors)
+        for name in STAGES:
+            run.stage(name)
+        aggregator = Aggregator(self.utc_offset if utc_offset is None else utc_offset)
+        stats = run.stage('aggregate')
+        for chunk in self.iter_chunks(items, run, prefetch):
+            start = time.perf_counter()
+            aggregator.add(chunk)
+            stats.seconds += time.perf_counter() - start
+            stats.records_in += len(chunk)
+            stats.records_out += len(chunk)
+            stats.chunks += 1
+        
+        result = aggregator.result()
+        parsed = run.stage('parse')
+        result.update({
+            'record_count': parsed.records_in,
+            'invalid_count': sum(run.error_counts.values()),
+            'errors': {'by_reason': dict(run.error_counts), 'samples': run.error_samples},
+            'stages': {name: stage.to_dict() for name, stage in run.stages.items()}
+        })
+        return result
+    
+    def iter_chunks(self, items: Iterable, run: ProcessingRun, prefetch: bool = True,
+                    enrich: bool = True) -> Iterator[RecordChunk]:
+        """產生已驗證、正規化並計算碳排放的記錄段；enrich=False 時不計算碳排放"""
+        chunks = self._stage('parse', self._parse, self._batched(items), run)
+        if prefetch:
+            chunks = self._prefetch(chunks, run.stage('parse'))
+        chunks = self._stage('validate', lambda chunk: self._validate(chunk, run), chunks, run)
+        chunks = self._stage('normalize', lambda chunk: self._normalize(chunk, run), chunks, run)
+        if not enrich:
+            return chunks
+        return self._stage('enrich', self._enrich, chunks, run)
+    
+    def _batched(self, items: Iterable) -> Iterator[List[Tuple[int, object]]]:
+        batch = []
+        for index, item in enumerate(items):
+            batch.append((index, item))
+            if len(batch) >= self.chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    @staticmethod
+    def _stage(name: str, function: Callable, chunks: Iterator, run: ProcessingRun) -> Iterator:
+        """以 function 處理每一段並記錄處理量；空段不往下游傳遞"""
+        stats = run.stage(name)
+        for chunk in chunks:
+            start = time.perf_counter()
+            output = function(chunk)
+            elapsed = time.perf_counter() - start
+            metrics.record('pipeline', name, elapsed)
+            stats.seconds += elapsed
+            stats.records_in += len(chunk)
+            stats.records_out += len(output)
+            stats.chunks += 1
+            if len(output):
+                yield output
+    
+    def _prefetch(self, chunks: Iterator, stats: StageStats) -> Iterator:
+        """在背景執行緒執行上游，經由有上限的佇列交給下游"""
+        buffer: 'queue.Queue' = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        done = object()
+        
+        def put(item) -> bool:
+            """佇列已滿時等待，下游已停止時放棄；回傳是否已放入"""
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            try:
+                for chunk in chunks:
+                    start = time.perf_counter()
+                    delivered = put(chunk)
+                    stats.blocked_seconds += time.perf_counter() - start
+                    if not delivered:
+                        return
+                put(done)
+            except Exception as e:
+                put(e)
+        
+        worker = threading.Thread(target=produce, name='data-processor-parse', daemon=True)
+        worker.start()
+        try:
+            while True:
+                item = buffer.get()
+                if item is done:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+    
+    def _parse(self, batch: List[Tuple[int, object]]) -> List[Tuple[int, object]]:
+        """解析 NDJSON 行；整段的行先合併為一個 JSON 陣列一次解析，失敗時才逐行解析"""
+        lines = [(index, item.strip()) for index, item in batch if isinstance(item, (bytes, str))]
+        lines = [(index, line) for index, line in lines if line]
+        if not lines:
+            return [(index, item) for index, item in batch if not isinstance(item, (bytes, str))]
+        
+        decoded = None
+        if all(isinstance(line, bytes) for _, line in lines):
+            decoded = self._decode_all(b'[' + b','.join(line for _, line in lines) + b']', len(lines))
+        elif all(isinstance(line, str) for _, line in lines):
+            decoded = self._decode_all('[' + ','.join(line for _, line in lines) + ']', len(lines))
+        if decoded is None:
+            decoded = [self._decode(line) for _, line in lines]
+        
+        parsed = dict(zip((index for index, _ in lines), decoded))
+        return [
+            (index, parsed[index] if isinstance(item, (bytes, str)) else item)
+            for index, item in batch if index in parsed or not isinstance(item, (bytes, str))
+        ]
+    
+    @staticmethod
+    def _decode_all(document, count: int) -> Optional[List]:
+        try:
+            decoded = json.loads(document)
+        except ValueError:
+            return None
+        # 某一行包含多個以逗號分隔的值時，解析結果的數量會不同
+        return decoded if len(decoded) == count else None
+    
+    @staticmethod
+    def _decode(line):
+        try:
+            return json.loads(line)
+        except ValueError as e:
+            return InvalidRecord('json', f'無效的 JSON: {e}')
+    
+    def _validate(self, batch: List[Tuple[int, object]], run: ProcessingRun) -> List[Tuple[int, Dict, str, Optional[str], float]]:
+        """檢查類型與數值欄位，解析時間；回傳 (索引, 記錄, 類別, 子類型, 時間)"""
+        valid = []
+        for index, record in batch:
+            try:
+                if isinstance(record, InvalidRecord):
+                    raise record
+                if not isinstance(record, dict):
+                    raise InvalidRecord('format', '記錄必須是 JSON 物件')
+                category, subtype = self._resolve_type(record)
+                for name in NUMERIC_FIELDS:
+                    value = record.get(name)
+                    if value is None:
+                        continue
+                    if isinstance(value, bool) or not isinstance(value, (int, float)) \
+                            or not math.isfinite(value) or value < 0:
+                        raise InvalidRecord('value', f'{name} 必須是非負數')
+                passengers = self._passengers(record)
+                if passengers is not None and (isinstance(passengers, bool) or not isinstance(passengers, (int, float))
+                                               or passengers <= 0):
+                    raise InvalidRecord('value', 'passengers 必須大於 0')
+                valid.append((index, record, category, subtype))
+            except InvalidRecord as e:
+                run.reject(index, e.reason, str(e))
+        
+        timestamps = self._timestamps([self._timestamp_value(record) for _, record, _, _ in valid])
+        accepted = []
+        for (index, record, category, subtype), timestamp in zip(valid, timestamps):
+            if timestamp is None:
+                run.reject(index, 'timestamp', '無效的時間格式')
+                continue
+            accepted.append((index, record, category, subtype, timestamp))
+        return accepted
+    
+    @staticmethod
+    def _resolve_type(record: Dict) -> Tuple[str, Optional[str]]:
+        record_type = record.get('type')
+        if record_type in CATEGORY_CODES and record_type != 'other':
+            return record_type, None
+        if record_type in TRANSPORT_TYPES:
+            # 後端移動記錄（Movement）
+            return 'transportation', record_type
+        if record_type in TYPE_ALIASES:
+            return TYPE_ALIASES[record_type]
+        if record.get('carbon_footprint') is not None:
+            return 'other', None
+        raise InvalidRecord('type', f'未知的活動類型: {record_type}')
+    
+    @staticmethod
+    def _passengers(record: Dict):
+        return record.get('passengers', (record.get('metadata') or {}).get('passengers'))
+    
+    @staticmethod
+    def _timestamp_value(record: Dict):
+        value = record.get('timestamp', record.get('date'))
+        if value is None:
+            value = (record.get('startLocation') or {}).get('timestamp')
+        return value
+    
+    @staticmethod
+    def _timestamps(values: List) -> List[Optional[float]]:
+        """解析時間（未提供為 nan、無法解析為 None）；整段一次解析，失敗時才逐筆處理"""
+        present = [value for value in values if value is not None]
+        try:
+            parsed = iter(parse_timestamps(present).tolist()) if present else iter(())
+            return [next(parsed) if value is not None else math.nan for value in values]
+        except (ValueError, TypeError, AttributeError):
+            pass
+        result = []
+        for value in values:
+            if value is None:
+                result.append(math.nan)
+                continue
+            try:
+                result.append(float(parse_timestamps([value])[0]))
+            except (ValueError, TypeError, AttributeError):
+                result.append(None)
+        return result
+    
+    def _normalize(self, batch: List[Tuple], run: ProcessingRun) -> RecordChunk:
+        """統一欄位名稱並換算單位（km、kWh、kg）"""
+        index, records, categories, timestamps, distances, transport_types = [], [], [], [], [], []
+        for position, record, category, subtype, timestamp in batch:
+            try:
+                normalized, distance, transport_type = self._normalize_record(record, category, subtype)
+            except InvalidRecord as e:
+                run.reject(position, e.reason, str(e))
+                continue
+            index.append(position)
+            records.append(normalized)
+            categories.append(CATEGORY_CODES[category])
+            timestamps.append(timestamp)
+            distances.append(distance)
+            transport_types.append(transport_type)
+        return RecordChunk(
+            index=np.array(index, dtype=np.int64),
+            records=records,
+            category=np.array(categories, dtype=np.int64),
+            timestamp=np.array(timestamps, dtype=np.float64),
+            distance=np.array(distances, dtype=np.float64),
+            transport_type=transport_types
+        )
+    
+    def _normalize_record(self, record: Dict, category: str, subtype: Optional[str]) -> Tuple[Dict, float, Optional[str]]:
+        normalized = {'type': category}
+        record_id = record.get('id', record.get('_id'))
+        if record_id is not None:
+            normalized['id'] = record_id
+        user_id = record.get('user_id', record.get('userId'))
+        if user_id is not None:
+            normalized['user_id'] = user_id
+        if record.get('carbon_footprint') is not None:
+            normalized['carbon_footprint'] = float(record['carbon_footprint'])
+        distance = 0.0
+        transport_type = None
+        
+        if category == 'transportation':
+            metadata = record.get('metadata') or {}
+            transport_type = subtype or record.get('transport_type') or 'unknown'
+            unit = str(record.get('distance_unit', record.get('unit', 'km'))).lower()
+            if unit not in DISTANCE_UNITS:
+                raise InvalidRecord('unit', f'不支援的距離單位: {unit}')
+            distance = float(record.get('distance') or 0) * DISTANCE_UNITS[unit]
+            normalized.update({
+                'transport_type': transport_type,
+                'distance': distance,
+                'passengers': self._passengers(record) or 1,
+                'vehicle_type': record.get('vehicle_type') or metadata.get('fuelType') or 'gasoline',
+                'mode': record.get('mode') or metadata.get('vehicleType') or 'bus',
+                'flight_type': record.get('flight_type', 'domestic')
+            })
+        
+        elif category == 'energy':
+            energy_type = subtype or record.get('energy_type') or record.get('subtype') or 'electricity'
+            consumption = float(record.get('consumption', record.get('amount')) or 0)
+            if energy_type == 'electricity':
+                unit = str(record.get('unit', 'kwh')).lower()
+                if unit not in ENERGY_UNITS:
+                    raise InvalidRecord('unit', f'不支援的電力單位: {unit}')
+                consumption *= ENERGY_UNITS[unit]
+            normalized.update({'energy_type': energy_type, 'consumption': consumption})
+        
+        elif category == 'food':
+            items = []
+            for item in record.get('items') or []:
+                unit = str(item.get('unit', 'kg')).lower()
+                if unit not in WEIGHT_UNITS:
+                    raise InvalidRecord('unit', f'不支援的重量單位: {unit}')
+                items.append({'type': item.get('type', ''), 'weight': float(item.get('weight') or 0) * WEIGHT_UNITS[unit]})
+            normalized['items'] = items
+        
+        elif category == 'shopping':
+            items = []
+            for item in record.get('items') or []:
+                price, quantity = item.get('price', 0), item.get('quantity', 1)
+                if isinstance(price, bool) or not isinstance(price, (int, float)) \
+                        or isinstance(quantity, bool) or not isinstance(quantity, (int, float)):
+                    raise InvalidRecord('value', '商品的 price 與 quantity 必須是數字')
+                items.append({'category': str(item.get('category', 'other')), 'price': float(price),
+                              'quantity': float(quantity)})
+            normalized['total_amount'] = float(record.get('total_amount', record.get('amount')) or 0)
+            normalized['items'] = items
+        
+        return normalized, distance, transport_type
+    
+    def _enrich(self, chunk: RecordChunk) -> RecordChunk:
+        chunk.emission = self.compute_emissions(chunk)
+        return chunk
+    
+    def compute_emissions(self, chunk: RecordChunk, calculator: Optional[CarbonCalculator] = None,
+                          keep_provided: bool = True) -> np.ndarray:
+        """以 calculator 的係數計算整段記錄的碳排放（未四捨五入）
+        
+        各類別分別以批次方法一次計算；keep_provided=True 時已提供 carbon_footprint 的記錄沿用該值。
+        """
+        calculator = calculator or self.carbon_calculator
+        records = chunk.records
+        emission = np.zeros(len(chunk))
+        if keep_provided:
+            provided = np.array(['carbon_footprint' in record for record in records], dtype=bool)
+            emission[provided] = [records[i]['carbon_footprint'] for i in np.flatnonzero(provided)]
+        else:
+            provided = np.zeros(len(chunk), dtype=bool)
+        
+        rows = np.flatnonzero((chunk.category == CATEGORY_CODES['transportation']) & ~provided)
+        if len(rows):
+            emission[rows] = calculator.calculate_transportation_batch(
+                [records[i]['transport_type'] for i in rows],
+                chunk.distance[rows],
+                passengers=[records[i]['passengers'] for i in rows],
+                vehicle_types=[records[i]['vehicle_type'] for i in rows],
+                modes=[records[i]['mode'] for i in rows],
+                flight_types=[records[i]['flight_type'] for i in rows]
+            )
+        
+        rows = np.flatnonzero((chunk.category == CATEGORY_CODES['energy']) & ~provided)
+        if len(rows):
+            emission[rows] = calculator.calculate_energy_batch(
+                [records[i]['energy_type'] for i in rows],
+                [records[i]['consumption'] for i in rows]
+            )
+        
+        rows = np.flatnonzero((chunk.category == CATEGORY_CODES['food']) & ~provided)
+        if len(rows):
+            items = [(k, item) for k, i in enumerate(rows) for item in records[i]['items']]
+            emission[rows] = calculator.calculate_food_batch(
+                [k for k, _ in items], [item['type'] for _, item in items],
+                [item['weight'] for _, item in items], len(rows)
+            )
+        
+        rows = np.flatnonzero((chunk.category == CATEGORY_CODES['shopping']) & ~provided)
+        if len(rows):
+            items = [(k, item) for k, i in enumerate(rows) for item in records[i]['items']]
+            emission[rows] = calculator.calculate_shopping_batch(
+                [k for k, _ in items], [item['category'] for _, item in items],
+                [item['price'] for _, item in items], [item['quantity'] for _, item in items],
+                [records[i]['total_amount'] for i in rows], [bool(records[i]['items']) for i in rows]
+            )
+        
+        return emission
+
+class Aggregator:
+    """累計各類別、每日與各交通方式的碳排放；記憶體用量只與天數有關"""
+    
+    def __init__(self, utc_offset: float = 8.0):
+        self.utc_offset = utc_offset
+        self.category_emission = np.zeros(len(CATEGORIES))
+        self.category_count = np.zeros(len(CATEGORIES), dtype=np.int64)
+        self.transport_distance: Dict[str, float] = {}
+        self.transport_emission: Dict[str, float] = {}
+        self.daily: Dict[int, List[float]] = {}
+        self.undated_count = 0
+    
+    def add(self, chunk: RecordChunk):
+        self.category_emission += np.bincount(chunk.category, weights=chunk.emission, minlength=len(CATEGORIES))
+        self.category_count += np.bincount(chunk.category, minlength=len(CATEGORIES))
+        
+        transport = np.flatnonzero(chunk.category == CATEGORY_CODES['transportation'])
+        if len(transport):
+            types = np.array([chunk.transport_type[i] for i in transport])
+            names, inverse = np.unique(types, return_inverse=True)
+            distance = np.bincount(inverse, weights=chunk.distance[transport], minlength=len(names))
+            emission = np.bincount(inverse, weights=chunk.emission[transport], minlength=len(names))
+            for name, value, carbon in zip(names.tolist(), distance.tolist(), emission.tolist()):
+                self.transport_distance[name] = self.transport_distance.get(name, 0.0) + value
+                self.transport_emission[name] = self.transport_emission.get(name, 0.0) + carbon
+        
+        dated = np.isfinite(chunk.timestamp)
+        self.undated_count += int((~dated).sum())
+        if dated.any():
+            days = ((chunk.timestamp[dated] + self.utc_offset * 3600) // 86400).astype(np.int64)
+            unique_days, inverse = np.unique(days, return_inverse=True)
+            emission = np.bincount(inverse, weights=chunk.emission[dated])
+            count = np.bincount(inverse)
+            for day, value, number in zip(unique_days.tolist(), emission.tolist(), count.tolist()):
+                totals = self.daily.setdefault(day, [0.0, 0])
+                totals[0] += value
+                totals[1] += number
+    
+    def result(self) -> Dict:
+        days = sorted(self.daily)
+        daily = [
+            {'date': str(np.datetime64(day, 'D')), 'emission': round(self.daily[day][0], 3),
+             'count': self.daily[day][1]}
+            for day in days
+        ]
+        monthly: Dict[str, List[float]] = {}
+        for item in daily:
+            totals = monthly.setdefault(item['date'][:7], [0.0, 0])
+            totals[0] += item['emission']
+            totals[1] += item['count']
+        
+        return {
+            'processed_count': int(self.category_count.sum()),
+            'total_emission': round(float(self.category_emission.sum()), 3),
+            'breakdown': {
+                name: {'emission': round(float(self.category_emission[code]), 3),
+                       'count': int(self.category_count[code])}
+                for code, name in enumerate(CATEGORIES) if self.category_count[code]
+            },
+            'transportation': {
+                name: {'distance': round(self.transport_distance[name], 3),
+                       'emission': round(self.transport_emission[name], 3)}
+                for name in sorted(self.transport_distance)
+            },
+            'daily': daily,
+            'monthly': [{'month': month, 'emission': round(value, 3), 'count': count}
+                        for month, (value, count) in sorted(monthly.items())],
+            'undated_count': self.undated_count
+        }
@@ -0,0 +1,401 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('transportation', 'energy', 'food', 'shopping')
+SHOPPING_PREFIX = 'shopping_'
+
+# 係數檔格式：MAGIC、8 位元組標頭長度、JSON 標頭，之後為各欄位連續存放的陣列
+MAGIC = b'CFACTOR1'
+ALIGNMENT = 64
+COLUMNS = (
+    ('factor', '<f8'),
+    ('reliability', '<f8'),
+    ('unit', '<u2'),
+    ('source', '<u2'),
+    ('category', '<u1')
+)
+
+@dataclass
+class EmissionFactor:
+    """碳排放係數數據類"""
+    activity: str
+    factor: float  # kg CO2 per unit
+    unit: str
+    source: str
+    reliability: float  # 0-1, 數據可靠性
+
+# (活動, 係數, 單位, 來源, 可靠性, 類別)
+DEFAULT_FACTORS = [
+    # 交通運輸
+    ('walking', 0.0, 'km', 'IPCC', 1.0, 'transportation'),
+    ('cycling', 0.0, 'km', 'IPCC', 1.0, 'transportation'),
+    ('driving_gasoline', 0.192, 'km', 'EPA', 0.9, 'transportation'),
+    ('driving_diesel', 0.171, 'km', 'EPA', 0.9, 'transportation'),
+    ('driving_electric', 0.053, 'km', 'EPA', 0.8, 'transportation'),
+    ('bus', 0.089, 'km', 'IPCC', 0.9, 'transportation'),
+    ('train', 0.041, 'km', 'IPCC', 0.9, 'transportation'),
+    ('metro', 0.041, 'km', 'IPCC', 0.9, 'transportation'),
+    ('flight_domestic', 0.285, 'km', 'IPCC', 0.9, 'transportation'),
+    ('flight_international', 0.255, 'km', 'IPCC', 0.9, 'transportation'),
+    
+    # 能源使用
+    ('electricity_taiwan', 0.509, 'kWh', '台電', 0.95, 'energy'),
+    ('natural_gas', 1.96, 'm³', 'IPCC', 0.9, 'energy'),
+    ('lpg', 1.51, 'kg', 'IPCC', 0.9, 'energy'),
+    
+    # 食物 (kg CO2 per kg)
+    ('beef', 27.0, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('pork', 12.1, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('chicken', 6.9, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('fish', 5.1, 'kg', 'Poore & Nemecek', 0.8, 'food'),
+    ('dairy', 3.2, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('eggs', 4.2, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('rice', 2.7, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('wheat', 1.4, 'kg', 'Poore & Nemecek', 0.9, 'food'),
+    ('vegetables', 0.4, 'kg', 'Poore & Nemecek', 0.8, 'food'),
+    ('fruits', 0.4, 'kg', 'Poore & Nemecek', 0.8, 'food'),
+    ('nuts', 0.3, 'kg', 'Poore & Nemecek', 0.8, 'food'),
+    ('legumes', 0.6, 'kg', 'Poore & Nemecek', 0.8, 'food'),
+    
+    # 商品類別 (kg CO2 per NT$ 100)
+    ('shopping_food', 0.8, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_clothing', 1.2, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_electronics', 2.5, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_home', 1.5, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_health', 1.0, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_beauty', 1.8, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_sports', 1.3, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_books', 0.6, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_toys', 1.4, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_automotive', 3.0, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_garden', 0.9, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_office', 1.1, 'NT$100', 'estimate', 0.6, 'shopping'),
+    ('shopping_other', 1.0, 'NT$100', 'estimate', 0.6, 'shopping'),
+]
+DEFAULT_VERSION = 'builtin'
+
+class FactorSnapshot:
+    """單一版本的排放係數表
+    
+    活動以整數 ID（在 activities 中的位置）表示，係數、單位、來源、可靠性與類別各為
+    一個陣列，查詢係數為一次陣列索引。快照建立後不再修改；由檔案載入時各欄位為唯讀的
+    memory map，所有 worker 共用作業系統的同一份頁面快取。
+    """
+    
+    def __init__(self, activities: Iterable[str], factor, unit, source, reliability, category,
+                 units: Iterable[str], sources: Iterable[str], version: str = DEFAULT_VERSION,
+                 valid_from: Optional[float] = None):
+        self.activities = tuple(activities)
+        self.ids = {name: i for i, name in enumerate(self.activities)}
+        self.factor = np.asarray(factor, dtype=np.float64)
+        self.reliability = np.asarray(reliability, dtype=np.float64)
+        self.unit = np.asarray(unit, dtype=np.uint16)
+        self.source = np.asarray(source, dtype=np.uint16)
+        self.category = np.asarray(category, dtype=np.uint8)
+        for column in (self.factor, self.reliability, self.unit, self.source, self.category):
+            column.flags.writeable = False
+        self.units = tuple(units)
+        self.sources = tuple(sources)
+        self.version = version
+        # 生效時間（Unix 秒）；None 表示沒有起始時間
+        self.valid_from = valid_from
+        # 由係數衍生的查詢表（例如交通係數矩陣），每個版本只建立一次
+        self._derived: Dict[str, object] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.activities)
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self.ids
+    
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple], version: str = DEFAULT_VERSION,
+                     valid_from: Optional[float] = None) -> 'FactorSnapshot':
+        """由 (活動, 係數, 單位, 來源, 可靠性, 類別) 列表建立快照"""
+        records = list(records)
+        units = sorted({record[2] for record in records})
+        sources = sorted({record[3] for record in records})
+        unit_codes = {name: i for i, name in enumerate(units)}
+        source_codes = {name: i for i, name in enumerate(sources)}
+        category_codes = {name: i for i, name in enumerate(CATEGORIES)}
+        return cls(
+            [record[0] for record in records],
+            [record[1] for record in records],
+            [unit_codes[record[2]] for record in records],
+            [source_codes[record[3]] for record in records],
+            [record[4] for record in records],
+            [category_codes[record[5]] for record in records],
+            units, sources, version, valid_from
+        )
+    
+    def to_records(self) -> List[Tuple]:
+        return [
+            (name, float(self.factor[i]), self.units[self.unit[i]], self.sources[self.source[i]],
+             float(self.reliability[i]), CATEGORIES[self.category[i]])
+            for i, name in enumerate(self.activities)
+        ]
+    
+    def with_factors(self, updates: Dict[str, object], version: str,
+                     valid_from: Optional[float] = None) -> 'FactorSnapshot':
+        """建立更新部分係數的新版本
+        
+        updates 的值可為係數，或含 factor / unit / source / reliability / category 的字典；
+        不存在的活動會新增（字典須提供 category）。
+        """
+        records = {record[0]: record for record in self.to_records()}
+        for name, update in updates.items():
+            if not isinstance(update, dict):
+                update = {'factor': update}
+            current = records.get(name, (name, 0.0, '', '', 1.0, None))
+            records[name] = (
+                name,
+                float(update.get('factor', current[1])),
+                update.get('unit', current[2]),
+                update.get('source', current[3]),
+                float(update.get('reliability', current[4])),
+                update.get('category', current[5])
+            )
+            if records[name][5] not in CATEGORIES:
+                raise ValueError(f'未知的係數類別: {name}')
+        return FactorSnapshot.from_records(records.values(), version, valid_from)
+    
+    def id_of(self, name: str) -> int:
+        """活動 ID；不存在時為 -1"""
+        return self.ids.get(name, -1)
+    
+    def encode(self, names) -> np.ndarray:
+        """將活動名稱陣列編碼為 ID（不存在的為 -1），每個不同的名稱只查詢一次"""
+        unique, inverse = np.unique(np.asarray(names, dtype=str), return_inverse=True)
+        codes = np.array([self.ids.get(name, -1) for name in unique.tolist()], dtype=np.int64)
+        return codes[inverse]
+    
+    def factor_of(self, name: str) -> float:
+        """活動的係數；不存在時拋出 KeyError"""
+        return float(self.factor[self.ids[name]])
+    
+    def value(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        i = self.ids.get(name)
+        return default if i is None else float(self.factor[i])
+    
+    def get(self, name: str) -> Optional[EmissionFactor]:
+        i = self.ids.get(name)
+        if i is None:
+            return None
+        return EmissionFactor(name, float(self.factor[i]), self.units[self.unit[i]],
+                              self.sources[self.source[i]], float(self.reliability[i]))
+    
+    def names(self, category: str) -> List[str]:
+        code = CATEGORIES.index(category)
+        return [self.activities[i] for i in np.flatnonzero(self.category == code)]
+    
+    def derived(self, key: str, builder: Callable[['FactorSnapshot'], object]):
+        """取得由此版本係數衍生的物件，第一次使用時以 builder(snapshot) 建立"""
+        value = self._derived.get(key)
+        if value is None:
+            with self._lock:
+                value = self._derived.get(key)
+                if value is None:
+                    value = builder(self)
+                    self._derived[key] = value
+        return value
+    
+    def describe(self) -> Dict:
+        return {
+            'version': self.version,
+            'valid_from': self.valid_from,
+            'factor_count': len(self)
+        }
+    
+    def save(self, path: str):
+        """寫入係數檔；先寫入暫存檔再替換，讀取中的 worker 不會看到寫到一半的檔案"""
+        columns = [(name, np.ascontiguousarray(getattr(self, name), dtype=dtype)) for name, dtype in COLUMNS]
+        header = {
+            'version': self.version,
+            'valid_from': self.valid_from,
+            'activities': list(self.activities),
+            'units': list(self.units),
+            'sources': list(self.sources),
+            'count': len(self),
+            'columns': {}
+        }
+        # 欄位位移相對於標頭之後、對齊 ALIGNMENT 的資料起點
+        offset = 0
+        for name, values in columns:
+            header['columns'][name] = [values.dtype.str, offset]
+            offset += -(-values.nbytes // ALIGNMENT) * ALIGNMENT
+        encoded = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        data_start = -(-(len(MAGIC) + 8 + len(encoded)) // ALIGNMENT) * ALIGNMENT
+        
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(MAGIC)
+            file.write(len(encoded).to_bytes(8, 'little'))
+            file.write(encoded)
+            for name, values in columns:
+                file.seek(data_start + header['columns'][name][1])
+                file.write(values.tobytes())
+            file.truncate(data_start + offset)
+        os.replace(temporary, path)
+    
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'FactorSnapshot':
+        """載入係數檔；mmap=True 時各欄位為唯讀 memory map"""
+        with open(path, 'rb') as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'無效的係數檔: {path}')
+            length = int.from_bytes(file.read(8), 'little')
+            header = json.loads(file.read(length).decode('utf-8'))
+        data_start = -(-(len(MAGIC) + 8 + length) // ALIGNMENT) * ALIGNMENT
+        
+        count = header['count']
+        columns = {}
+        for name, (dtype, offset) in header['columns'].items():
+            if mmap and count:
+                columns[name] = np.memmap(path, dtype=np.dtype(dtype), mode='r', offset=data_start + offset,
+                                          shape=(count,))
+            else:
+                columns[name] = np.fromfile(path, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+        return cls(header['activities'], columns['factor'], columns['unit'], columns['source'],
+                   columns['reliability'], columns['category'], header['units'], header['sources'],
+                   header['version'], header['valid_from'])
+
+class FactorTimeline:
+    """依生效時間排列的係數版本
+    
+    每個時間點使用生效時間不晚於該時間的最後一個版本；早於所有生效時間的記錄使用
+    最早的版本。沒有生效時間的版本視為一直有效。
+    """
+    
+    def __init__(self, entries: Iterable[Tuple[Optional[float], FactorSnapshot]]):
+        entries = sorted(((-np.inf if start is None else float(start), snapshot) for start, snapshot in entries),
+                         key=lambda entry: entry[0])
+        if not entries:
+            raise ValueError('係數時間軸至少需要一個版本')
+        self.starts = np.array([start for start, _ in entries])
+        self.snapshots = [snapshot for _, snapshot in entries]
+    
+    def __len__(self) -> int:
+        return len(self.snapshots)
+    
+    def locate(self, timestamps) -> np.ndarray:
+        """各時間點（Unix 秒）生效的版本位置"""
+        positions = np.searchsorted(self.starts, np.asarray(timestamps, dtype=np.float64), side='right') - 1
+        return np.maximum(positions, 0)
+    
+    def describe(self) -> List[Dict]:
+        return [
+            {'version': snapshot.version, 'valid_from': None if np.isinf(start) else float(start)}
+            for start, snapshot in zip(self.starts.tolist(), self.snapshots)
+        ]
+
+class FactorRegistry:
+    """排放係數登錄表
+    
+    保存所有已發布的版本，current 為目前使用中的版本。發布新版本只替換一個參照，
+    計算中的請求繼續使用開始時取得的版本。由檔案載入時每 check_interval 秒檢查一次
+    檔案是否被替換（例如每年的台電電力係數更新），不需重新啟動服務。
+    """
+    
+    def __init__(self, snapshot: Optional[FactorSnapshot] = None, path: Optional[str] = None,
+                 check_interval: float = 30.0):
+        self.lock = threading.Lock()
+        self.snapshots: Dict[str, FactorSnapshot] = {}
+        self._current: Optional[FactorSnapshot] = None
+        self.path = path
+        self.check_interval = check_interval
+        self._file_state = None
+        self._checked_at = 0.0
+        self.metrics = {'reloads': 0, 'reload_errors': 0}
+        
+        if path:
+            self.load(path)
+        else:
+            snapshot = snapshot or FactorSnapshot.from_records(DEFAULT_FACTORS)
+            self.snapshots[snapshot.version] = snapshot
+            self._current = snapshot
+    
+    @property
+    def current(self) -> FactorSnapshot:
+        if self.path and time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload_if_changed()
+        return self._current
+    
+    def publish(self, snapshot: FactorSnapshot, activate: bool = True) -> FactorSnapshot:
+        """加入版本；activate=True 時設為目前使用的版本"""
+        with self.lock:
+            self.snapshots[snapshot.version] = snapshot
+            if activate or self._current is None:
+                self._current = snapshot
+        logger.info(f"排放係數版本 {snapshot.version}（{len(snapshot)} 項）已發布")
+        return snapshot
+    
+    def activate(self, version: str) -> FactorSnapshot:
+        """切換為已發布的版本"""
+        with self.lock:
+            self._current = self.snapshots[version]
+        return self._current
+    
+    def version(self, version: str) -> FactorSnapshot:
+        return self.snapshots[version]
+    
+    def versions(self) -> List[Dict]:
+        with self.lock:
+            current = self._current
+            return [dict(snapshot.describe(), active=snapshot is current) for snapshot in self.snapshots.values()]
+    
+    def timeline(self) -> FactorTimeline:
+        """所有已發布版本依各自生效時間排列的時間軸"""
+        with self.lock:
+            return FactorTimeline((snapshot.valid_from, snapshot) for snapshot in self.snapshots.values())
+    
+    def load(self, path: str, activate: bool = True) -> FactorSnapshot:
+        """由係數檔載入並發布版本"""
+        state = self._stat(path)
+        snapshot = self.publish(FactorSnapshot.load(path), activate)
+        self.path = path
+        self._file_state = state
+        self._checked_at = time.monotonic()
+        return snapshot
+    
+    def reload_if_changed(self) -> bool:
+        """係數檔被替換時重新載入；載入失敗時保留目前的版本"""
+        self._checked_at = time.monotonic()
+        try:
+            state = self._stat(self.path)
+            if state == self._file_state:
+                return False
+            self.load(self.path)
+            self.metrics['reloads'] += 1
+            return True
+        except Exception as e:
+            self.metrics['reload_errors'] += 1
+            logger.error(f"排放係數重新載入失敗: {e}")
+            return False
+    
+    @staticmethod
+    def _stat(path: str) -> Tuple[int, int, int]:
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+_default_registry: Optional[FactorRegistry] = None
+_default_lock = threading.Lock()
+
+def default_registry() -> FactorRegistry:
+    """行程共用的登錄表；設定 EMISSION_FACTORS_PATH 時由該係數檔載入"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                path = os.environ.get('EMISSION_FACTORS_PATH')
+                _default_registry = FactorRegistry(path=path or None)
+    return _default_registry
@@ -0,0 +1,58 @@
+import os
+import random
+import time
+from typing import List, Optional
+
+# 離線測試用的 Google Vision API 替身，介面與 google.cloud.vision 相同的子集：
+# vision.Image(content=...) 與 ImageAnnotatorClient().text_detection(image=...)
+# 以 GOOGLE_VISION_BACKEND=fake 啟用時，延遲由 FAKE_VISION_LATENCY_MS（平均）與
+# FAKE_VISION_JITTER_MS（均勻分布的上下浮動）設定，用於容量規劃與壓力測試
+
+DEFAULT_TEXT = (
+    '全聯福利中心\n'
+    '2024-01-15\n'
+    '有機蔬菜 120\n'
+    '鮮奶 65\n'
+    '雞蛋 100\n'
+    '總計: 285'
+)
+
+class Image:
+    """對應 vision.Image"""
+    
+    def __init__(self, content: bytes = b''):
+        self.content = content
+
+class _Error:
+    def __init__(self, message: str = ''):
+        self.message = message
+
+class _TextAnnotation:
+    def __init__(self, description: str):
+        self.description = description
+
+class _Response:
+    def __init__(self, text: str, error_message: str = ''):
+        self.error = _Error(error_message)
+        self.text_annotations: List[_TextAnnotation] = [_TextAnnotation(text)] if text else []
+
+class ImageAnnotatorClient:
+    """對應 vision.ImageAnnotatorClient，回傳固定文字並可模擬延遲與錯誤"""
+    
+    def __init__(self, text: str = DEFAULT_TEXT, latency: Optional[float] = None, jitter: Optional[float] = None,
+                 error_message: Optional[str] = None):
+        self.text = text
+        # 秒；未指定時讀取環境變數
+        self.latency = float(os.environ.get('FAKE_VISION_LATENCY_MS', 0)) / 1000 if latency is None else latency
+        self.jitter = float(os.environ.get('FAKE_VISION_JITTER_MS', 0)) / 1000 if jitter is None else jitter
+        self.error_message = error_message or ''
+        self.call_count = 0
+    
+    def text_detection(self, image: Image = None) -> _Response:
+        self.call_count += 1
+        delay = self.latency + (random.uniform(-self.jitter, self.jitter) if self.jitter > 0 else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_message:
+            return _Response('', self.error_message)
+        return _Response(self.text)
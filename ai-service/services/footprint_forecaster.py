@@ -0,0 +1,400 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.movement_analyzer import local_day
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = {'week': 7, 'month': 30, 'quarter': 90}
+MODELS = ('auto', 'seasonal_naive', 'ets', 'gbm')
+SEASON = 7
+# 指數平滑的參數網格：所有用戶同時以每組參數跑一次，各自選出一步預測誤差最小的組合
+ALPHAS = (0.02, 0.05, 0.1, 0.2, 0.3, 0.5)
+GAMMAS = (0.0, 0.05, 0.1, 0.2)
+# 80% 預測區間
+INTERVAL_Z = 1.2816
+GBM_LAGS = (1, 2, 7, 14)
+GBM_WINDOW = 14
+
+def _nanmean(values: np.ndarray, axis: int = 1) -> np.ndarray:
+    """忽略 nan 的平均；整列都是 nan 時為 nan
+    
+    以 nansum / 非 nan 個數計算，不發出警告，也不需改動整個行程共用的警告過濾設定。
+    """
+    counts = np.count_nonzero(~np.isnan(values), axis=axis)
+    totals = np.nansum(values, axis=axis)
+    return np.divide(totals, counts, out=np.full(totals.shape, np.nan), where=counts > 0)
+
+def _load_gbm():
+    """梯度提升模型：優先使用 scikit-learn，未安裝時使用 xgboost（兩者皆可處理 nan 特徵）"""
+    try:
+        from sklearn.ensemble import HistGradientBoostingRegressor
+        return HistGradientBoostingRegressor(max_iter=200, learning_rate=0.1, random_state=0)
+    except ImportError:
+        pass
+    try:
+        from xgboost import XGBRegressor
+        return XGBRegressor(n_estimators=200, max_depth=6, learning_rate=0.1, random_state=0)
+    except ImportError:
+        raise ValueError('GBM 模型需要安裝 scikit-learn 或 xgboost')
+
+def gbm_features(history: np.ndarray, dow: np.ndarray) -> np.ndarray:
+    """由前 GBM_WINDOW 天（最後一欄為前一天，無記錄為 nan）建立延遲、7 日平均與星期特徵"""
+    lags = [history[:, -lag] for lag in GBM_LAGS]
+    return np.column_stack(lags + [_nanmean(history[:, -SEASON:]), dow])
+
+@dataclass
+class SeriesModel:
+    """單一用戶已擬合的模型狀態，新的日資料只需從 last_day 之後接續更新"""
+    alpha: float
+    gamma: float
+    level: float
+    season: np.ndarray       # 指數平滑的星期季節項（以日序號 % 7 為索引）
+    last_values: np.ndarray  # 季節性 naive：各星期最後一次的觀測值
+    ets_sse: float
+    naive_sse: float
+    ets_count: int
+    naive_count: int
+    observed: int
+    last_day: int
+    fitted_day: int          # 上次完整擬合（重新選擇參數）時的 last_day
+    checksum: float          # last_day 以前觀測值的總和，歷史被修改時重新擬合
+    recent: np.ndarray       # 最後 GBM_WINDOW 天的觀測值（無記錄為 nan），供 GBM 特徵使用
+    
+    @property
+    def model(self) -> str:
+        """自動選擇：一步預測的均方誤差較小者"""
+        if self.naive_count and self.naive_sse / self.naive_count < self.ets_sse / max(self.ets_count, 1):
+            return 'seasonal_naive'
+        return 'ets'
+
+class FootprintForecaster:
+    """每日碳足跡預測
+    
+    以星期為季節的指數平滑（ETS(A,N,A)）與季節性 naive 模型預測用戶的每日碳排放，
+    可選擇以 scikit-learn 或 xgboost 的梯度提升模型（所有用戶共用一個模型）。
+    多個用戶排成 (用戶, 日) 矩陣後以 NumPy 一次擬合，每個時間步同時更新所有用戶與所有參數組合。
+    擬合後的狀態依用戶快取；新的日資料只從上次的狀態接續更新，每 refit_every 天或歷史被修改時
+    才重新選擇參數。
+    """
+    
+    def __init__(self, rollup_store=None, refit_every: int = 28, max_history: int = 730,
+                 min_history: int = 14, utc_offset: float = 8.0):
+        self.rollup_store = rollup_store
+        self.refit_every = refit_every
+        self.max_history = max_history
+        self.min_history = min_history
+        self.utc_offset = utc_offset
+        self.models: Dict[str, SeriesModel] = {}
+        self.gbm = None
+        self.gbm_day: Optional[int] = None
+        self.lock = threading.RLock()
+        self.stats = {'full_fits': 0, 'incremental_updates': 0, 'unchanged': 0, 'fit_seconds': 0.0}
+    
+    def _day(self, value) -> int:
+        if isinstance(value, (int, np.integer)) and abs(value) < 1e6:
+            return int(value)
+        return local_day(value, self.utc_offset)
+    
+    def parse_series(self, points: Sequence) -> Tuple[np.ndarray, np.ndarray]:
+        """[{date, value}]（value 也可為 total 或 total_emission）轉為遞增的日序號與數值；同日加總"""
+        if not points:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        days = np.array([self._day(point['date']) for point in points], dtype=np.int64)
+        values = np.array([float(point.get('value', point.get('total', point.get('total_emission'))))
+                           for point in points])
+        unique_days, inverse = np.unique(days, return_inverse=True)
+        return unique_days, np.bincount(inverse, weights=values)
+    
+    def series_from_rollups(self, user_ids: Sequence[str]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        if self.rollup_store is None:
+            raise ValueError('沒有提供每日碳足跡資料')
+        return {str(user_id): self.rollup_store.daily_series(user_id) for user_id in user_ids}
+    
+    def update(self, series: Dict[str, Tuple[np.ndarray, np.ndarray]]) -> Dict:
+        """以最新的每日資料更新各用戶的模型；回傳完整擬合、增量更新與未變更的用戶數"""
+        with self.lock:
+            full, incremental, unchanged = [], [], 0
+            for user_id, (days, values) in series.items():
+                state = self.models.get(user_id)
+                if not len(days):
+                    continue
+                if state is None:
+                    full.append(user_id)
+                    continue
+                old = days <= state.last_day
+                if not np.isclose(values[old].sum(), state.checksum, rtol=0, atol=1e-6) \
+                        or days[-1] - state.fitted_day >= self.refit_every:
+                    full.append(user_id)
+                elif days[-1] > state.last_day:
+                    incremental.append(user_id)
+                else:
+                    unchanged += 1
+            
+            start = time.perf_counter()
+            if full:
+                self._fit(full, [series[user_id] for user_id in full])
+            if incremental:
+                self._advance(incremental, [series[user_id] for user_id in incremental])
+            self.stats['fit_seconds'] += time.perf_counter() - start
+            self.stats['full_fits'] += len(full)
+            self.stats['incremental_updates'] += len(incremental)
+            self.stats['unchanged'] += unchanged
+            return {'full_fits': len(full), 'incremental_updates': len(incremental), 'unchanged': unchanged}
+    
+    def _matrix(self, series: List[Tuple[np.ndarray, np.ndarray]], first: Optional[np.ndarray] = None
+                ) -> Tuple[np.ndarray, int]:
+        """排成 (用戶, 日) 矩陣，無記錄的日為 nan；first 為各用戶的起始日序號（不含之前的資料）"""
+        if first is None:
+            first = np.array([days[-1] - self.max_history + 1 for days, _ in series], dtype=np.int64)
+        day0 = int(min(max(days[0], start) for (days, _), start in zip(series, first.tolist())))
+        span = int(max(days[-1] for days, _ in series)) - day0 + 1
+        matrix = np.full((len(series), max(span, 0)), np.nan)
+        for row, ((days, values), start) in enumerate(zip(series, first.tolist())):
+            keep = days >= start
+            matrix[row, days[keep] - day0] = values[keep]
+        return matrix, day0
+    
+    @staticmethod
+    def _run_ets(matrix: np.ndarray, day0: int, alpha: np.ndarray, gamma: np.ndarray, level: np.ndarray,
+                 season: np.ndarray, skip: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """以加法指數平滑逐日更新 level (G, U) 與 season (G, U, 7)，回傳一步預測的誤差平方和與筆數
+        
+        alpha、gamma 可為 (G, 1) 網格或 (1, U) 各用戶的參數；skip 之前的誤差不計入（初始化期間）。
+        """
+        observed = ~np.isnan(matrix)
+        values = np.where(observed, matrix, 0.0)
+        sse = np.zeros(level.shape)
+        count = np.zeros(matrix.shape[0], dtype=np.int64)
+        for column in range(matrix.shape[1]):
+            mask = observed[:, column]
+            if not mask.any():
+                continue
+            dow = (day0 + column) % SEASON
+            error = np.where(mask, values[:, column] - level - season[:, :, dow], 0.0)
+            level += alpha * error
+            season[:, :, dow] += gamma * error
+            counted = mask if skip is None else mask & (column >= skip)
+            sse += np.where(counted, error * error, 0.0)
+            count += counted
+        return sse, count
+    
+    def _fit(self, user_ids: List[str], series: List[Tuple[np.ndarray, np.ndarray]]):
+        """完整擬合：所有用戶同時以參數網格跑指數平滑，各自選出誤差最小的參數"""
+        matrix, day0 = self._matrix(series)
+        users, span = matrix.shape
+        observed = ~np.isnan(matrix)
+        first = np.argmax(observed, axis=1)
+        
+        # 初始化：前 2 週的平均為 level，各星期與平均的差為季節項
+        window = first[:, None] + np.arange(2 * SEASON)
+        inside = window < span
+        initial = np.where(inside, np.take_along_axis(matrix, np.minimum(window, span - 1), axis=1), np.nan)
+        level0 = np.nan_to_num(_nanmean(initial))
+        season0 = np.zeros((users, SEASON))
+        dows = (day0 + window) % SEASON
+        deviation = np.nan_to_num(initial - level0[:, None])
+        counts = np.zeros((users, SEASON))
+        np.add.at(season0, (np.arange(users)[:, None].repeat(window.shape[1], 1), dows), deviation)
+        np.add.at(counts, (np.arange(users)[:, None].repeat(window.shape[1], 1), dows), ~np.isnan(initial))
+        season0 = np.divide(season0, counts, out=np.zeros_like(season0), where=counts > 0)
+        
+        grid = np.array([(alpha, gamma) for alpha in ALPHAS for gamma in GAMMAS])
+        level = np.repeat(level0[None, :], len(grid), axis=0)
+        season = np.repeat(season0[None, :, :], len(grid), axis=0)
+        sse, count = self._run_ets(matrix, day0, grid[:, :1], grid[:, 1:], level, season, skip=first + SEASON)
+        best = np.argmin(sse, axis=0)
+        
+        naive_sse, naive_count, last_values = self._run_naive(matrix, day0, np.full((users, SEASON), np.nan))
+        last_days = np.array([days[-1] for days, _ in series], dtype=np.int64)
+        for row, user_id in enumerate(user_ids):
+            days, values = series[row]
+            self.models[user_id] = SeriesModel(
+                alpha=float(grid[best[row], 0]),
+                gamma=float(grid[best[row], 1]),
+                level=float(level[best[row], row]),
+                season=season[best[row], row].copy(),
+                last_values=last_values[row],
+                ets_sse=float(sse[best[row], row]),
+                naive_sse=float(naive_sse[row]),
+                ets_count=int(count[row]),
+                naive_count=int(naive_count[row]),
+                observed=int(observed[row].sum()),
+                last_day=int(last_days[row]),
+                fitted_day=int(last_days[row]),
+                checksum=float(values.sum()),
+                recent=self._recent(matrix[row], day0, int(last_days[row]))
+            )
+    
+    @staticmethod
+    def _run_naive(matrix: np.ndarray, day0: int, last_values: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """季節性 naive：以上一次同星期的觀測值預測，回傳誤差平方和、筆數與各星期最後的觀測值"""
+        observed = ~np.isnan(matrix)
+        sse = np.zeros(matrix.shape[0])
+        count = np.zeros(matrix.shape[0], dtype=np.int64)
+        for column in range(matrix.shape[1]):
+            mask = observed[:, column]
+            if not mask.any():
+                continue
+            dow = (day0 + column) % SEASON
+            previous = last_values[:, dow]
+            counted = mask & ~np.isnan(previous)
+            error = np.where(counted, matrix[:, column] - np.nan_to_num(previous), 0.0)
+            sse += error * error
+            count += counted
+            last_values[:, dow] = np.where(mask, matrix[:, column], previous)
+        return sse, count, last_values
+    
+    @staticmethod
+    def _recent(row: np.ndarray, day0: int, last_day: int) -> np.ndarray:
+        end = last_day - day0 + 1
+        recent = row[max(end - GBM_WINDOW, 0):end]
+        return np.concatenate([np.full(GBM_WINDOW - len(recent), np.nan), recent])
+    
+    def _advance(self, user_ids: List[str], series: List[Tuple[np.ndarray, np.ndarray]]):
+        """增量更新：以快取的參數與狀態只處理 last_day 之後的新資料"""
+        states = [self.models[user_id] for user_id in user_ids]
+        first = np.array([state.last_day + 1 for state in states], dtype=np.int64)
+        matrix, day0 = self._matrix(series, first)
+        # 最近的 GBM 視窗需要接在新資料之前
+        previous = np.stack([state.recent for state in states])
+        level = np.array([[state.level for state in states]])
+        season = np.stack([state.season for state in states])[None, :, :].copy()
+        alpha = np.array([[state.alpha for state in states]])
+        gamma = np.array([[state.gamma for state in states]])
+        sse, count = self._run_ets(matrix, day0, alpha, gamma, level, season)
+        naive_sse, naive_count, last_values = self._run_naive(
+            matrix, day0, np.stack([state.last_values for state in states]).copy()
+        )
+        for row, state in enumerate(states):
+            days, values = series[row]
+            last_day = int(days[-1])
+            window = np.concatenate([previous[row], np.full(last_day - state.last_day, np.nan)])
+            new = days > state.last_day
+            window[days[new] - state.last_day - 1 + GBM_WINDOW] = values[new]
+            state.level = float(level[0, row])
+            state.season = season[0, row].copy()
+            state.last_values = last_values[row]
+            state.ets_sse += float(sse[0, row])
+            state.ets_count += int(count[row])
+            state.naive_sse += float(naive_sse[row])
+            state.naive_count += int(naive_count[row])
+            state.observed += int(new.sum())
+            state.checksum = float(values.sum())
+            state.last_day = last_day
+            state.recent = window[-GBM_WINDOW:]
+    
+    def _fit_gbm(self, series: List[Tuple[np.ndarray, np.ndarray]], max_rows: int = 200000):
+        """以這批用戶的所有觀測日訓練共用的梯度提升模型"""
+        matrix, day0 = self._matrix(series)
+        users, span = matrix.shape
+        padded = np.concatenate([np.full((users, GBM_WINDOW), np.nan), matrix], axis=1)
+        observed = np.argwhere(~np.isnan(matrix))
+        if len(observed) > max_rows:
+            observed = observed[np.random.default_rng(0).choice(len(observed), max_rows, replace=False)]
+        rows, columns = observed[:, 0], observed[:, 1]
+        # 每個目標日之前 GBM_WINDOW 天的視窗
+        history = padded[rows[:, None], columns[:, None] + np.arange(GBM_WINDOW)]
+        model = _load_gbm()
+        model.fit(gbm_features(history, (day0 + columns) % SEASON), matrix[rows, columns])
+        self.gbm = model
+        self.gbm_day = int(max(days[-1] for days, _ in series))
+        logger.info(f"GBM 預測模型訓練完成：{users} 位用戶、{len(rows)} 筆觀測")
+    
+    def _forecast_gbm(self, user_ids: List[str], states: List[SeriesModel],
+                      series: Dict[str, Tuple[np.ndarray, np.ndarray]], days: np.ndarray) -> np.ndarray:
+        """所有用戶同時遞迴預測（預測值作為下一天的延遲特徵），回傳 (用戶, 天) 陣列"""
+        last_days = np.array([state.last_day for state in states], dtype=np.int64)
+        if self.gbm is None or last_days.max() - self.gbm_day >= self.refit_every:
+            self._fit_gbm([series[user_id] for user_id in user_ids])
+        steps = int(days[-1] - last_days.min())
+        history = np.stack([state.recent for state in states])
+        predicted = np.empty((len(states), max(steps, 1)))
+        for step in range(steps):
+            value = self.gbm.predict(gbm_features(history, (last_days + step + 1) % SEASON))
+            predicted[:, step] = value
+            history = np.concatenate([history[:, 1:], value[:, None]], axis=1)
+        index = np.clip(days[None, :] - last_days[:, None] - 1, 0, predicted.shape[1] - 1)
+        return np.take_along_axis(predicted, index, axis=1)
+    
+    @staticmethod
+    def _ets_total_variance(state: SeriesModel, days: np.ndarray) -> float:
+        """指數平滑預測期間總量的變異數
+        
+        last_day 之後第 k 天的誤差除了影響當天，也經由 level 以 alpha 的比例影響之後的每一天，
+        因此各日的預測誤差彼此相關，總量的變異數大於各日變異數的和。
+        """
+        future = np.arange(state.last_day + 1, days[-1] + 1)
+        later = len(days) - np.searchsorted(days, future, side='right')
+        weight = (future >= days[0]) + state.alpha * later
+        return state.ets_sse / max(state.ets_count, 1) * float((weight ** 2).sum())
+    
+    def forecast(self, series: Dict[str, Tuple[np.ndarray, np.ndarray]], period: str = 'month',
+                 model: str = 'auto', start=None) -> Dict:
+        """更新模型並預測 start（預設為資料最後一天的隔天）起 period 期間的每日碳排放"""
+        if period not in HORIZONS:
+            raise ValueError(f'不支援的預測期間: {period}')
+        if model not in MODELS:
+            raise ValueError(f'不支援的模型: {model}')
+        series = {str(user_id): (days, values) for user_id, (days, values) in series.items()}
+        update = self.update(series)
+        horizon = HORIZONS[period]
+        
+        with self.lock:
+            user_ids = [user_id for user_id in series if user_id in self.models]
+            states = [self.models[user_id] for user_id in user_ids]
+            if not states:
+                return {'period': period, 'horizon': horizon, 'forecasts': {}, 'update': update}
+            first_day = self._day(start) if start is not None else max(state.last_day for state in states) + 1
+            days = first_day + np.arange(horizon)
+            if model == 'gbm':
+                predictions = self._forecast_gbm(user_ids, states, series, days)
+            
+            forecasts = {}
+            for row, (user_id, state) in enumerate(zip(user_ids, states)):
+                steps = np.maximum(days - state.last_day, 1)
+                chosen = model if model != 'auto' else state.model
+                if state.observed < self.min_history:
+                    # 資料太少時只預測平滑後的水準
+                    chosen = 'level'
+                total_variance = None
+                if chosen == 'gbm':
+                    values = predictions[row]
+                    variance = np.full(horizon, state.ets_sse / max(state.ets_count, 1))
+                elif chosen == 'seasonal_naive':
+                    fallback = np.nanmean(state.last_values) if not np.isnan(state.last_values).all() else state.level
+                    values = np.nan_to_num(state.last_values[days % SEASON], nan=fallback)
+                    # 每多一個季節，誤差多累積一次
+                    variance = state.naive_sse / max(state.naive_count, 1) * ((steps - 1) // SEASON + 1)
+                elif chosen == 'ets':
+                    values = state.level + state.season[days % SEASON]
+                    variance = state.ets_sse / max(state.ets_count, 1) * (1 + (steps - 1) * state.alpha ** 2)
+                    total_variance = self._ets_total_variance(state, days)
+                else:
+                    values = np.full(horizon, state.level)
+                    variance = np.full(horizon, state.ets_sse / max(state.ets_count, 1))
+                    total_variance = self._ets_total_variance(state, days)
+                values = np.maximum(values, 0.0)
+                spread = INTERVAL_Z * np.sqrt(variance)
+                total = float(values.sum())
+                # 其他模型的期間總量區間假設各日誤差獨立
+                total_spread = INTERVAL_Z * float(np.sqrt(variance.sum() if total_variance is None else total_variance))
+                forecasts[user_id] = {
+                    'model': chosen,
+                    'total': round(total, 3),
+                    'total_interval': [round(max(total - total_spread, 0.0), 3), round(total + total_spread, 3)],
+                    'daily': [
+                        {'date': str(np.datetime64(int(day), 'D')), 'value': round(float(value), 3),
+                         'lower': round(float(max(value - width, 0.0)), 3), 'upper': round(float(value + width), 3)}
+                        for day, value, width in zip(days.tolist(), values.tolist(), spread.tolist())
+                    ],
+                    'history_days': state.observed,
+                    'last_date': str(np.datetime64(state.last_day, 'D')),
+                    'parameters': {'alpha': state.alpha, 'gamma': state.gamma}
+                }
+        return {'period': period, 'horizon': horizon, 'forecasts': forecasts, 'update': update}
@@ -0,0 +1,163 @@
+import logging
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from services.carbon_calculator import CarbonCalculator
+from services.data_processor import DataProcessor, ProcessingRun
+from services.emission_factors import FactorRegistry, FactorTimeline
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RecomputeRun(ProcessingRun):
+    """一次重新計算的統計"""
+    recomputed: int = 0
+    changed: int = 0
+    undated: int = 0
+    out_of_range: int = 0
+    changed_by_version: Dict[str, int] = field(default_factory=dict)
+
+class FootprintRecomputer:
+    """歷史碳足跡重新計算
+    
+    係數更新後（例如 electricity_taiwan 由 0.509 改為新年度的係數），以每筆記錄時間點生效的
+    係數版本重新計算已儲存的活動，只輸出數值改變的記錄。記錄沿用 DataProcessor 的解析、
+    驗證與正規化階段，每段依係數版本分組後以批次方法計算，記憶體用量與記錄數無關。
+    """
+    
+    def __init__(self, carbon_calculator: Optional[CarbonCalculator] = None, chunk_size: int = 50000,
+                 tolerance: float = 0.0):
+        self.carbon_calculator = carbon_calculator or CarbonCalculator()
+        self.registry = self.carbon_calculator.registry
+        self.data_processor = DataProcessor(self.carbon_calculator, chunk_size=chunk_size)
+        # 新數值（與 calculate_footprint 相同四捨五入至小數 3 位）與儲存值相差超過 tolerance 才輸出
+        self.tolerance = tolerance
+    
+    def parse_time(self, value) -> Optional[float]:
+        """ISO 8601 字串或 Unix 時間（秒或毫秒）轉為 Unix 秒；None 保持 None"""
+        if value is None:
+            return None
+        timestamp = self.data_processor._timestamps([value])[0]
+        if timestamp is None:
+            raise ValueError(f'無效的時間: {value}')
+        return timestamp
+    
+    def timeline(self, versions: Optional[Dict] = None) -> FactorTimeline:
+        """由版本對照建立係數時間軸
+        
+        versions 為 {版本: 生效時間} 或 {版本: {'valid_from': 生效時間, 'factors': {活動: 係數}}}。
+        只有生效時間的版本必須已發布；提供 factors 的版本以時間上前一個版本（最早的版本以
+        目前版本）為基礎更新係數，只用於這次計算，不會發布到登錄表。未指定時使用所有已發布的版本。
+        """
+        if not versions:
+            return self.registry.timeline()
+        
+        entries = []
+        for version, spec in versions.items():
+            if not isinstance(spec, dict):
+                spec = {'valid_from': spec}
+            entries.append((self.parse_time(spec.get('valid_from')), str(version), spec.get('factors')))
+        entries.sort(key=lambda entry: -math.inf if entry[0] is None else entry[0])
+        
+        resolved = []
+        base = self.registry.current
+        for valid_from, version, factors in entries:
+            if factors:
+                snapshot = base.with_factors(factors, version=version, valid_from=valid_from)
+            elif version in self.registry.snapshots:
+                snapshot = self.registry.version(version)
+            else:
+                raise ValueError(f'未知的係數版本: {version}')
+            resolved.append((valid_from, snapshot))
+            base = snapshot
+        return FactorTimeline(resolved)
+    
+    def iter_changes(self, records: Iterable, timeline: FactorTimeline, start: Optional[float] = None,
+                     end: Optional[float] = None, run: Optional[RecomputeRun] = None,
+                     prefetch: bool = False) -> Iterator[List[Dict]]:
+        """重新計算 [start, end) 之間的記錄，每段產生一次數值改變的記錄列表
+        
+        每筆改變的記錄為 {index, id, timestamp, version, previous, carbon_footprint}；
+        previous 為儲存的 carbon_footprint（未提供時為 None）。
+        """
+        run = run if run is not None else RecomputeRun()
+        for name in ('parse', 'validate', 'normalize', 'recompute'):
+            run.stage(name)
+        stats = run.stage('recompute')
+        calculators = [CarbonCalculator(FactorRegistry(snapshot)) for snapshot in timeline.snapshots]
+        
+        for chunk in self.data_processor.iter_chunks(records, run, prefetch=prefetch, enrich=False):
+            began = time.perf_counter()
+            timestamp = chunk.timestamp
+            dated = np.isfinite(timestamp)
+            selected = dated.copy()
+            if start is not None:
+                selected &= timestamp >= start
+            if end is not None:
+                selected &= timestamp < end
+            run.undated += int((~dated).sum())
+            run.out_of_range += int((dated & ~selected).sum())
+            
+            rows = np.flatnonzero(selected)
+            version = timeline.locate(timestamp[rows])
+            emission = np.empty(len(rows))
+            for position in np.unique(version).tolist():
+                members = version == position
+                emission[members] = self.data_processor.compute_emissions(
+                    chunk.take(rows[members]), calculators[position], keep_provided=False
+                )
+            emission = self.carbon_calculator._round_batch(emission)
+            previous = np.array([chunk.records[i].get('carbon_footprint', np.nan) for i in rows], dtype=np.float64)
+            changed = np.flatnonzero(~(np.abs(emission - previous) <= self.tolerance))
+            
+            changes = []
+            for k in changed.tolist():
+                i = rows[k]
+                name = timeline.snapshots[version[k]].version
+                run.changed_by_version[name] = run.changed_by_version.get(name, 0) + 1
+                changes.append({
+                    'index': int(chunk.index[i]),
+                    'id': chunk.records[i].get('id'),
+                    'timestamp': float(timestamp[i]),
+                    'version': name,
+                    'previous': None if np.isnan(previous[k]) else float(previous[k]),
+                    'carbon_footprint': float(emission[k])
+                })
+            run.recomputed += len(rows)
+            run.changed += len(changes)
+            
+            stats.seconds += time.perf_counter() - began
+            stats.records_in += len(chunk)
+            stats.records_out += len(changes)
+            stats.chunks += 1
+            yield changes
+    
+    def recompute(self, records: Iterable, versions: Optional[Dict] = None, start=None, end=None,
+                  max_changes: int = 10000, prefetch: bool = False) -> Dict:
+        """重新計算並回傳統計與最多 max_changes 筆改變的記錄"""
+        timeline = self.timeline(versions)
+        run = RecomputeRun(max_errors=self.data_processor.max_errors)
+        changes = []
+        for batch in self.iter_changes(records, timeline, self.parse_time(start), self.parse_time(end), run,
+                                       prefetch=prefetch):
+            changes.extend(batch[:max_changes - len(changes)])
+        return dict(self.summary(run, timeline), changes=changes, truncated=run.changed > len(changes))
+    
+    @staticmethod
+    def summary(run: RecomputeRun, timeline: FactorTimeline) -> Dict:
+        return {
+            'record_count': run.stage('parse').records_in,
+            'invalid_count': sum(run.error_counts.values()),
+            'recomputed_count': run.recomputed,
+            'changed_count': run.changed,
+            'undated_count': run.undated,
+            'out_of_range_count': run.out_of_range,
+            'changed_by_version': dict(run.changed_by_version),
+            'versions': timeline.describe(),
+            'errors': {'by_reason': dict(run.error_counts), 'samples': run.error_samples},
+            'stages': {name: stage.to_dict() for name, stage in run.stages.items()}
+        }
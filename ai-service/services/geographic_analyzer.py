@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from services.spatial_index import SpatialIndex, cluster_summary
+
+logger = logging.getLogger(__name__)
+
+class GeographicAnalyzer:
+    """全市範圍的地理分析：熱力圖與熱點
+    
+    點（GPS 點或移動記錄的起訖點，可附帶權重，例如碳排放量）分批加入 SpatialIndex，
+    熱力圖為各網格的點數與權重總和，熱點為 DBSCAN 式聚類的群集。
+    """
+    
+    def __init__(self, cell_size: float = 500.0, hotspot_radius: float = 100.0, min_hotspot_points: int = 50,
+                 max_cells: int = 10000, max_hotspots: int = 100, chunk_size: int = 100000):
+        # 熱力圖網格邊長（公尺）；回傳點數最多的 max_cells 個網格
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        # 熱點：hotspot_radius 公尺內至少 min_hotspot_points 個點的密集區域
+        self.hotspot_radius = hotspot_radius
+        self.min_hotspot_points = min_hotspot_points
+        self.max_hotspots = max_hotspots
+        self.chunk_size = chunk_size
+    
+    def analyze(self, data: Dict) -> Dict:
+        """分析 data 中的 points（點列表或欄位式字典）與/或 movements（移動記錄）
+        
+        data 可以 cell_size、hotspot_radius、min_hotspot_points 覆寫預設參數。
+        """
+        chunks = []
+        points = data.get('points')
+        if points is not None:
+            chunks.extend(self.iter_point_chunks(points))
+        movements = data.get('movements')
+        if movements:
+            chunks.append(self.movement_endpoints(movements))
+        return self.analyze_chunks(
+            chunks,
+            cell_size=data.get('cell_size'),
+            hotspot_radius=data.get('hotspot_radius'),
+            min_hotspot_points=data.get('min_hotspot_points')
+        )
+    
+    def iter_point_chunks(self, points) -> Iterator[Dict[str, np.ndarray]]:
+        """將點列表 [{'latitude', 'longitude', 'weight'?}] 或欄位式字典切為 chunk_size 個點一段"""
+        if isinstance(points, dict):
+            columns = {key: np.asarray(points[key], dtype=np.float64)
+                       for key in ('latitude', 'longitude', 'weight') if key in points}
+            for start in range(0, len(columns['latitude']), self.chunk_size):
+                yield {key: values[start:start + self.chunk_size] for key, values in columns.items()}
+            return
+        for start in range(0, len(points), self.chunk_size):
+            yield self.to_columns(points[start:start + self.chunk_size])
+    
+    @staticmethod
+    def to_columns(points: List[Dict]) -> Dict[str, np.ndarray]:
+        return {
+            'latitude': np.array([point['latitude'] for point in points], dtype=np.float64),
+            'longitude': np.array([point['longitude'] for point in points], dtype=np.float64),
+            'weight': np.array([point.get('weight', 1.0) for point in points], dtype=np.float64)
+        }
+    
+    @staticmethod
+    def movement_endpoints(movements: List[Dict]) -> Dict[str, np.ndarray]:
+        """移動記錄的起點與終點，權重為各分擔一半的碳排放量（未提供時為 1）"""
+        latitude, longitude, weight = [], [], []
+        for movement in movements:
+            carbon = movement.get('carbonFootprint')
+            for key in ('startLocation', 'endLocation'):
+                location = movement.get(key) or {}
+                if location.get('latitude') is None or location.get('longitude') is None:
+                    continue
+                latitude.append(location['latitude'])
+                longitude.append(location['longitude'])
+                weight.append(carbon / 2 if carbon is not None else 1.0)
+        return {
+            'latitude': np.array(latitude, dtype=np.float64),
+            'longitude': np.array(longitude, dtype=np.float64),
+            'weight': np.array(weight, dtype=np.float64)
+        }
+    
+    def analyze_chunks(self, chunks: Iterable[Dict[str, np.ndarray]], cell_size: Optional[float] = None,
+                       hotspot_radius: Optional[float] = None, min_hotspot_points: Optional[int] = None) -> Dict:
+        """逐段加入索引後計算熱力圖與熱點"""
+        cell_size = float(cell_size or self.cell_size)
+        hotspot_radius = float(hotspot_radius or self.hotspot_radius)
+        min_hotspot_points = int(min_hotspot_points or self.min_hotspot_points)
+        
+        index = SpatialIndex(cell_size=cell_size, capacity=self.chunk_size)
+        weights = []
+        for chunk in chunks:
+            index.insert(chunk['latitude'], chunk['longitude'])
+            weights.append(chunk['weight'] if 'weight' in chunk else np.ones(len(chunk['latitude'])))
+        weight = np.concatenate(weights) if weights else np.zeros(0)
+        
+        heatmap = index.heatmap(weights=weight)
+        top = np.argsort(-heatmap['count'], kind='stable')[:self.max_cells]
+        
+        labels = index.cluster(hotspot_radius, min_hotspot_points)
+        hotspots = cluster_summary(index.latitude, index.longitude, labels, weights=weight)
+        
+        return {
+            'point_count': len(index),
+            'cell_size': cell_size,
+            'cell_count': len(heatmap['count']),
+            'cells': [
+                {
+                    'latitude': float(heatmap['latitude'][i]),
+                    'longitude': float(heatmap['longitude'][i]),
+                    'count': int(heatmap['count'][i]),
+                    'weight': round(float(heatmap['weight'][i]), 3)
+                }
+                for i in top
+            ],
+            'hotspot_count': len(hotspots['count']),
+            'hotspots': [
+                {
+                    'latitude': float(hotspots['latitude'][i]),
+                    'longitude': float(hotspots['longitude'][i]),
+                    'radius': round(float(hotspots['radius'][i]), 1),
+                    'count': int(hotspots['count'][i]),
+                    'weight': round(float(hotspots['weight'][i]), 3)
+                }
+                for i in range(min(len(hotspots['count']), self.max_hotspots))
+            ]
+        }
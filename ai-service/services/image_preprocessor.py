@@ -0,0 +1,143 @@
+import io
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# JPEG 可在解碼時直接以 1/2、1/4、1/8 縮小（DCT 縮放），不需先配置全尺寸陣列
+_REDUCED_FLAGS = {
+    True: {8: cv2.IMREAD_REDUCED_GRAYSCALE_8, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2},
+    False: {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+}
+
+class ImagePreprocessor:
+    """OCR 圖像預處理
+    
+    解碼時依圖片標頭的尺寸直接縮小解碼並轉為灰度，再縮放到目標長邊（或目標 DPI），
+    之後的降噪、對比增強與二值化都在縮小後的圖像上進行。中間結果使用每個執行緒預先配置的
+    暫存陣列；輸出的陣列會交給 OCR 引擎執行緒使用，因此每次都重新配置。
+    """
+    
+    def __init__(self, max_long_edge: Optional[int] = 2000, target_dpi: Optional[int] = None,
+                 grayscale: bool = True):
+        self.max_long_edge = max_long_edge
+        self.target_dpi = target_dpi
+        self.grayscale = grayscale
+        self._local = threading.local()
+    
+    def config_version(self) -> str:
+        """影響預處理結果的設定（作為快取鍵的一部分）"""
+        return f'long_edge={self.max_long_edge}|dpi={self.target_dpi}|gray={self.grayscale}'
+    
+    def target_scale(self, width: int, height: int, dpi: Optional[float] = None) -> float:
+        """計算縮放比例（只縮小不放大）"""
+        scale = 1.0
+        if self.target_dpi and dpi:
+            scale = min(scale, self.target_dpi / dpi)
+        if self.max_long_edge:
+            scale = min(scale, self.max_long_edge / max(width, height))
+        return scale
+    
+    def decode(self, image_bytes: bytes, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """解碼並正規化圖片尺寸；timings 提供時記錄各步驟耗時（毫秒）"""
+        start = time.perf_counter()
+        
+        # 只讀取標頭取得尺寸與 DPI，不解碼像素
+        size, dpi = None, None
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as header:
+                size = header.size
+                dpi_info = header.info.get('dpi')
+                dpi = float(dpi_info[0]) if dpi_info and dpi_info[0] else None
+        except Exception:
+            pass
+        
+        flags = cv2.IMREAD_GRAYSCALE if self.grayscale else cv2.IMREAD_COLOR
+        if size is not None:
+            scale = self.target_scale(size[0], size[1], dpi)
+            for factor, reduced_flag in _REDUCED_FLAGS[self.grayscale].items():
+                # 縮小解碼後的尺寸仍不低於目標尺寸
+                if scale * factor <= 1.0:
+                    flags = reduced_flag
+                    break
+        
+        image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), flags)
+        if image is None:
+            raise ValueError("無法讀取圖片")
+        self._record(timings, 'decode', start)
+        
+        return self.resize(image, dpi=dpi, timings=timings, original_size=size)
+    
+    def resize(self, image: np.ndarray, dpi: Optional[float] = None, timings: Optional[Dict[str, float]] = None,
+               original_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """縮小到目標長邊（或目標 DPI）；已符合目標尺寸時原樣回傳"""
+        start = time.perf_counter()
+        height, width = image.shape[:2]
+        
+        # 縮小解碼後 DPI 以原始尺寸換算
+        if dpi and original_size:
+            dpi = dpi * width / original_size[0]
+        
+        scale = self.target_scale(width, height, dpi)
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+            self._record(timings, 'resize', start)
+        
+        return image
+    
+    def binarize(self, image: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """灰度 → 降噪 → 對比增強 → Otsu 二值化"""
+        start = time.perf_counter()
+        if len(image.shape) == 3:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            self._record(timings, 'grayscale', start)
+            start = time.perf_counter()
+        else:
+            gray = image
+        
+        denoised, enhanced = self._buffers(gray.shape)
+        
+        # 降噪
+        cv2.medianBlur(gray, 3, dst=denoised)
+        self._record(timings, 'denoise', start)
+        
+        # 增強對比度
+        start = time.perf_counter()
+        self._clahe().apply(denoised, dst=enhanced)
+        self._record(timings, 'clahe', start)
+        
+        # 二值化
+        start = time.perf_counter()
+        _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        self._record(timings, 'threshold', start)
+        
+        return binary
+    
+    def _buffers(self, shape: Tuple[int, ...]) -> Tuple[np.ndarray, np.ndarray]:
+        """取得此執行緒的暫存陣列；尺寸改變時才重新配置"""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[0].shape != shape:
+            buffers = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+            self._local.buffers = buffers
+        return buffers
+    
+    def _clahe(self):
+        """CLAHE 物件不保證可跨執行緒共用，每個執行緒建立一個"""
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+            self._local.clahe = clahe
+        return clahe
+    
+    @staticmethod
+    def _record(timings: Optional[Dict[str, float]], step: str, start: float):
+        metrics.record('ocr', step, time.perf_counter() - start, timings)
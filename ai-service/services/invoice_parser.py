@@ -0,0 +1,182 @@
+import re
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各欄位的候選樣式依優先順序排列：優先順序較高的樣式只要出現在任何位置就勝出，
+# 同一優先順序取最早出現者（與逐一對全文 re.search 的結果相同）
+STORE_SUFFIX_PATTERNS = [
+    re.compile(r'([^\n]+(?:商店|超市|便利商店|百貨|商場|市場|店))', re.IGNORECASE),
+    re.compile(r'([^\n]+(?:Store|Market|Shop|Mall))', re.IGNORECASE)
+]
+STORE_NAME_PATTERNS = [
+    re.compile(r'(統一超商|7-ELEVEN|全家|萊爾富|OK超商)', re.IGNORECASE),
+    re.compile(r'(家樂福|大潤發|愛買|全聯|頂好)', re.IGNORECASE)
+]
+STORE_SUFFIX_CHARS = '店市貨場'
+STORE_SUFFIX_WORDS = ('store', 'market', 'shop', 'mall')
+
+# 總金額：關鍵字樣式（優先順序 0-3）與貨幣符號樣式（NT$ 為 4、$ 為 5）各以一個正規表示式比對；
+# 金額為空代表關鍵字在行尾，金額在下一行（原樣式的 \s* 可跨行）
+AMOUNT_KEYWORDS = {'總計': 0, '合計': 1, '總額': 2, 'total': 3}
+AMOUNT_KEYWORD_PATTERN = re.compile(r'(總計|合計|總額|Total)[：:]\s*(?:(\d+(?:\.\d{2})?)|$)', re.IGNORECASE)
+AMOUNT_CURRENCY_PATTERN = re.compile(r'(NT)?\$\s*(?:(\d+(?:\.\d{2})?)|$)', re.IGNORECASE)
+LEADING_AMOUNT = re.compile(r'\s*(\d+(?:\.\d{2})?)')
+
+DATE_PATTERNS = [
+    re.compile(r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})'),
+    re.compile(r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})'),
+    re.compile(r'(\d{4}年\d{1,2}月\d{1,2}日)')
+]
+
+PRICE = re.compile(r'(\d+(?:\.\d{2})?)')
+
+class _FieldMatch:
+    """記錄欄位目前最佳的候選（優先順序、位置、值）"""
+    
+    __slots__ = ('priority', 'start', 'end', 'value')
+    
+    def __init__(self):
+        self.priority = None
+        self.start = None
+        self.end = None
+        self.value = None
+    
+    def offer(self, priority: int, start: int, end: int, value) -> None:
+        if (self.priority is None or priority < self.priority
+                or (priority == self.priority and start < self.start)):
+            self.priority, self.start, self.end, self.value = priority, start, end, value
+    
+    def settled(self) -> bool:
+        """最高優先順序已找到時，之後的內容不可能再改變結果"""
+        return self.priority == 0
+
+class InvoiceParser:
+    """預先編譯的單次掃描發票解析器
+    
+    逐行掃描一次即可取得商店名稱、總金額、日期與商品項目；各欄位找到最高優先順序的結果後
+    不再比對，商品達到上限後不再解析，所有欄位確定時提前結束掃描。
+    """
+    
+    def __init__(self, item_limit: int = 10):
+        self.item_limit = item_limit
+    
+    def parse(self, text: str, item_limit: Optional[int] = None, with_positions: bool = False) -> Dict:
+        """解析發票文本；with_positions 為 True 時附上各欄位在文本中的位置 [start, end)"""
+        item_limit = self.item_limit if item_limit is None else item_limit
+        
+        store = _FieldMatch()
+        amount = _FieldMatch()
+        date = _FieldMatch()
+        items: List[Dict] = []
+        item_positions: List[Tuple[int, int]] = []
+        
+        # 關鍵字在行尾、等待下一行金額：優先順序 -> 關鍵字位置
+        pending_amounts: Dict[int, int] = {}
+        
+        offset = 0
+        for line in text.split('\n'):
+            line_start = offset
+            offset += len(line) + 1
+            
+            if not store.settled():
+                self._scan_store(line, line_start, store)
+            
+            if not amount.settled():
+                self._scan_amount(line, line_start, amount, pending_amounts)
+            
+            if not date.settled():
+                # 日期樣式需要 -、/ 或「年」
+                if '-' in line or '/' in line:
+                    self._offer_first(DATE_PATTERNS, (0, 1), line, line_start, date)
+                if '年' in line:
+                    self._offer_first(DATE_PATTERNS, (2,), line, line_start, date)
+            
+            # 提取商品項目（尋找包含價格的行）
+            if len(items) < item_limit:
+                stripped = line.strip()
+                price_match = PRICE.search(stripped)
+                if price_match and len(stripped) > 5:
+                    item_name = PRICE.sub('', stripped).strip()
+                    if item_name and len(item_name) > 1:
+                        items.append({
+                            'name': item_name,
+                            'price': float(price_match.group(1)),
+                            'quantity': 1
+                        })
+                        item_start = line_start + (len(line) - len(line.lstrip()))
+                        item_positions.append((item_start, item_start + len(stripped)))
+            elif store.settled() and amount.settled() and date.settled():
+                break
+        
+        invoice_data = {
+            'store_name': store.value or '',
+            'total_amount': amount.value if amount.value is not None else 0.0,
+            'date': date.value or '',
+            'items': items,
+            'confidence': 0.0
+        }
+        
+        if with_positions:
+            invoice_data['positions'] = {
+                'store_name': [store.start, store.end] if store.value is not None else None,
+                'total_amount': [amount.start, amount.end] if amount.value is not None else None,
+                'date': [date.start, date.end] if date.value is not None else None,
+                'items': [list(position) for position in item_positions]
+            }
+        
+        return invoice_data
+    
+    def _offer_first(self, patterns: List, priorities, line: str, line_start: int, field: _FieldMatch):
+        """以指定優先順序的樣式搜尋此行，提供第一個匹配"""
+        for priority in priorities:
+            if field.priority is not None and priority > field.priority:
+                break
+            match = patterns[priority].search(line)
+            if match:
+                field.offer(priority, line_start + match.start(1), line_start + match.end(1), match.group(1).strip())
+    
+    def _scan_store(self, line: str, line_start: int, store: _FieldMatch):
+        """比對商店名稱；以字元預先篩選，避免對每行執行回溯成本高的後綴樣式"""
+        if any(char in line for char in STORE_SUFFIX_CHARS):
+            self._offer_first(STORE_SUFFIX_PATTERNS, (0,), line, line_start, store)
+        if store.priority is None or store.priority > 1:
+            lowered = line.lower()
+            if any(word in lowered for word in STORE_SUFFIX_WORDS):
+                self._offer_first(STORE_SUFFIX_PATTERNS, (1,), line, line_start, store)
+        if store.priority is None or store.priority > 2:
+            for offset, pattern in enumerate(STORE_NAME_PATTERNS, start=2):
+                if store.priority is not None and offset > store.priority:
+                    break
+                match = pattern.search(line)
+                if match:
+                    store.offer(offset, line_start + match.start(1), line_start + match.end(1), match.group(1))
+    
+    def _scan_amount(self, line: str, line_start: int, amount: _FieldMatch, pending: Dict[int, int]):
+        """比對總金額（含關鍵字在行尾、金額在下一行的情況）"""
+        if pending and line.strip():
+            leading = LEADING_AMOUNT.match(line)
+            if leading:
+                for priority, start in pending.items():
+                    amount.offer(priority, start, line_start + leading.end(1), float(leading.group(1)))
+            pending.clear()
+        
+        if ':' in line or '：' in line:
+            for match in AMOUNT_KEYWORD_PATTERN.finditer(line):
+                priority = AMOUNT_KEYWORDS[match.group(1).lower()]
+                if match.group(2) is not None:
+                    amount.offer(priority, line_start + match.start(), line_start + match.end(2),
+                                 float(match.group(2)))
+                else:
+                    pending.setdefault(priority, line_start + match.start())
+        
+        if '$' in line:
+            for match in AMOUNT_CURRENCY_PATTERN.finditer(line):
+                dollar = match.start() + (2 if match.group(1) else 0)
+                priorities = [(4, match.start()), (5, dollar)] if match.group(1) else [(5, dollar)]
+                for priority, start in priorities:
+                    if match.group(2) is not None:
+                        amount.offer(priority, line_start + start, line_start + match.end(2), float(match.group(2)))
+                    else:
+                        pending.setdefault(priority, line_start + start)
@@ -0,0 +1,161 @@
+import bisect
+import functools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 秒；涵蓋單筆計算（數十微秒）到 OCR 引擎（數秒）
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# 外部收集器回傳的指標：(名稱, 類型, 說明, [(標籤, 數值)])
+Collected = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names: Iterable[str], values: Iterable) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """行程內的累積直方圖（Prometheus histogram 語意），依標籤值分別統計"""
+    
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        # 標籤值 → [各區間計數（非累積，最後一格為 +Inf）, 總和, 次數]
+        self.series: Dict[Tuple, list] = {}
+    
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+    
+    def snapshot(self) -> Dict[Tuple, Tuple[List[int], float, int]]:
+        with self.lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self.series.items()}
+    
+    def render(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        for label_values, (counts, total, count) in sorted(self.snapshot().items()):
+            names = self.label_names + ('le',)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_labels(names, label_values + (_number(bound),))} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, label_values)} {_number(total)}'
+            yield f'{self.name}_count{_labels(self.label_names, label_values)} {count}'
+
+class MetricsRegistry:
+    """行程內指標登錄，以 Prometheus 文字格式輸出
+    
+    直方圖由各服務在處理時記錄；並行上限、快取等已有統計的元件以收集器（collector）在
+    輸出時讀取目前數值，不需重複計數。
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.collectors: List[Callable[[], Iterable[Collected]]] = []
+    
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        """取得（必要時建立）直方圖"""
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name, help_text, labels, buckets)
+            return self.histograms[name]
+    
+    def register_collector(self, collector: Callable[[], Iterable[Collected]]):
+        with self.lock:
+            self.collectors.append(collector)
+    
+    def render(self) -> str:
+        with self.lock:
+            histograms = list(self.histograms.values())
+            collectors = list(self.collectors)
+        
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logger.error(f"指標收集失敗: {e}")
+                continue
+            for name, kind, help_text, samples in collected:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_labels(labels.keys(), labels.values())} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+# 行程內共用的登錄；批次 OCR 的 worker 行程各有一份，結果由主行程依回應中的耗時補記
+registry = MetricsRegistry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = registry.histogram(
+    'ai_service_stage_seconds', '各服務處理階段耗時（秒）', ('service', 'stage')
+)
+REQUEST_SECONDS = registry.histogram(
+    'ai_service_request_seconds', 'HTTP 請求處理耗時（秒，串流回應為開始回應前）', ('endpoint', 'method', 'status')
+)
+
+def record(service: str, stage: str, seconds: float, timings: Optional[Dict[str, float]] = None):
+    """記錄一個階段的耗時；timings 提供時同時累加到該字典（毫秒，供回應中的耗時明細）"""
+    STAGE_SECONDS.observe(seconds, service, stage)
+    if timings is not None:
+        timings[stage] = round(timings.get(stage, 0.0) + seconds * 1000, 3)
+
+class timed:
+    """計時區塊（with）或方法（裝飾器）；單筆計算等微秒級的方法也可使用"""
+    
+    __slots__ = ('service', 'stage', 'timings', 'start')
+    
+    def __init__(self, service: str, stage: str, timings: Optional[Dict[str, float]] = None):
+        self.service = service
+        self.stage = stage
+        self.timings = timings
+        self.start = 0.0
+    
+    def __enter__(self) -> 'timed':
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        record(self.service, self.stage, time.perf_counter() - self.start, self.timings)
+    
+    def __call__(self, function: Callable) -> Callable:
+        labels = (self.service, self.stage)
+        
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - start, *labels)
+        return wrapper
+
+def record_request(endpoint: str, method: str, status: int, seconds: float):
+    REQUEST_SECONDS.observe(seconds, endpoint, method, str(status))
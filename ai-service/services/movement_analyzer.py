@@ -0,0 +1,765 @@
+import logging
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.spatial_index import SpatialIndex, cluster_summary
+from services.trajectory_compactor import CompactTrace, TrajectoryCompactor
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+# 與後端 Movement 模型的 type 列舉一致
+TRANSPORT_MODES = ('walking', 'cycling', 'driving', 'public_transport', 'flying', 'unknown')
+UNKNOWN_MODE = TRANSPORT_MODES.index('unknown')
+
+DATE_ONLY = re.compile(r'\d{4}-\d{2}-\d{2}')
+# 時間後標示時區偏移（+08:00、-0500、+08）的字串
+TZ_OFFSET = re.compile(r'\d{2}:\d{2}(:\d{2}(\.\d*)?)?\s*[+-]\d{2}(:?\d{2})?$')
+
+def haversine_km(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """向量化 Haversine 距離（公里）"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _parse_timestamp(value) -> float:
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if abs(value) > 1e11 else float(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def parse_timestamps(values: Sequence) -> np.ndarray:
+    """將時間戳轉為 UNIX 秒數陣列
+    
+    支援數值（秒或 JavaScript 毫秒）與 ISO 8601 字串；未標示時區的字串視為 UTC。
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in 'iuf':
+        seconds = array.astype(np.float64)
+        # 毫秒時間戳（Date.now()）；逐筆判斷，混合來源的記錄可同時包含秒與毫秒
+        return np.where(np.abs(seconds) > 1e11, seconds / 1000.0, seconds)
+    if array.dtype.kind == 'M':
+        return array.astype('datetime64[ms]').astype(np.int64) / 1000.0
+    
+    if not all(isinstance(value, str) for value in values):
+        return np.array([_parse_timestamp(value) for value in values], dtype=np.float64)
+    
+    strings = list(values)
+    # 有時區偏移的字串逐筆解析；先以字元檢查略過大多數的 UTC 字串
+    if not any(('+' in s or '-' in s[10:]) and TZ_OFFSET.search(s) for s in strings):
+        try:
+            # 快速路徑：UTC（Z 結尾）或未標示時區的字串由 NumPy 一次解析
+            parsed = np.array([s[:-1] if s.endswith('Z') else s for s in strings], dtype='datetime64[ms]')
+            return parsed.astype(np.int64) / 1000.0
+        except ValueError:
+            pass
+    return np.array([_parse_timestamp(s) for s in strings], dtype=np.float64)
+
+def format_timestamp(seconds: float) -> str:
+    return datetime.fromtimestamp(float(seconds), tz=timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def local_day(value, utc_offset: float) -> int:
+    """日期或時間轉為當地日序號（1970-01-01 起的天數）
+    
+    只有日期的字串（YYYY-MM-DD）即為當地的日曆日，不做時區換算；完整的時間依 utc_offset（小時）換算。
+    """
+    if isinstance(value, str) and DATE_ONLY.fullmatch(value.strip()):
+        return int(np.datetime64(value.strip(), 'D').astype(np.int64))
+    timestamp = float(parse_timestamps([value])[0])
+    return int((timestamp + utc_offset * 3600) // 86400)
+
+def _reduce_runs(ufunc, values: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """對多個不重疊區段 [start, end) 做 ufunc.reduceat（start < end，區段依序排列）"""
+    if len(starts) == 0:
+        return np.zeros(0, dtype=values.dtype)
+    # 交錯排列起訖位置，偶數位置的結果即為各區段的歸約值；末端補一個元素讓 end 可等於長度
+    extended = np.append(values, values[:1])
+    return ufunc.reduceat(extended, np.column_stack((starts, ends)).ravel())[::2]
+
+def _daily_overlap(start: np.ndarray, end: np.ndarray, from_hour: float, to_hour: float,
+                   utc_offset: float) -> np.ndarray:
+    """[start, end) 與每日 from_hour 至 to_hour（當地時間，可跨午夜）重疊的秒數"""
+    def cumulative(t):
+        # 從紀元起算落在時段內的累計秒數
+        days, seconds = np.divmod(t + utc_offset * 3600, 86400)
+        if from_hour < to_hour:
+            return days * (to_hour - from_hour) * 3600 + np.clip(seconds - from_hour * 3600, 0,
+                                                                 (to_hour - from_hour) * 3600)
+        return (days * (24 - from_hour + to_hour) * 3600 + np.minimum(seconds, to_hour * 3600)
+                + np.maximum(seconds - from_hour * 3600, 0))
+    return cumulative(end) - cumulative(start)
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """布林陣列中連續 True 區段的 [start, end)"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+@dataclass
+class GPSTrace:
+    """以 NumPy 陣列儲存的 GPS 軌跡（時間為 UNIX 秒數，精度為公尺）"""
+    latitude: np.ndarray
+    longitude: np.ndarray
+    timestamp: np.ndarray
+    accuracy: Optional[np.ndarray] = None
+    # 至該點為止累計的近乎停止時間（秒）；壓縮前以完整解析度計算，壓縮後仍可得到段落的停靠時間
+    dwell_time: Optional[np.ndarray] = None
+    
+    def __len__(self) -> int:
+        return len(self.timestamp)
+    
+    @classmethod
+    def from_points(cls, points) -> 'GPSTrace':
+        """由點列表（[{latitude, longitude, timestamp, accuracy}, ...]）或欄位式字典建立"""
+        if isinstance(points, dict):
+            columns = points
+        else:
+            columns = {
+                'latitude': [point['latitude'] for point in points],
+                'longitude': [point['longitude'] for point in points],
+                'timestamp': [point['timestamp'] for point in points]
+            }
+            if points and all('accuracy' in point for point in points):
+                columns['accuracy'] = [point['accuracy'] for point in points]
+        
+        accuracy = columns.get('accuracy')
+        return cls(
+            latitude=np.asarray(columns['latitude'], dtype=np.float64),
+            longitude=np.asarray(columns['longitude'], dtype=np.float64),
+            timestamp=parse_timestamps(columns['timestamp']),
+            accuracy=np.asarray(accuracy, dtype=np.float64) if accuracy is not None else None
+        )
+    
+    @classmethod
+    def iter_chunks(cls, points, chunk_size: int) -> Iterator['GPSTrace']:
+        """將點列表或欄位式字典依 chunk_size 分段轉換，不一次建立整個軌跡的陣列"""
+        if isinstance(points, dict):
+            size = len(points['timestamp'])
+            for start in range(0, size, chunk_size):
+                yield cls.from_points({key: values[start:start + chunk_size] for key, values in points.items()
+                                       if key in ('latitude', 'longitude', 'timestamp', 'accuracy')})
+        else:
+            for start in range(0, len(points), chunk_size):
+                yield cls.from_points(points[start:start + chunk_size])
+    
+    def select(self, mask: np.ndarray) -> 'GPSTrace':
+        return GPSTrace(
+            self.latitude[mask], self.longitude[mask], self.timestamp[mask],
+            self.accuracy[mask] if self.accuracy is not None else None,
+            self.dwell_time[mask] if self.dwell_time is not None else None
+        )
+
+class MovementAnalyzer:
+    """移動模式分析器
+    
+    GPS 軌跡以 NumPy 陣列處理：距離、速度、停留點與移動段落的偵測都以向量化運算完成，
+    再依各段落的速度特徵推斷交通方式。也可分析後端的移動記錄（Movement）。
+    """
+    
+    def __init__(self, utc_offset: float = 8.0, compact_tolerance: Optional[float] = 10.0, chunk_size: int = 10000,
+                 max_accuracy: float = 100.0, max_speed: float = 1000.0, stop_speed: float = 2.0,
+                 min_stop_duration: float = 180.0, smoothing_window: float = 60.0, min_segment_distance: float = 0.05):
+        # 時段分布使用的時區（小時），預設為台灣時間；請求可以 utc_offset 覆寫
+        self.utc_offset = utc_offset
+        
+        # 軌跡先以串流方式壓縮（誤差上限 compact_tolerance 公尺，None 表示不壓縮），
+        # 每次處理 chunk_size 個點
+        self.compactor = TrajectoryCompactor(compact_tolerance) if compact_tolerance else None
+        self.chunk_size = chunk_size
+        
+        # 精度（公尺）較差的點與隱含速度（km/h）不合理的跳點會被剔除
+        self.max_accuracy = max_accuracy
+        self.max_speed = max_speed
+        # 平滑速度低於 stop_speed（km/h）且持續 min_stop_duration 秒以上視為停留
+        self.stop_speed = stop_speed
+        self.min_stop_duration = min_stop_duration
+        # 速度以前後 smoothing_window 秒內的位移計算，抵銷定位雜訊
+        self.smoothing_window = smoothing_window
+        # 距離（公里）過短的移動段落視為 GPS 漂移
+        self.min_segment_distance = min_segment_distance
+        
+        # 交通方式推斷門檻（km/h）
+        self.walking_max_speed = 10.0
+        self.cycling_max_speed = 30.0
+        self.flying_avg_speed = 250.0
+        self.rail_max_speed = 130.0
+        # 公車等大眾運輸常在站點停靠：段落中低速時間比例門檻
+        self.transit_stop_ratio = 0.12
+        # 步行與乘車之間的切換需持續 min_mode_duration 秒以上才切分段落；
+        # 停靠判斷使用較短視窗（秒）的速度
+        self.min_mode_duration = 120.0
+        self.dwell_window = 10.0
+        self.dwell_speed = 8.0
+        
+        # 常去地點：place_radius 公尺內的停留點視為同一地點；造訪 min_place_visits 次以上
+        # 或累計停留 min_place_duration 秒以上才列出。夜間（night_hours）停留最久的為住家，
+        # 其餘地點中日間（work_hours）停留最久的為工作地點
+        self.place_radius = 150.0
+        self.min_place_visits = 2
+        self.min_place_duration = 3600.0
+        self.night_hours = (22, 6)
+        self.work_hours = (9, 17)
+    
+    def analyze_patterns(self, data: Dict) -> Dict:
+        """分析移動模式
+        
+        data 可包含 GPS 軌跡 points（點列表或欄位式字典），以及/或後端的移動記錄 movements。
+        """
+        result = {}
+        
+        points = data.get('points', data.get('trace'))
+        if points is not None:
+            result['trace'] = self.analyze_stream(GPSTrace.iter_chunks(points, self.chunk_size),
+                                                  include_compact=bool(data.get('include_compact')))
+        
+        movements = data.get('movements')
+        if movements is not None:
+            result['movements'] = self.analyze_movements(movements, data.get('utc_offset', self.utc_offset))
+        
+        return result
+    
+    def clean_trace(self, trace: GPSTrace) -> GPSTrace:
+        """依時間排序並剔除低精度、重複時間與速度不合理的點"""
+        order = np.argsort(trace.timestamp, kind='stable')
+        trace = trace.select(order)
+        
+        valid = np.isfinite(trace.latitude) & np.isfinite(trace.longitude) & np.isfinite(trace.timestamp)
+        if trace.accuracy is not None:
+            valid &= ~(trace.accuracy > self.max_accuracy)
+        trace = trace.select(valid)
+        
+        if len(trace) < 2:
+            return trace
+        
+        # 重複時間戳只保留第一個點
+        keep = np.concatenate(([True], np.diff(trace.timestamp) > 0))
+        trace = trace.select(keep)
+        
+        if len(trace) < 2:
+            return trace
+        
+        # 與前一點之間的隱含速度過高視為跳點
+        distance = haversine_km(trace.latitude[:-1], trace.longitude[:-1], trace.latitude[1:], trace.longitude[1:])
+        speed = distance / np.diff(trace.timestamp) * 3600
+        keep = np.concatenate(([True], speed <= self.max_speed))
+        return trace.select(keep)
+    
+    def clean_stream(self, chunks: Iterable[GPSTrace], stats: Optional[Dict[str, int]] = None) -> Iterator[GPSTrace]:
+        """逐段清理依時間到達的軌跡；與前一段最後一點比較，早於該點的點視為亂序而捨棄"""
+        last: Optional[GPSTrace] = None
+        for chunk in chunks:
+            if stats is not None:
+                stats['input_points'] = stats.get('input_points', 0) + len(chunk)
+            if last is not None:
+                chunk = chunk.select(chunk.timestamp > last.timestamp[0])
+                if chunk.accuracy is not None:
+                    chunk = chunk.select(~(chunk.accuracy > self.max_accuracy))
+                chunk = self.clean_trace(GPSTrace(
+                    np.concatenate((last.latitude, chunk.latitude)),
+                    np.concatenate((last.longitude, chunk.longitude)),
+                    np.concatenate((last.timestamp, chunk.timestamp))
+                )).select(slice(1, None))
+            else:
+                chunk = self.clean_trace(chunk)
+            if len(chunk) == 0:
+                continue
+            if stats is not None:
+                stats['valid_points'] = stats.get('valid_points', 0) + len(chunk)
+            last = chunk.select(slice(-1, None))
+            yield chunk
+    
+    def analyze_stream(self, chunks: Iterable[GPSTrace], include_compact: bool = False) -> Dict:
+        """分析以多段到達的 GPS 軌跡
+        
+        各段依序清理並串流壓縮，只有壓縮後的軌跡會完整保留在記憶體中再進行分析。
+        include_compact 為 True 時附上差分編碼的壓縮軌跡。
+        """
+        stats: Dict[str, int] = {}
+        cleaned = self._with_dwell_time(self.clean_stream(chunks, stats))
+        if self.compactor is not None:
+            compact = CompactTrace.concatenate(self.compactor.compact(cleaned))
+        else:
+            parts = list(cleaned)
+            compact = CompactTrace.encode({
+                key: np.concatenate([part[key] for part in parts]) if parts else np.zeros(0)
+                for key in ('latitude', 'longitude', 'timestamp', 'dwell_time')
+            })
+        
+        result = self.analyze_trace(GPSTrace(**compact.decode()))
+        input_points = stats.get('input_points', 0)
+        result['point_count'] = input_points
+        result['valid_point_count'] = stats.get('valid_points', 0)
+        result['compaction'] = {
+            'tolerance': self.compactor.tolerance if self.compactor is not None else None,
+            'output_points': len(compact),
+            'ratio': round(input_points / len(compact), 2) if len(compact) else None,
+            'encoded_bytes': compact.nbytes
+        }
+        if include_compact:
+            result['compact_trace'] = compact.to_dict()
+        return result
+    
+    def _with_dwell_time(self, chunks: Iterable[GPSTrace]) -> Iterator[Dict[str, np.ndarray]]:
+        """在壓縮前以完整解析度累計各點的近乎停止時間（公車停靠等短暫停留在壓縮後會消失）"""
+        last: Optional[GPSTrace] = None
+        total = 0.0
+        for chunk in chunks:
+            if last is not None:
+                # 前一段最後一點到本段第一點的步也要計入
+                joined = GPSTrace(np.concatenate((last.latitude, chunk.latitude)),
+                                  np.concatenate((last.longitude, chunk.longitude)),
+                                  np.concatenate((last.timestamp, chunk.timestamp)))
+            else:
+                joined = chunk
+            if len(joined) > 1:
+                speed = self.smoothed_speed(joined, self.dwell_window)
+                slow = np.where(speed < self.dwell_speed, np.diff(joined.timestamp), 0.0)
+                dwell_time = total + np.concatenate(([0.0], np.cumsum(slow)))
+            else:
+                dwell_time = np.full(len(joined), total)
+            if last is not None:
+                dwell_time = dwell_time[1:]
+            total = float(dwell_time[-1])
+            last = chunk.select(slice(-1, None))
+            yield {'latitude': chunk.latitude, 'longitude': chunk.longitude, 'timestamp': chunk.timestamp,
+                   'dwell_time': dwell_time}
+    
+    def smoothed_speed(self, trace: GPSTrace, window: Optional[float] = None) -> np.ndarray:
+        """各步的平滑速度（km/h）
+        
+        以步的中點前後各半個視窗內，頭尾兩點的直線位移 / 時間計算；靜止時的定位雜訊
+        不會累積成移動距離。
+        """
+        t = trace.timestamp
+        middle = (t[:-1] + t[1:]) / 2
+        half = (window or self.smoothing_window) / 2
+        low = np.minimum(np.searchsorted(t, middle - half, side='left'), np.arange(len(middle)))
+        high = np.maximum(np.searchsorted(t, middle + half, side='right') - 1, np.arange(1, len(t)))
+        displacement = haversine_km(trace.latitude[low], trace.longitude[low],
+                                    trace.latitude[high], trace.longitude[high])
+        return displacement / (t[high] - t[low]) * 3600
+    
+    def infer_modes(self, average_speed: np.ndarray, max_speed: np.ndarray,
+                    stop_ratio: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """依速度特徵推斷交通方式，回傳 (TRANSPORT_MODES 索引, 置信度)"""
+        average_speed = np.asarray(average_speed, dtype=np.float64)
+        max_speed = np.asarray(max_speed, dtype=np.float64)
+        stop_ratio = np.asarray(stop_ratio, dtype=np.float64)
+        
+        conditions = [
+            ~np.isfinite(average_speed) | (average_speed <= 0),
+            average_speed >= self.flying_avg_speed,
+            (max_speed <= self.walking_max_speed) & (average_speed <= self.walking_max_speed * 0.7),
+            # 高速鐵路與捷運：最高速度超過一般道路
+            max_speed >= self.rail_max_speed * 1.5,
+            # 公車：頻繁停靠且平均速度不高
+            (stop_ratio >= self.transit_stop_ratio) & (average_speed <= 40),
+            (max_speed <= self.cycling_max_speed) & (average_speed <= self.cycling_max_speed * 0.7)
+        ]
+        modes = np.select(conditions, [
+            UNKNOWN_MODE,
+            TRANSPORT_MODES.index('flying'),
+            TRANSPORT_MODES.index('walking'),
+            TRANSPORT_MODES.index('public_transport'),
+            TRANSPORT_MODES.index('public_transport'),
+            TRANSPORT_MODES.index('cycling')
+        ], default=TRANSPORT_MODES.index('driving'))
+        confidence = np.select(conditions, [0.0, 0.9, 0.8, 0.6, 0.5, 0.6], default=0.6)
+        return modes, confidence
+    
+    def analyze_trace(self, trace: GPSTrace) -> Dict:
+        """分析單一 GPS 軌跡：距離、停留點、移動段落與交通方式"""
+        point_count = len(trace)
+        trace = self.clean_trace(trace)
+        n = len(trace)
+        
+        result = {
+            'point_count': point_count,
+            'valid_point_count': n,
+            'total_distance': 0.0,
+            'total_duration': 0.0,
+            'moving_duration': 0.0,
+            'stop_duration': 0.0,
+            'segments': [],
+            'stops': [],
+            'places': [],
+            'mode_breakdown': {}
+        }
+        if n < 2:
+            return result
+        
+        lat, lon, t = trace.latitude, trace.longitude, trace.timestamp
+        duration = np.diff(t)
+        speed = self.smoothed_speed(trace)
+        # 以平滑速度積分距離，避免定位雜訊使軌跡長度膨脹
+        distance = speed * duration / 3600
+        
+        # 停留：平滑速度持續低於門檻的區段（步 [start, end) 對應點 start..end）
+        slow_start, slow_end = _runs(speed < self.stop_speed)
+        long_enough = t[slow_end] - t[slow_start] >= self.min_stop_duration
+        stop_start, stop_end = slow_start[long_enough], slow_end[long_enough]
+        
+        stopped = np.zeros(n - 1, dtype=bool)
+        if len(stop_start):
+            # 以差分標記停留區段內的步
+            marks = np.zeros(n, dtype=np.int32)
+            np.add.at(marks, stop_start, 1)
+            np.add.at(marks, stop_end, -1)
+            stopped = np.cumsum(marks[:-1]) > 0
+        
+        # 移動段落：停留之間的區段，再依步行 / 乘車切分
+        move_start, move_end = self._split_segments(speed, t, stopped)
+        segment_distance = _reduce_runs(np.add, distance, move_start, move_end)
+        keep = segment_distance >= self.min_segment_distance
+        move_start, move_end, segment_distance = move_start[keep], move_end[keep], segment_distance[keep]
+        
+        segment_duration = t[move_end] - t[move_start]
+        average_speed = np.divide(segment_distance, segment_duration, out=np.zeros(len(move_start)),
+                                  where=segment_duration > 0) * 3600
+        max_speed = _reduce_runs(np.maximum, speed, move_start, move_end)
+        if trace.dwell_time is not None:
+            slow_time = trace.dwell_time[move_end] - trace.dwell_time[move_start]
+        else:
+            dwell_speed = self.smoothed_speed(trace, self.dwell_window)
+            slow_time = _reduce_runs(np.add, np.where(dwell_speed < self.dwell_speed, duration, 0.0),
+                                     move_start, move_end)
+        stop_ratio = np.divide(slow_time, segment_duration, out=np.zeros(len(move_start)),
+                               where=segment_duration > 0)
+        modes, confidence = self.infer_modes(average_speed, max_speed, stop_ratio)
+        
+        # 停留點中心座標
+        lat_sum = np.concatenate(([0.0], np.cumsum(lat)))
+        lon_sum = np.concatenate(([0.0], np.cumsum(lon)))
+        stop_points = stop_end - stop_start + 1
+        stop_lat = (lat_sum[stop_end + 1] - lat_sum[stop_start]) / stop_points
+        stop_lon = (lon_sum[stop_end + 1] - lon_sum[stop_start]) / stop_points
+        stop_duration = t[stop_end] - t[stop_start]
+        
+        result['segments'] = [
+            {
+                'type': TRANSPORT_MODES[modes[i]],
+                'confidence': float(confidence[i]),
+                'start_time': format_timestamp(t[move_start[i]]),
+                'end_time': format_timestamp(t[move_end[i]]),
+                'start_location': {'latitude': float(lat[move_start[i]]), 'longitude': float(lon[move_start[i]])},
+                'end_location': {'latitude': float(lat[move_end[i]]), 'longitude': float(lon[move_end[i]])},
+                'distance': round(float(segment_distance[i]), 3),
+                'duration': round(float(segment_duration[i]) / 60, 2),
+                'average_speed': round(float(average_speed[i]), 2),
+                'max_speed': round(float(max_speed[i]), 2),
+                'point_count': int(move_end[i] - move_start[i] + 1)
+            }
+            for i in range(len(move_start))
+        ]
+        result['stops'] = [
+            {
+                'latitude': float(stop_lat[i]),
+                'longitude': float(stop_lon[i]),
+                'start_time': format_timestamp(t[stop_start[i]]),
+                'end_time': format_timestamp(t[stop_end[i]]),
+                'duration': round(float(stop_duration[i]) / 60, 2)
+            }
+            for i in range(len(stop_start))
+        ]
+        
+        # 常去地點：停留點與大眾運輸上下車點
+        transit = np.flatnonzero(modes == TRANSPORT_MODES.index('public_transport'))
+        endpoints = np.concatenate((move_start[transit], move_end[transit]))
+        result['places'] = self.find_places(
+            np.concatenate((stop_lat, lat[endpoints])),
+            np.concatenate((stop_lon, lon[endpoints])),
+            np.concatenate((t[stop_start], t[endpoints])),
+            np.concatenate((stop_duration, np.zeros(len(endpoints)))),
+            np.concatenate((np.zeros(len(stop_start), dtype=bool), np.ones(len(endpoints), dtype=bool)))
+        )
+        
+        breakdown = {}
+        for code in np.unique(modes):
+            selected = modes == code
+            breakdown[TRANSPORT_MODES[code]] = {
+                'count': int(selected.sum()),
+                'distance': round(float(segment_distance[selected].sum()), 3),
+                'duration': round(float(segment_duration[selected].sum()) / 60, 2)
+            }
+        
+        result.update({
+            'total_distance': round(float(distance.sum()), 3),
+            'total_duration': round(float(t[-1] - t[0]) / 60, 2),
+            'moving_duration': round(float(segment_duration.sum()) / 60, 2),
+            'stop_duration': round(float(stop_duration.sum()) / 60, 2),
+            'mode_breakdown': breakdown
+        })
+        return result
+    
+    def _split_segments(self, speed: np.ndarray, t: np.ndarray, stopped: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """將停留之間的移動區段依步行 / 乘車切分，回傳各段落的步 [start, end)"""
+        # 各步狀態：0 停留、1 步行速度、2 乘車速度
+        state = np.where(stopped, 0, np.where(speed < self.walking_max_speed * 0.8, 1, 2))
+        change = np.flatnonzero(np.diff(state)) + 1
+        run_start = np.concatenate(([0], change))
+        run_end = np.append(change, len(state))
+        run_state = state[run_start]
+        
+        # 持續時間過短的步行 / 乘車區段（等紅燈、走到車上）併入相鄰的移動區段
+        short = (run_state > 0) & (t[run_end] - t[run_start] < self.min_mode_duration)
+        if short.any():
+            index = np.arange(len(run_state))
+            previous = np.maximum.accumulate(np.where(short, -1, index))
+            following = np.minimum.accumulate(np.where(short, len(index), index)[::-1])[::-1]
+            previous_state = np.where(previous >= 0, run_state[np.maximum(previous, 0)], 0)
+            following_state = np.where(following < len(index), run_state[np.minimum(following, len(index) - 1)], 0)
+            filled = np.where(previous_state > 0, previous_state, following_state)
+            run_state = np.where(short & (filled > 0), filled, run_state)
+            state = np.repeat(run_state, run_end - run_start)
+        
+        moving_start, moving_end = [], []
+        for mode_state in (1, 2):
+            starts, ends = _runs(state == mode_state)
+            moving_start.append(starts)
+            moving_end.append(ends)
+        starts, ends = np.concatenate(moving_start), np.concatenate(moving_end)
+        order = np.argsort(starts, kind='stable')
+        return starts[order], ends[order]
+    
+    def analyze_movements(self, movements: List[Dict], utc_offset: Optional[float] = None) -> Dict:
+        """分析移動記錄：交通方式分布、時段分布與平均速度；未標示方式的記錄依速度推斷"""
+        count = len(movements)
+        if count == 0:
+            return {
+                'movement_count': 0,
+                'total_distance': 0.0,
+                'total_duration': 0.0,
+                'average_speed': 0.0,
+                'type_breakdown': {},
+                'hourly_distribution': [0] * 24,
+                'peak_hour': None,
+                'inferred_count': 0,
+                'places': []
+            }
+        
+        start_locations = [movement.get('startLocation') or {} for movement in movements]
+        end_locations = [movement.get('endLocation') or {} for movement in movements]
+        
+        distance = np.array([movement.get('distance', np.nan) for movement in movements], dtype=np.float64)
+        # 未提供距離時以起訖點的 Haversine 距離計算
+        missing = np.isnan(distance)
+        if missing.any():
+            coordinates = np.array([
+                [start.get('latitude', np.nan), start.get('longitude', np.nan),
+                 end.get('latitude', np.nan), end.get('longitude', np.nan)]
+                for start, end in zip(start_locations, end_locations)
+            ], dtype=np.float64)
+            computed = haversine_km(coordinates[:, 0], coordinates[:, 1], coordinates[:, 2], coordinates[:, 3])
+            distance = np.where(missing, computed, distance)
+        distance = np.nan_to_num(distance)
+        
+        # 開始時間：timestamp 或 startLocation.timestamp
+        start_values = [movement.get('timestamp') or start.get('timestamp')
+                        for movement, start in zip(movements, start_locations)]
+        has_start = np.array([value is not None for value in start_values])
+        start_time = np.full(count, np.nan)
+        if has_start.any():
+            start_time[has_start] = parse_timestamps([value for value in start_values if value is not None])
+        
+        # 持續時間（分鐘）：duration 或起訖時間差
+        duration = np.array([movement.get('duration', np.nan) for movement in movements], dtype=np.float64)
+        missing = np.isnan(duration)
+        if missing.any():
+            end_values = [end.get('timestamp') for end in end_locations]
+            has_end = np.array([value is not None for value in end_values])
+            end_time = np.full(count, np.nan)
+            if has_end.any():
+                end_time[has_end] = parse_timestamps([value for value in end_values if value is not None])
+            duration = np.where(missing, (end_time - start_time) / 60, duration)
+        duration = np.clip(np.nan_to_num(duration), 0, None)
+        
+        average_speed = np.divide(distance, duration, out=np.zeros(count), where=duration > 0) * 60
+        
+        # 交通方式：未提供或 unknown 時依平均速度推斷
+        type_codes = {mode: code for code, mode in enumerate(TRANSPORT_MODES)}
+        modes = np.array([type_codes.get(movement.get('type'), UNKNOWN_MODE) for movement in movements])
+        unknown = modes == UNKNOWN_MODE
+        if unknown.any():
+            inferred, _ = self.infer_modes(average_speed[unknown], average_speed[unknown], np.zeros(unknown.sum()))
+            modes[unknown] = inferred
+        
+        total_distance = float(distance.sum())
+        breakdown = {}
+        for code in np.unique(modes):
+            selected = modes == code
+            mode_distance = float(distance[selected].sum())
+            breakdown[TRANSPORT_MODES[code]] = {
+                'count': int(selected.sum()),
+                'distance': round(mode_distance, 3),
+                'duration': round(float(duration[selected].sum()), 2),
+                'share': round(mode_distance / total_distance, 3) if total_distance > 0 else 0.0
+            }
+        
+        offset = self.utc_offset if utc_offset is None else utc_offset
+        places = self._movement_places(start_locations, end_locations, start_time, duration, offset)
+        
+        valid_time = np.isfinite(start_time)
+        hours = (((start_time[valid_time] + offset * 3600) // 3600) % 24).astype(np.int64)
+        hourly = np.bincount(hours, minlength=24)
+        total_duration = float(duration.sum())
+        
+        return {
+            'movement_count': count,
+            'total_distance': round(total_distance, 3),
+            'total_duration': round(total_duration, 2),
+            'average_speed': round(total_distance / total_duration * 60, 2) if total_duration > 0 else 0.0,
+            'type_breakdown': breakdown,
+            'hourly_distribution': hourly.tolist(),
+            'peak_hour': int(hourly.argmax()) if hours.size else None,
+            'inferred_count': int((unknown & (modes != UNKNOWN_MODE)).sum()),
+            'places': places
+        }
+    
+    def _movement_places(self, start_locations: List[Dict], end_locations: List[Dict], start_time: np.ndarray,
+                         duration: np.ndarray, utc_offset: float) -> List[Dict]:
+        """由移動記錄的起訖點找出常去地點：在終點停留到下一筆記錄出發為止"""
+        end_lat = np.array([end.get('latitude', np.nan) for end in end_locations], dtype=np.float64)
+        end_lon = np.array([end.get('longitude', np.nan) for end in end_locations], dtype=np.float64)
+        arrival = start_time + duration * 60
+        
+        # 依出發時間排序，停留時間為下一筆記錄的出發時間減去到達時間（最多一天）
+        order = np.argsort(np.nan_to_num(start_time, nan=np.inf), kind='stable')
+        dwell = np.zeros(len(order))
+        dwell[order[:-1]] = start_time[order[1:]] - arrival[order[:-1]]
+        dwell = np.clip(np.nan_to_num(dwell), 0, 86400)
+        
+        # 第一筆記錄的起點也是一次造訪
+        first = start_locations[order[0]]
+        latitude = np.append(end_lat, first.get('latitude', np.nan))
+        longitude = np.append(end_lon, first.get('longitude', np.nan))
+        arrival = np.append(arrival, start_time[order[0]])
+        dwell = np.append(dwell, 0.0)
+        valid = np.isfinite(latitude) & np.isfinite(longitude)
+        return self.find_places(latitude[valid], longitude[valid], np.nan_to_num(arrival[valid]), dwell[valid],
+                                utc_offset=utc_offset)
+    
+    def find_places(self, latitude: np.ndarray, longitude: np.ndarray, arrival: np.ndarray, duration: np.ndarray,
+                    transit: Optional[np.ndarray] = None, utc_offset: Optional[float] = None) -> List[Dict]:
+        """將造訪（停留點或移動記錄的終點）聚類為常去地點，並標示住家、工作地點與車站
+        
+        arrival 為到達時間（UNIX 秒數），duration 為停留秒數；transit 標示大眾運輸上下車點，
+        多數造訪為上下車點的地點標示為車站。依累計停留時間由長到短排列。
+        """
+        if len(latitude) == 0:
+            return []
+        offset = self.utc_offset if utc_offset is None else utc_offset
+        transit = np.zeros(len(latitude), dtype=bool) if transit is None else transit
+        
+        index = SpatialIndex(cell_size=self.place_radius, capacity=len(latitude))
+        index.insert(latitude, longitude)
+        labels = index.cluster(self.place_radius, min_points=1)
+        summary = cluster_summary(index.latitude, index.longitude, labels, weights=duration)
+        size = len(summary['count'])
+        
+        total = summary['weight']
+        night = np.bincount(labels, weights=_daily_overlap(arrival, arrival + duration, *self.night_hours, offset),
+                            minlength=size)
+        day = np.bincount(labels, weights=_daily_overlap(arrival, arrival + duration, *self.work_hours, offset),
+                          minlength=size)
+        transit_visits = np.bincount(labels, weights=transit, minlength=size)
+        
+        kinds = np.full(size, 'other', dtype=object)
+        kinds[transit_visits * 2 > summary['count']] = 'station'
+        home = int(night.argmax())
+        if night[home] >= self.min_place_duration:
+            kinds[home] = 'home'
+            day[home] = 0
+        work = int(day.argmax())
+        if day[work] >= self.min_place_duration:
+            kinds[work] = 'work'
+        
+        frequent = ((summary['count'] >= self.min_place_visits) | (total >= self.min_place_duration)
+                    | np.isin(kinds, ('home', 'work')))
+        return [
+            {
+                'type': kinds[i],
+                'latitude': float(summary['latitude'][i]),
+                'longitude': float(summary['longitude'][i]),
+                'radius': round(float(summary['radius'][i]), 1),
+                'visits': int(summary['count'][i]),
+                'duration': round(float(total[i]) / 60, 2)
+            }
+            for i in sorted(np.flatnonzero(frequent), key=lambda i: (-total[i], -summary['count'][i]))
+        ]
+    
+    def generate_insights(self, movement_data) -> List[Dict]:
+        """生成移動相關的洞察；movement_data 可為移動記錄列表或 analyze_patterns 的輸入"""
+        try:
+            if isinstance(movement_data, list):
+                movement_data = {'movements': movement_data}
+            analysis = self.analyze_patterns(movement_data)
+            
+            # 合併軌跡段落與移動記錄的交通方式統計
+            distances: Dict[str, float] = {}
+            short_driving = 0
+            for source in ('trace', 'movements'):
+                if source not in analysis:
+                    continue
+                key = 'mode_breakdown' if source == 'trace' else 'type_breakdown'
+                for mode, stats in analysis[source][key].items():
+                    distances[mode] = distances.get(mode, 0.0) + stats['distance']
+            
+            for segment in analysis.get('trace', {}).get('segments', []):
+                if segment['type'] == 'driving' and segment['distance'] < 3:
+                    short_driving += 1
+            for movement in movement_data.get('movements') or []:
+                if movement.get('type') == 'driving' and 0 < (movement.get('distance') or 0) < 3:
+                    short_driving += 1
+            
+            insights = []
+            total_distance = sum(distances.values())
+            if total_distance <= 0:
+                return insights
+            
+            low_carbon = sum(distances.get(mode, 0.0) for mode in ('walking', 'cycling', 'public_transport'))
+            driving_share = distances.get('driving', 0.0) / total_distance
+            low_carbon_share = low_carbon / total_distance
+            
+            if driving_share > 0.7:
+                insights.append({
+                    'type': 'warning',
+                    'title': '以開車為主',
+                    'description': f'開車佔總移動距離的 {driving_share * 100:.1f}%，可考慮以大眾運輸替代部分行程',
+                    'priority': 'high'
+                })
+            elif low_carbon_share >= 0.5:
+                insights.append({
+                    'type': 'achievement',
+                    'title': '低碳移動',
+                    'description': f'步行、自行車與大眾運輸佔總移動距離的 {low_carbon_share * 100:.1f}%',
+                    'priority': 'medium'
+                })
+            
+            if short_driving:
+                insights.append({
+                    'type': 'tip',
+                    'title': '短程開車',
+                    'description': f'有 {short_driving} 趟 3 公里以內的開車行程，可改為步行或騎自行車',
+                    'priority': 'medium'
+                })
+            
+            peak_hour = analysis.get('movements', {}).get('peak_hour')
+            if peak_hour is not None and peak_hour in (7, 8, 17, 18):
+                insights.append({
+                    'type': 'tip',
+                    'title': '尖峰時段移動',
+                    'description': f'最常在 {peak_hour}:00 時段移動，錯開尖峰可減少塞車造成的額外排放',
+                    'priority': 'low'
+                })
+            
+            return insights
+        
+        except Exception as e:
+            logger.error(f"生成移動洞察失敗: {e}")
+            return []
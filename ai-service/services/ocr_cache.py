@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class OCRResultCache:
+    """以圖片內容雜湊為鍵的 OCR 結果快取
+    
+    第一層為記憶體 LRU，依結果序列化後的位元組數淘汰；第二層為選用的 SQLite 磁碟快取，
+    可在重新啟動或多個 worker 之間共用。鍵包含引擎/設定版本，設定變更後舊結果自動失效。
+    """
+    
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_path: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self.lock = threading.Lock()
+        
+        self.metrics = {
+            'hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+        
+        self.db = None
+        if disk_path:
+            try:
+                self.db = sqlite3.connect(disk_path, check_same_thread=False)
+                self.db.execute(
+                    'CREATE TABLE IF NOT EXISTS ocr_results '
+                    '(key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL)'
+                )
+                self.db.commit()
+            except Exception as e:
+                logger.warning(f"OCR 磁碟快取初始化失敗: {e}")
+                self.db = None
+    
+    @staticmethod
+    def make_key(image_bytes: bytes, version: str) -> str:
+        """由圖片內容與引擎/設定版本產生快取鍵"""
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        return f'{digest}:{hashlib.sha256(version.encode()).hexdigest()[:16]}'
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """讀取快取結果，未命中回傳 None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.metrics['hits'] += 1
+                return json.loads(value)
+            
+            if self.db is not None:
+                try:
+                    row = self.db.execute('SELECT value FROM ocr_results WHERE key = ?', (key,)).fetchone()
+                except Exception as e:
+                    logger.error(f"OCR 磁碟快取讀取失敗: {e}")
+                    row = None
+                if row is not None:
+                    self.metrics['disk_hits'] += 1
+                    self._store_memory(key, row[0])
+                    return json.loads(row[0])
+            
+            self.metrics['misses'] += 1
+            return None
+    
+    def put(self, key: str, result: Dict):
+        """寫入快取結果"""
+        value = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        with self.lock:
+            self.metrics['stores'] += 1
+            self._store_memory(key, value)
+            
+            if self.db is not None:
+                try:
+                    self.db.execute(
+                        'INSERT OR REPLACE INTO ocr_results (key, value, created_at) VALUES (?, ?, ?)',
+                        (key, value, time.time())
+                    )
+                    self.db.commit()
+                except Exception as e:
+                    logger.error(f"OCR 磁碟快取寫入失敗: {e}")
+    
+    def _store_memory(self, key: str, value: bytes):
+        """寫入記憶體層並依大小淘汰最久未使用的項目（呼叫端需持有鎖）"""
+        if len(value) > self.max_bytes:
+            return
+        
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= len(old)
+        
+        self.entries[key] = value
+        self.current_bytes += len(value)
+        
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.metrics['evictions'] += 1
+    
+    def stats(self) -> Dict:
+        """回傳快取命中率與容量統計"""
+        with self.lock:
+            lookups = self.metrics['hits'] + self.metrics['disk_hits'] + self.metrics['misses']
+            hits = self.metrics['hits'] + self.metrics['disk_hits']
+            return {
+                **self.metrics,
+                'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+                'entries': len(self.entries),
+                'memory_bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'disk_enabled': self.db is not None
+            }
+    
+    def clear(self):
+        """清除記憶體與磁碟快取"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+            if self.db is not None:
+                self.db.execute('DELETE FROM ocr_results')
+                self.db.commit()
@@ -1,51 +1,186 @@
 import cv2
 import numpy as np
-import pytesseract
-import easyocr
-from PIL import Image
-import re
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 import os
-from google.cloud import vision
+import sys
 import json
+import threading
+import types
+import time
+import multiprocessing
+import multiprocessing.context
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from services import metrics
+from services.ocr_cache import OCRResultCache
+from services.invoice_parser import InvoiceParser
+from services.image_preprocessor import ImagePreprocessor
 
 logger = logging.getLogger(__name__)
 
+# 行程內共用的 OCR 引擎池，同一行程的所有 OCRService 實例共用同一份引擎；
+# 在 fork 前預先載入時，worker 行程可透過 copy-on-write 共用記憶體分頁
+_engine_pool: Dict[str, object] = {}
+_engine_lock = threading.Lock()
+
+def _load_easyocr():
+    """載入 EasyOCR 引擎"""
+    import easyocr
+    return easyocr.Reader(['ch_tra', 'en'])
+
+def _vision_api():
+    """取得 Vision API 模組；GOOGLE_VISION_BACKEND=fake 時使用離線替身"""
+    if os.environ.get('GOOGLE_VISION_BACKEND', 'google').lower() == 'fake':
+        from services import fake_vision
+        return fake_vision
+    from google.cloud import vision
+    return vision
+
+def _load_google_vision():
+    """載入 Google Vision API 客戶端"""
+    return _vision_api().ImageAnnotatorClient()
+
+_engine_loaders = {
+    'easyocr': _load_easyocr,
+    'google_vision': _load_google_vision
+}
+
+def get_engine(name: str):
+    """取得 OCR 引擎，第一次使用時才初始化；初始化失敗時回傳 None"""
+    if name in _engine_pool:
+        return _engine_pool[name]
+    
+    with _engine_lock:
+        if name not in _engine_pool:
+            start = time.perf_counter()
+            try:
+                _engine_pool[name] = _engine_loaders[name]()
+                logger.info(f"OCR 引擎 {name} 初始化完成，耗時 {time.perf_counter() - start:.2f}s")
+            except Exception as e:
+                _engine_pool[name] = None
+                logger.warning(f"OCR 引擎 {name} 初始化失敗（耗時 {time.perf_counter() - start:.2f}s）: {e}")
+    
+    return _engine_pool[name]
+
+def preload_engines(names: Optional[List[str]] = None) -> Dict[str, bool]:
+    """預先載入 OCR 引擎（建議在 fork worker 之前於主行程呼叫）"""
+    return {name: get_engine(name) is not None for name in (names or list(_engine_loaders))}
+
+# 批次處理 worker 行程內的 OCRService
+_batch_worker_service = None
+
+def _init_batch_worker(config: Dict):
+    """初始化批次處理 worker 行程"""
+    global _batch_worker_service
+    _batch_worker_service = OCRService(**config)
+
+def _process_invoice_chunk(images_bytes: List[bytes]) -> List[Tuple[Dict, bool]]:
+    """在 worker 行程處理一組發票圖片"""
+    return _batch_worker_service.process_invoice_group(images_bytes)
+
+_main_module_lock = threading.Lock()
+
+class _BatchWorkerProcess(multiprocessing.context.SpawnProcess):
+    """批次 OCR worker 行程：只匯入 services.ocr_service
+    
+    spawn 預設會在子行程重新匯入主程式（python app.py 時以 __mp_main__ 匯入 app.py，建立所有服務）；
+    啟動子行程時暫時以空白模組取代 __main__，子行程只匯入 initializer 所在的本模組。
+    """
+    
+    @staticmethod
+    def _Popen(process_obj):
+        with _main_module_lock:
+            main = sys.modules['__main__']
+            sys.modules['__main__'] = types.ModuleType('__main__')
+            try:
+                return multiprocessing.context.SpawnProcess._Popen(process_obj)
+            finally:
+                sys.modules['__main__'] = main
+
+class _BatchWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _BatchWorkerProcess
+
 class OCRService:
     """OCR 服務類，用於處理發票和文檔的文本識別"""
     
-    def __init__(self):
-        self.easyocr_reader = easyocr.Reader(['ch_tra', 'en'])
+    ENGINES = ('tesseract', 'easyocr', 'google_vision')
+    
+    # 預處理、引擎或解析邏輯改變時需更新，使舊的快取結果失效
+    PIPELINE_VERSION = '2'
+    
+    # 引擎在執行器中排隊時，檢查是否已開始執行的間隔（秒）
+    QUEUE_POLL_SECONDS = 0.05
+    
+    def __init__(self, preload: bool = False, engine_timeout: float = 30.0,
+                 engine_timeouts: Optional[Dict[str, float]] = None,
+                 early_exit_confidence: Optional[float] = None, max_workers: int = 6,
+                 cache: Optional[OCRResultCache] = None, batch_workers: Optional[int] = None,
+                 batch_chunk_size: int = 4, batch_start_method: str = 'spawn',
+                 max_long_edge: Optional[int] = 2000, target_dpi: Optional[int] = None,
+                 decode_grayscale: bool = True):
+        # 引擎延遲到第一次使用時才載入
+        if preload:
+            preload_engines()
         
-        # 初始化 Google Vision API（如果可用）
-        try:
-            self.vision_client = vision.ImageAnnotatorClient()
-            self.use_google_vision = True
-        except Exception as e:
-            logger.warning(f"Google Vision API 初始化失敗: {e}")
-            self.use_google_vision = False
+        # 各引擎同時執行；逾時的引擎結果視為空白
+        self.engine_timeouts = {name: engine_timeout for name in self.ENGINES}
+        self.engine_timeouts.update(engine_timeouts or {})
+        
+        # 設定時，第一個解析結果置信度達到門檻的引擎勝出，其餘引擎不再等待
+        self.early_exit_confidence = early_exit_confidence
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ocr-engine')
+        
+        # 以圖片內容雜湊快取結果，重複上傳時直接回傳
+        self.cache = cache
+        
+        # 批次處理：圖片分組送到行程池，每組內 EasyOCR 以批次推論。每個 worker 行程各自載入
+        # EasyOCR 模型（PyTorch，常駐記憶體約 1 GB 以上），不與主行程共用，因此預設為 1（在目前行程處理）
+        self.batch_workers = batch_workers or 1
+        self.batch_chunk_size = max(1, batch_chunk_size)
+        self.batch_start_method = batch_start_method
+        self._process_pool = None
+        
+        # 預先編譯的發票解析器
+        self.invoice_parser = InvoiceParser()
+        
+        # 解碼時直接縮小並轉為灰度，所有引擎共用同一份解碼結果
+        self.preprocessor = ImagePreprocessor(max_long_edge=max_long_edge, target_dpi=target_dpi,
+                                              grayscale=decode_grayscale)
     
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
-        """預處理圖像以提高 OCR 準確性"""
-        try:
-            # 轉換為灰度圖
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def config_version(self) -> str:
+        """影響 OCR 結果的引擎與設定版本（作為快取鍵的一部分）"""
+        timeouts = ','.join(f'{name}={self.engine_timeouts[name]}' for name in self.ENGINES)
+        return (f'pipeline={self.PIPELINE_VERSION}|engines={timeouts}|early_exit={self.early_exit_confidence}'
+                f'|{self.preprocessor.config_version()}')
+    
+    @property
+    def easyocr_reader(self):
+        return get_engine('easyocr')
+    
+    @property
+    def vision_client(self):
+        return get_engine('google_vision')
+    
+    @property
+    def use_google_vision(self) -> bool:
+        return self.vision_client is not None
+    
+    def engine_status(self) -> Dict[str, str]:
+        """回傳各引擎的載入狀態（不會觸發載入）"""
+        status = {}
+        for name in _engine_loaders:
+            if name not in _engine_pool:
+                status[name] = 'not_loaded'
             else:
-                gray = image.copy()
-            
-            # 降噪
-            denoised = cv2.medianBlur(gray, 3)
-            
-            # 增強對比度
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-            enhanced = clahe.apply(denoised)
-            
-            # 二值化
-            _, binary = cv2.threshold(enhanced, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-            
-            return binary
+                status[name] = 'ready' if _engine_pool[name] is not None else 'unavailable'
+        return status
+    
+    def preprocess_image(self, image: np.ndarray, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """預處理圖像以提高 OCR 準確性（先縮小到目標尺寸，再灰度、降噪、增強對比度、二值化）"""
+        try:
+            image = self.preprocessor.resize(image, timings=timings)
+            return self.preprocessor.binarize(image, timings=timings)
         except Exception as e:
             logger.error(f"圖像預處理失敗: {e}")
             return image
@@ -53,6 +188,9 @@ class OCRService:
     def extract_text_tesseract(self, image: np.ndarray) -> str:
         """使用 Tesseract 提取文本"""
         try:
+            # pytesseract 在第一次使用時才匯入
+            import pytesseract
+            
             # 設定 Tesseract 配置
             config = '--oem 3 --psm 6 -l chi_tra+eng'
             
@@ -67,7 +205,11 @@ class OCRService:
     def extract_text_easyocr(self, image: np.ndarray) -> List[Tuple[str, float]]:
         """使用 EasyOCR 提取文本"""
         try:
-            results = self.easyocr_reader.readtext(image)
+            reader = self.easyocr_reader
+            if reader is None:
+                return []
+            
+            results = reader.readtext(image)
             return [(text, confidence) for (bbox, text, confidence) in results]
         except Exception as e:
             logger.error(f"EasyOCR 失敗: {e}")
@@ -76,11 +218,12 @@ class OCRService:
     def extract_text_google_vision(self, image_bytes: bytes) -> str:
         """使用 Google Vision API 提取文本"""
         try:
-            if not self.use_google_vision:
+            client = self.vision_client
+            if client is None:
                 return ""
             
-            image = vision.Image(content=image_bytes)
-            response = self.vision_client.text_detection(image=image)
+            image = _vision_api().Image(content=image_bytes)
+            response = client.text_detection(image=image)
             
             if response.error.message:
                 logger.error(f"Google Vision API 錯誤: {response.error.message}")
@@ -94,88 +237,12 @@ class OCRService:
             logger.error(f"Google Vision API 失敗: {e}")
             return ""
     
-    def parse_invoice_data(self, text: str) -> Dict:
+    def parse_invoice_data(self, text: str, timings: Optional[Dict[str, float]] = None) -> Dict:
         """解析發票文本，提取關鍵信息"""
         try:
-            invoice_data = {
-                'store_name': '',
-                'total_amount': 0.0,
-                'date': '',
-                'items': [],
-                'confidence': 0.0
-            }
-            
-            # 提取商店名稱（通常在發票開頭）
-            store_patterns = [
-                r'([^\n]+(?:商店|超市|便利商店|百貨|商場|市場|店))',
-                r'([^\n]+(?:Store|Market|Shop|Mall))',
-                r'統一超商|7-ELEVEN|全家|萊爾富|OK超商',
-                r'家樂福|大潤發|愛買|全聯|頂好'
-            ]
-            
-            for pattern in store_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    invoice_data['store_name'] = match.group(1).strip()
-                    break
-            
-            # 提取總金額
-            amount_patterns = [
-                r'總計[：:]\s*(\d+(?:\.\d{2})?)',
-                r'合計[：:]\s*(\d+(?:\.\d{2})?)',
-                r'總額[：:]\s*(\d+(?:\.\d{2})?)',
-                r'Total[：:]\s*(\d+(?:\.\d{2})?)',
-                r'NT\$\s*(\d+(?:\.\d{2})?)',
-                r'\$\s*(\d+(?:\.\d{2})?)'
-            ]
-            
-            for pattern in amount_patterns:
-                match = re.search(pattern, text, re.IGNORECASE)
-                if match:
-                    try:
-                        invoice_data['total_amount'] = float(match.group(1))
-                        break
-                    except ValueError:
-                        continue
-            
-            # 提取日期
-            date_patterns = [
-                r'(\d{4}[-/]\d{1,2}[-/]\d{1,2})',
-                r'(\d{1,2}[-/]\d{1,2}[-/]\d{4})',
-                r'(\d{4}年\d{1,2}月\d{1,2}日)'
-            ]
-            
-            for pattern in date_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    invoice_data['date'] = match.group(1)
-                    break
-            
-            # 提取商品項目（簡化版本）
-            lines = text.split('\n')
-            items = []
-            
-            for line in lines:
-                line = line.strip()
-                # 尋找包含價格的行
-                price_match = re.search(r'(\d+(?:\.\d{2})?)', line)
-                if price_match and len(line) > 5:
-                    # 簡單的商品名稱提取
-                    item_name = re.sub(r'\d+(?:\.\d{2})?', '', line).strip()
-                    if item_name and len(item_name) > 1:
-                        try:
-                            price = float(price_match.group(1))
-                            items.append({
-                                'name': item_name,
-                                'price': price,
-                                'quantity': 1
-                            })
-                        except ValueError:
-                            continue
-            
-            invoice_data['items'] = items[:10]  # 限制最多10個商品
-            
-            return invoice_data
+            # 單次掃描解析：商店名稱、總金額、日期、商品項目（最多 10 個）
+            with metrics.timed('ocr', 'parse', timings):
+                return self.invoice_parser.parse(text)
             
         except Exception as e:
             logger.error(f"發票數據解析失敗: {e}")
@@ -213,6 +280,107 @@ class OCRService:
             logger.error(f"置信度計算失敗: {e}")
             return 0.0
     
+    def engine_text(self, engine: str, result) -> str:
+        """將引擎輸出轉為純文字"""
+        if engine == 'easyocr':
+            return ' '.join([text for text, _ in result]) if result else ''
+        return result or ''
+    
+    def engine_confidence(self, engine: str, result) -> float:
+        """單一引擎的文字置信度（與 calculate_confidence 的各項分數相同，未加權）"""
+        if not result:
+            return 0.0
+        if engine == 'easyocr':
+            return sum(conf for _, conf in result) / len(result)
+        return min(len(result) / 100, 1.0)
+    
+    def parsed_invoice_confidence(self, engine: str, result, invoice_data: Dict) -> float:
+        """單一引擎解析結果的置信度：引擎置信度 × 欄位完整度（金額 0.5、日期 0.25、商店 0.25）"""
+        completeness = 0.0
+        if invoice_data.get('total_amount', 0) > 0:
+            completeness += 0.5
+        if invoice_data.get('date'):
+            completeness += 0.25
+        if invoice_data.get('store_name'):
+            completeness += 0.25
+        return self.engine_confidence(engine, result) * completeness
+    
+    def run_engines(self, image: np.ndarray, processed_image: np.ndarray, image_bytes: bytes,
+                    precomputed: Optional[Dict[str, object]] = None,
+                    timings: Optional[Dict[str, float]] = None) -> Tuple[Dict[str, object], Optional[str], Optional[Dict]]:
+        """同時執行所有 OCR 引擎
+        
+        回傳 (各引擎結果, 提前勝出的引擎, 勝出引擎的解析結果)。逾時或被取消的引擎不會出現在結果中；
+        已在執行中的引擎無法中斷，會在背景完成後被忽略。precomputed 中的引擎結果（例如批次
+        EasyOCR 推論）直接使用，不再執行。timings 提供時記錄各引擎與解析的耗時（毫秒）。
+        """
+        results = dict(precomputed or {})
+        tasks = {
+            'tesseract': (self.extract_text_tesseract, processed_image),
+            'easyocr': (self.extract_text_easyocr, image),
+            'google_vision': (self.extract_text_google_vision, image_bytes)
+        }
+        
+        # 逾時從引擎開始執行時計算（started 由執行緒寫入），在執行器中排隊的時間不計入；
+        # 排隊超過該引擎的逾時秒數仍未開始時放棄
+        start = time.monotonic()
+        started: Dict[str, float] = {}
+        futures = {
+            self.executor.submit(self._timed_engine, name, func, arg, started): name
+            for name, (func, arg) in tasks.items() if name not in results
+        }
+        
+        def deadline(future) -> float:
+            name = futures[future]
+            return started.get(name, start) + self.engine_timeouts[name]
+        
+        pending = set(futures)
+        while pending:
+            # 放棄已逾時的引擎
+            now = time.monotonic()
+            for future in [f for f in pending if deadline(f) <= now]:
+                future.cancel()
+                pending.discard(future)
+                name = futures[future]
+                reason = '逾時' if name in started else '排隊逾時'
+                logger.warning(f"OCR 引擎 {name} {reason}（{self.engine_timeouts[name]}s）")
+            
+            if not pending:
+                break
+            
+            # 尚未開始的引擎每 QUEUE_POLL_SECONDS 檢查一次是否已開始
+            wake = [deadline(f) if futures[f] in started else min(deadline(f), now + self.QUEUE_POLL_SECONDS)
+                    for f in pending]
+            done, pending = wait(pending, timeout=min(wake) - now, return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                name = futures[future]
+                results[name], seconds = future.result()
+                if timings is not None:
+                    timings[name] = round(seconds * 1000, 3)
+                
+                if self.early_exit_confidence is None:
+                    continue
+                
+                invoice_data = self.parse_invoice_data(self.engine_text(name, results[name]), timings)
+                if self.parsed_invoice_confidence(name, results[name], invoice_data) >= self.early_exit_confidence:
+                    for other in pending:
+                        other.cancel()
+                    logger.info(f"OCR 引擎 {name} 達到置信度門檻，提前結束")
+                    return results, name, invoice_data
+        
+        return results, None, None
+    
+    @staticmethod
+    def _timed_engine(name: str, func, arg, started: Dict[str, float]) -> Tuple[object, float]:
+        """執行引擎並回傳 (結果, 耗時秒數)；耗時由等待結果的執行緒寫入 timings，背景完成的引擎只記錄直方圖"""
+        started[name] = time.monotonic()
+        start = time.perf_counter()
+        result = func(arg)
+        seconds = time.perf_counter() - start
+        metrics.record('ocr', name, seconds)
+        return result, seconds
+    
     def process_invoice(self, image_file) -> Dict:
         """處理發票圖片，返回解析結果"""
         try:
@@ -220,34 +388,93 @@ class OCRService:
             image_bytes = image_file.read()
             image_file.seek(0)  # 重置文件指針
             
-            # 轉換為 OpenCV 格式
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
+            return self.process_invoice_bytes(image_bytes)
+        
+        except Exception as e:
+            logger.error(f"發票 OCR 處理失敗: {e}")
+            return self._invoice_error_response(e)
+    
+    def process_invoice_bytes(self, image_bytes: bytes) -> Dict:
+        """處理發票圖片內容（含快取）"""
+        # 相同圖片內容直接回傳快取結果
+        cache_key = None
+        if self.cache is not None:
+            cache_key = OCRResultCache.make_key(image_bytes, self.config_version())
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                cached['cached'] = True
+                return cached
+        
+        response, cacheable = self._process_invoice_uncached(image_bytes)
+        
+        if cache_key is not None and cacheable:
+            self.cache.put(cache_key, response)
+        
+        return response
+    
+    def _decode_image(self, image_bytes: bytes, timings: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """將圖片內容解碼為 OpenCV 格式（縮小到目標尺寸，預設直接解碼為灰度）"""
+        return self.preprocessor.decode(image_bytes, timings=timings)
+    
+    def _invoice_error_response(self, error: Exception) -> Dict:
+        return {
+            'success': False,
+            'error': str(error),
+            'data': {
+                'store_name': '',
+                'total_amount': 0.0,
+                'date': '',
+                'items': [],
+                'confidence': 0.0,
+                'raw_text': ''
+            }
+        }
+    
+    def _process_invoice_uncached(self, image_bytes: bytes, image: Optional[np.ndarray] = None,
+                                  precomputed: Optional[Dict[str, object]] = None,
+                                  timings: Optional[Dict[str, float]] = None) -> Tuple[Dict, bool]:
+        """執行完整的發票 OCR 流程
+        
+        回傳 (結果, 是否可快取)；有引擎逾時或處理失敗時結果不完整，不應快取。
+        """
+        start = time.perf_counter()
+        try:
+            # 轉換為 OpenCV 格式（批次處理時已先解碼，耗時已記錄在 timings）
+            timings = {} if timings is None else timings
+            elapsed_before = sum(timings.values()) / 1000
             if image is None:
-                raise ValueError("無法讀取圖片")
+                image = self._decode_image(image_bytes, timings)
             
             # 預處理圖像
-            processed_image = self.preprocess_image(image)
-            
-            # 使用多種 OCR 方法
-            tesseract_text = self.extract_text_tesseract(processed_image)
-            easyocr_results = self.extract_text_easyocr(image)
-            google_text = self.extract_text_google_vision(image_bytes)
-            
-            # 合併文本結果
-            combined_text = tesseract_text
-            if easyocr_results:
-                easyocr_text = ' '.join([text for text, _ in easyocr_results])
-                combined_text += '\n' + easyocr_text
-            if google_text:
-                combined_text += '\n' + google_text
-            
-            # 解析發票數據
-            invoice_data = self.parse_invoice_data(combined_text)
+            processed_image = self.preprocess_image(image, timings)
+            
+            # 同時使用多種 OCR 方法
+            stages: Dict[str, float] = {}
+            results, winner, winner_data = self.run_engines(image, processed_image, image_bytes, precomputed, stages)
+            tesseract_text = results.get('tesseract', '')
+            easyocr_results = results.get('easyocr', [])
+            google_text = results.get('google_vision', '')
+            
+            if winner is not None:
+                # 提前勝出的引擎直接作為結果
+                invoice_data = winner_data
+                combined_text = self.engine_text(winner, results[winner])
+                confidence = self.parsed_invoice_confidence(winner, results[winner], invoice_data)
+            else:
+                # 合併文本結果
+                combined_text = tesseract_text
+                if easyocr_results:
+                    easyocr_text = ' '.join([text for text, _ in easyocr_results])
+                    combined_text += '\n' + easyocr_text
+                if google_text:
+                    combined_text += '\n' + google_text
+                
+                # 解析發票數據
+                invoice_data = self.parse_invoice_data(combined_text, stages)
+                
+                # 計算置信度
+                confidence = self.calculate_confidence(tesseract_text, easyocr_results, google_text)
             
-            # 計算置信度
-            confidence = self.calculate_confidence(tesseract_text, easyocr_results, google_text)
             invoice_data['confidence'] = confidence
             
             # 添加原始文本
@@ -255,42 +482,194 @@ class OCRService:
             
             logger.info(f"OCR 處理完成，置信度: {confidence:.2f}")
             
-            return {
+            response = {
                 'success': True,
                 'data': invoice_data,
-                'processing_time': 0,  # 可以添加實際處理時間
+                'processing_time': round(time.perf_counter() - start + elapsed_before, 4),
+                # 各階段耗時（毫秒）：解碼、預處理各步驟、各引擎（同時執行）與解析
+                'processing_breakdown_ms': {**timings, **stages},
                 'methods_used': {
                     'tesseract': bool(tesseract_text),
                     'easyocr': bool(easyocr_results),
                     'google_vision': bool(google_text)
                 }
             }
+            if winner is not None:
+                response['winning_engine'] = winner
             
+            # 預處理各步驟耗時（毫秒）與正規化後的圖像尺寸
+            response['preprocessing'] = {
+                'image_size': [image.shape[1], image.shape[0]],
+                'timings_ms': timings
+            }
+            
+            # 有引擎逾時的結果不完整
+            return response, winner is not None or len(results) == len(self.ENGINES)
+        
         except Exception as e:
             logger.error(f"發票 OCR 處理失敗: {e}")
-            return {
-                'success': False,
-                'error': str(e),
-                'data': {
-                    'store_name': '',
-                    'total_amount': 0.0,
-                    'date': '',
-                    'items': [],
-                    'confidence': 0.0,
-                    'raw_text': ''
-                }
+            return self._invoice_error_response(e), False
+    
+    def extract_text_easyocr_batch(self, images: List[np.ndarray]) -> List[List[Tuple[str, float]]]:
+        """批次執行 EasyOCR，尺寸相同的圖片合併為一次推論"""
+        results = [[] for _ in images]
+        reader = self.easyocr_reader
+        if reader is None:
+            return results
+        
+        # readtext_batched 要求同一批圖片尺寸一致，因此依尺寸分組
+        groups: Dict[Tuple, List[int]] = {}
+        for i, image in enumerate(images):
+            groups.setdefault(image.shape, []).append(i)
+        
+        for indices in groups.values():
+            if len(indices) == 1:
+                results[indices[0]] = self.extract_text_easyocr(images[indices[0]])
+                continue
+            try:
+                batched = reader.readtext_batched([images[i] for i in indices])
+                for i, image_results in zip(indices, batched):
+                    results[i] = [(text, confidence) for (bbox, text, confidence) in image_results]
+            except Exception as e:
+                logger.warning(f"EasyOCR 批次推論失敗，改為逐張處理: {e}")
+                for i in indices:
+                    results[i] = self.extract_text_easyocr(images[i])
+        
+        return results
+    
+    def process_invoice_group(self, images_bytes: List[bytes]) -> List[Tuple[Dict, bool]]:
+        """在目前行程處理一組發票圖片（不經過快取），EasyOCR 以批次推論"""
+        outcomes: List[Optional[Tuple[Dict, bool]]] = [None] * len(images_bytes)
+        decoded = {}
+        timings = [{} for _ in images_bytes]
+        for i, image_bytes in enumerate(images_bytes):
+            try:
+                decoded[i] = self._decode_image(image_bytes, timings[i])
+            except Exception as e:
+                logger.error(f"發票 OCR 處理失敗: {e}")
+                outcomes[i] = (self._invoice_error_response(e), False)
+        
+        indices = list(decoded)
+        with metrics.timed('ocr', 'easyocr_batch'):
+            easyocr_results = self.extract_text_easyocr_batch([decoded[i] for i in indices])
+        
+        for i, easyocr_result in zip(indices, easyocr_results):
+            outcomes[i] = self._process_invoice_uncached(
+                images_bytes[i], image=decoded[i], precomputed={'easyocr': easyocr_result}, timings=timings[i]
+            )
+        
+        return outcomes
+    
+    def worker_config(self) -> Dict:
+        """建立 worker 行程內 OCRService 所需的設定"""
+        return {
+            'engine_timeouts': dict(self.engine_timeouts),
+            'early_exit_confidence': self.early_exit_confidence,
+            'max_long_edge': self.preprocessor.max_long_edge,
+            'target_dpi': self.preprocessor.target_dpi,
+            'decode_grayscale': self.preprocessor.grayscale
+        }
+    
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """取得批次處理用的行程池（第一次使用時建立）"""
+        with _engine_lock:
+            if self._process_pool is None:
+                if self.batch_start_method == 'spawn':
+                    context = _BatchWorkerContext()
+                else:
+                    context = multiprocessing.get_context(self.batch_start_method)
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.batch_workers,
+                    mp_context=context,
+                    initializer=_init_batch_worker,
+                    initargs=(self.worker_config(),)
+                )
+            return self._process_pool
+    
+    def process_invoices(self, batch: List, ordered: bool = True) -> Iterator[Tuple[int, Dict]]:
+        """批次處理多張發票圖片
+        
+        batch 可為檔案物件或 bytes。圖片依 batch_chunk_size 分組送到行程池，每組內的 EasyOCR
+        以批次推論。產生 (輸入索引, 結果)；ordered 為 True 時依輸入順序產生，否則每完成一張即產生。
+        """
+        images_bytes = []
+        for item in batch:
+            if isinstance(item, (bytes, bytearray)):
+                images_bytes.append(bytes(item))
+            else:
+                images_bytes.append(item.read())
+                item.seek(0)
+        
+        # 快取命中的圖片不需送到 worker
+        cache_keys = {}
+        ready: Dict[int, Dict] = {}
+        pending = []
+        for i, image_bytes in enumerate(images_bytes):
+            if self.cache is not None:
+                cache_keys[i] = OCRResultCache.make_key(image_bytes, self.config_version())
+                cached = self.cache.get(cache_keys[i])
+                if cached is not None:
+                    cached['cached'] = True
+                    ready[i] = cached
+                    continue
+            pending.append(i)
+        
+        chunks = [pending[i:i + self.batch_chunk_size] for i in range(0, len(pending), self.batch_chunk_size)]
+        
+        def completed_chunks():
+            if self.batch_workers <= 1 or len(chunks) <= 1:
+                # 單一 worker 或只有一組時直接在目前行程處理
+                for chunk in chunks:
+                    yield chunk, self.process_invoice_group([images_bytes[i] for i in chunk])
+                return
+            
+            pool = self._get_process_pool()
+            futures = {
+                pool.submit(_process_invoice_chunk, [images_bytes[i] for i in chunk]): chunk
+                for chunk in chunks
             }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    outcomes = future.result()
+                except Exception as e:
+                    logger.error(f"批次發票 OCR worker 失敗: {e}")
+                    outcomes = [(self._invoice_error_response(e), False) for _ in chunk]
+                # worker 行程的直方圖不會回到主行程，依回應中的耗時明細補記
+                for response, _ in outcomes:
+                    for stage, milliseconds in response.get('processing_breakdown_ms', {}).items():
+                        metrics.record('ocr', stage, milliseconds / 1000)
+                yield chunk, outcomes
+        
+        if not ordered:
+            yield from sorted(ready.items())
+            ready.clear()
+        
+        next_index = 0
+        for chunk, outcomes in completed_chunks():
+            for i, (response, cacheable) in zip(chunk, outcomes):
+                if i in cache_keys and cacheable:
+                    self.cache.put(cache_keys[i], response)
+                if ordered:
+                    ready[i] = response
+                else:
+                    yield i, response
+            
+            # 依輸入順序產生已完成的連續結果
+            while next_index in ready:
+                yield next_index, ready.pop(next_index)
+                next_index += 1
+        
+        while next_index in ready:
+            yield next_index, ready.pop(next_index)
+            next_index += 1
     
     def process_document(self, image_file, document_type: str = 'general') -> Dict:
         """處理一般文檔"""
         try:
             # 讀取圖片
             image_bytes = image_file.read()
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if image is None:
-                raise ValueError("無法讀取圖片")
+            image = self._decode_image(image_bytes)
             
             # 預處理圖像
             processed_image = self.preprocess_image(image)
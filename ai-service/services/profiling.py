@@ -0,0 +1,223 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sampling')
+
+class StackSampler:
+    """以固定間隔讀取指定執行緒的呼叫堆疊，累計為 collapsed stack（flamegraph.pl、speedscope 可讀取）
+    
+    只使用標準函式庫（sys._current_frames），不需安裝取樣分析工具；只在被抽樣的請求期間執行。
+    """
+    
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        # threads 由執行緒池的執行緒修改、取樣執行緒讀取，以 lock 保護
+        self.lock = threading.Lock()
+        self.threads: Counter = Counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+    
+    def add_thread(self, ident: int):
+        with self.lock:
+            self.threads[ident] += 1
+    
+    def remove_thread(self, ident: int):
+        with self.lock:
+            self.threads[ident] -= 1
+            if self.threads[ident] <= 0:
+                del self.threads[ident]
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self.lock:
+                idents = list(self.threads)
+            frames = sys._current_frames()
+            for ident in idents:
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[self.collapse(frame)] += 1
+                    self.samples += 1
+    
+    @staticmethod
+    def collapse(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+class ProfileSession:
+    """單一被抽樣請求的分析；請求的工作可分散在多個執行緒（例如 ASGI 的執行緒池），依序啟用"""
+    
+    def __init__(self, mode: str, interval: float):
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.profile = cProfile.Profile() if mode == 'cprofile' else None
+        self.sampler = StackSampler(interval) if mode == 'sampling' else None
+    
+    def activate(self):
+        """在目前執行緒啟用分析；與 deactivate 成對呼叫"""
+        self.lock.acquire()
+        if self.profile is not None:
+            try:
+                self.profile.enable()
+            except ValueError:
+                # 同一時間只能有一個 cProfile 啟用時（Python 3.12 以後）略過此次分析
+                self.profile = None
+        elif self.sampler is not None:
+            self.sampler.add_thread(threading.get_ident())
+    
+    def deactivate(self):
+        if self.profile is not None:
+            self.profile.disable()
+        elif self.sampler is not None:
+            self.sampler.remove_thread(threading.get_ident())
+        self.lock.release()
+    
+    def __enter__(self) -> 'ProfileSession':
+        self.activate()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.deactivate()
+    
+    def wrap(self, function: Callable) -> Callable:
+        """在呼叫 function 的執行緒中啟用分析"""
+        def profiled(*args, **kwargs):
+            with self:
+                return function(*args, **kwargs)
+        return profiled
+    
+    def wrap_iterator(self, iterator: Iterator) -> Iterator:
+        """在取出每一項的執行緒中啟用分析（串流回應在執行緒池中逐段產生）"""
+        done = object()
+        while True:
+            with self:
+                item = next(iterator, done)
+            if item is done:
+                return
+            yield item
+    
+    def write(self, path: str) -> Optional[str]:
+        """寫入 .pstats（cprofile）或 .collapsed（sampling）檔案，回傳檔名；沒有資料時回傳 None"""
+        if self.profile is not None:
+            self.profile.create_stats()
+            if not self.profile.stats:
+                return None
+            path += '.pstats'
+            self.profile.dump_stats(path)
+            return path
+        if self.sampler is not None:
+            self.sampler.stop()
+            if not self.sampler.samples:
+                return None
+            path += '.collapsed'
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in self.sampler.stacks.most_common():
+                    f.write(f'{stack} {count}\n')
+            return path
+        return None
+
+class RequestProfiler:
+    """依抽樣比例分析請求，結果依端點寫入檔案
+    
+    sample_rate 為 0 時不抽樣（預設）；可在執行中以 configure 調整。每個端點最多保留
+    max_files 個檔案，超過時刪除最舊的檔案。
+    """
+    
+    def __init__(self, output_dir: str = 'profiles', sample_rate: float = 0.0, mode: str = 'cprofile',
+                 interval: float = 0.005, max_files: int = 50):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_files = max_files
+        self.lock = threading.Lock()
+        self.sequence = 0
+        self.written: Dict[str, int] = {}
+        self.latest: Dict[str, str] = {}
+        self.sample_rate = 0.0
+        self.mode = 'cprofile'
+        self.configure(sample_rate=sample_rate, mode=mode)
+    
+    def configure(self, sample_rate: Optional[float] = None, mode: Optional[str] = None) -> Dict:
+        if sample_rate is not None and not 0.0 <= float(sample_rate) <= 1.0:
+            raise ValueError('sample_rate 必須介於 0 與 1 之間')
+        if mode is not None and mode not in MODES:
+            raise ValueError(f'不支援的分析模式: {mode}')
+        with self.lock:
+            if sample_rate is not None:
+                self.sample_rate = float(sample_rate)
+            if mode is not None:
+                self.mode = mode
+        logger.info(f"請求分析設定: 抽樣比例 {self.sample_rate}, 模式 {self.mode}")
+        return self.status()
+    
+    def status(self) -> Dict:
+        with self.lock:
+            return {
+                'enabled': self.sample_rate > 0,
+                'sample_rate': self.sample_rate,
+                'mode': self.mode,
+                'output_dir': os.path.abspath(self.output_dir),
+                'profiles_written': dict(self.written),
+                'latest': dict(self.latest)
+            }
+    
+    def sample(self) -> Optional[ProfileSession]:
+        """依抽樣比例決定是否分析此請求"""
+        rate = self.sample_rate
+        if rate <= 0 or random.random() >= rate:
+            return None
+        return ProfileSession(self.mode, self.interval)
+    
+    def finish(self, session: ProfileSession, endpoint: str) -> Optional[str]:
+        """寫入分析結果，檔名為 <端點>.<時間>.<行程>.<序號>"""
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', endpoint).strip('_') or 'root'
+        with self.lock:
+            self.sequence += 1
+            sequence = self.sequence
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime('%Y%m%dT%H%M%S')
+            path = session.write(os.path.join(self.output_dir, f'{slug}.{stamp}.{os.getpid()}.{sequence}'))
+        except Exception as e:
+            logger.error(f"寫入請求分析結果失敗: {e}")
+            return None
+        if path is None:
+            return None
+        
+        with self.lock:
+            self.written[endpoint] = self.written.get(endpoint, 0) + 1
+            self.latest[endpoint] = path
+        self._prune(slug)
+        logger.info(f"請求分析 {endpoint}（{time.perf_counter() - session.start:.3f}s）: {path}")
+        return path
+    
+    def _prune(self, slug: str):
+        prefix = slug + '.'
+        try:
+            files = [os.path.join(self.output_dir, name) for name in os.listdir(self.output_dir)
+                     if name.startswith(prefix)]
+            files.sort(key=os.path.getmtime)
+            for path in files[:-self.max_files]:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"清除舊的請求分析檔案失敗: {e}")
@@ -0,0 +1,357 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.carbon_calculator import CarbonCalculator
+from services.emission_factors import FactorSnapshot
+
+logger = logging.getLogger(__name__)
+
+# 替代行動：原活動 → [(替代活動, 可替代的比例, 難度 0-1)]；'driving' 適用所有燃料車種
+SUBSTITUTIONS = {
+    'driving': [('metro', 0.3, 0.3), ('bus', 0.3, 0.4), ('cycling', 0.1, 0.5), ('walking', 0.05, 0.3),
+                ('driving_electric', 1.0, 0.9)],
+    'bus': [('metro', 0.5, 0.2), ('cycling', 0.1, 0.5)],
+    'flight_domestic': [('train', 0.8, 0.3)],
+    'beef': [('chicken', 0.5, 0.3), ('legumes', 0.3, 0.5)],
+    'pork': [('chicken', 0.5, 0.2), ('legumes', 0.3, 0.5)],
+    'dairy': [('legumes', 0.3, 0.6)]
+}
+
+# 節約行動：(代碼, 活動, 減少比例, 難度 0-1, 標題)
+CONSERVATION_ACTIONS = [
+    ('ac_temperature', 'electricity_taiwan', 0.06, 0.1, '冷氣溫度調高 1°C'),
+    ('standby_power', 'electricity_taiwan', 0.05, 0.1, '關閉待機電源'),
+    ('efficient_appliances', 'electricity_taiwan', 0.15, 0.7, '汰換為一級能效家電'),
+    ('water_heater', 'natural_gas', 0.1, 0.3, '縮短淋浴時間、降低熱水器溫度'),
+    ('second_hand', 'shopping', 0.2, 0.4, '選購二手或可重複使用的商品'),
+    ('repair', 'shopping', 0.1, 0.5, '維修取代汰換電子產品與衣物')
+]
+
+# 只提供類別總量時，假設的類別內排放組成
+DEFAULT_COMPOSITION = {
+    'transportation': {'driving_gasoline': 0.7, 'bus': 0.15, 'metro': 0.05, 'flight_domestic': 0.1},
+    'food': {'beef': 0.25, 'pork': 0.3, 'chicken': 0.15, 'dairy': 0.1, 'rice': 0.1, 'vegetables': 0.1},
+    'energy': {'electricity_taiwan': 0.85, 'natural_gas': 0.15},
+    'shopping': {'shopping': 1.0}
+}
+
+ACTIVITY_CATEGORIES = {
+    'walking': 'transportation', 'cycling': 'transportation', 'bus': 'transportation', 'train': 'transportation',
+    'metro': 'transportation', 'flight_domestic': 'transportation', 'flight_international': 'transportation',
+    'electricity_taiwan': 'energy', 'natural_gas': 'energy', 'lpg': 'energy', 'shopping': 'shopping'
+}
+
+ACTIVITY_NAMES = {
+    'driving_gasoline': '汽油車', 'driving_diesel': '柴油車', 'driving_electric': '電動車', 'bus': '公車',
+    'metro': '捷運', 'train': '火車或高鐵', 'cycling': '自行車', 'walking': '步行', 'flight_domestic': '國內航班',
+    'beef': '牛肉', 'pork': '豬肉', 'chicken': '雞肉', 'dairy': '乳製品', 'legumes': '豆類'
+}
+UNIT_NAMES = {'km': '公里', 'kg': '公斤'}
+DIFFICULTY_LEVELS = {'easy': 0.3, 'medium': 0.6, 'hard': 1.0}
+
+@dataclass(frozen=True)
+class CandidateSet:
+    """由單一係數版本預先計算的候選行動與向量化用的陣列；建立後不再修改，整組一次替換"""
+    snapshot: FactorSnapshot
+    factors: Dict[str, float]
+    units: Dict[str, str]
+    candidates: Tuple[Dict, ...]
+    activities: Tuple[str, ...]
+    activity_index: Dict[str, int]
+    candidate_activity: np.ndarray
+    candidate_reduction: np.ndarray
+    candidate_difficulty: np.ndarray
+    candidate_category: np.ndarray
+
+class RecommendationEngine:
+    """環保建議引擎
+    
+    候選行動在載入時由 CarbonCalculator 的排放係數預先計算（例如以捷運取代汽油車每公里
+    減少的排放），每個候選只記錄作用的活動與可減少的排放比例。產生建議時將用戶的排放
+    分布展開為各活動的排放向量，以向量化運算一次算出所有候選的減碳量。結果依用戶與
+    排放分布的雜湊快取 ttl 秒，重複載入儀表板時不需重新計算。係數版本替換後候選行動
+    會重新計算，快取鍵也包含係數版本。
+    
+    候選行動與其陣列組成一個 CandidateSet，重新計算時整組替換；每次產生建議只取用一次
+    self.state，與重新計算同時進行的請求不會混用新舊版本的資料。
+    """
+    
+    def __init__(self, carbon_calculator: Optional[CarbonCalculator] = None, ttl: float = 300.0,
+                 max_entries: int = 10000, limit: int = 5):
+        self.calculator = carbon_calculator or CarbonCalculator()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.limit = limit
+        # 分數 = 減碳量 × (1 - difficulty_weight × 難度)
+        self.difficulty_weight = 0.5
+        
+        self.state: Optional[CandidateSet] = None
+        self.build_lock = threading.Lock()
+        self._sync_factors()
+        
+        self._memo: 'OrderedDict[Tuple[str, str], Tuple[float, List[Dict]]]' = OrderedDict()
+        self.lock = threading.Lock()
+        self.metrics = {'hits': 0, 'misses': 0, 'evictions': 0}
+    
+    @staticmethod
+    def category_of(activity: str) -> str:
+        if activity.startswith('driving_'):
+            return 'transportation'
+        return ACTIVITY_CATEGORIES.get(activity, 'food')
+    
+    @property
+    def candidates(self) -> Tuple[Dict, ...]:
+        return self.state.candidates
+    
+    @property
+    def activities(self) -> Tuple[str, ...]:
+        return self.state.activities
+    
+    @property
+    def snapshot(self) -> FactorSnapshot:
+        return self.state.snapshot
+    
+    def _sync_factors(self) -> CandidateSet:
+        """係數版本替換後重新計算候選行動，回傳目前的候選行動"""
+        snapshot = self.calculator.factors
+        state = self.state
+        if state is not None and state.snapshot is snapshot:
+            return state
+        with self.build_lock:
+            state = self.state
+            if state is None or state.snapshot is not snapshot:
+                state = self._build_candidates(snapshot)
+                self.state = state
+            return state
+    
+    def _build_candidates(self, snapshot: FactorSnapshot) -> CandidateSet:
+        """預先計算所有候選行動"""
+        emission_factors = self.calculator.emission_factors
+        factors = {key: factor.factor for key, factor in emission_factors.items()}
+        units = {key: factor.unit for key, factor in emission_factors.items()}
+        
+        candidates = []
+        for source_group, targets in SUBSTITUTIONS.items():
+            sources = [key for key in factors if key.startswith('driving_')] if source_group == 'driving' \
+                else [source_group]
+            for source in sources:
+                for target, share, difficulty in targets:
+                    saving_per_unit = factors[source] - factors[target]
+                    if saving_per_unit <= 0:
+                        continue
+                    candidates.append({
+                        'id': f'{source}_to_{target}',
+                        'activity': source,
+                        'target': target,
+                        'reduction': share * saving_per_unit / factors[source],
+                        'share': share,
+                        'difficulty': difficulty,
+                        'saving_per_unit': round(saving_per_unit, 3),
+                        'unit': units[source],
+                        'title': f'以{ACTIVITY_NAMES[target]}取代{ACTIVITY_NAMES[source]}'
+                    })
+        for action_id, activity, reduction, difficulty, title in CONSERVATION_ACTIONS:
+            candidates.append({
+                'id': action_id,
+                'activity': activity,
+                'target': None,
+                'reduction': reduction,
+                'share': None,
+                'difficulty': difficulty,
+                'saving_per_unit': None,
+                'unit': None,
+                'title': title
+            })
+        
+        # 排放向量的維度：候選行動與預設組成涉及的所有活動
+        activities = {candidate['activity'] for candidate in candidates}
+        for composition in DEFAULT_COMPOSITION.values():
+            activities.update(composition)
+        activities = tuple(sorted(activities))
+        activity_index = {activity: i for i, activity in enumerate(activities)}
+        
+        return CandidateSet(
+            snapshot=snapshot,
+            factors=factors,
+            units=units,
+            candidates=tuple(candidates),
+            activities=activities,
+            activity_index=activity_index,
+            candidate_activity=np.array([activity_index[c['activity']] for c in candidates]),
+            candidate_reduction=np.array([c['reduction'] for c in candidates]),
+            candidate_difficulty=np.array([c['difficulty'] for c in candidates]),
+            candidate_category=np.array([self.category_of(c['activity']) for c in candidates])
+        )
+    
+    def exposure(self, data: Dict, state: Optional[CandidateSet] = None) -> Tuple[np.ndarray, float]:
+        """由請求展開各活動的排放向量（kg CO2），回傳 (排放向量, 總排放)
+        
+        carbon_data 可為 {'total', 'breakdown'}（breakdown 的鍵可為類別或活動，例如
+        driving_gasoline）或碳足跡記錄列表；movement_data 提供移動記錄時，以各交通方式的
+        排放比例取代預設的交通排放組成。
+        """
+        state = state or self._sync_factors()
+        activity_index = state.activity_index
+        carbon_data = data.get('carbon_data') or {}
+        if isinstance(carbon_data, list):
+            breakdown: Dict[str, float] = {}
+            for record in carbon_data:
+                activity_type = record.get('type', 'other')
+                breakdown[activity_type] = breakdown.get(activity_type, 0.0) + (record.get('carbon_footprint') or 0)
+            total = sum(breakdown.values())
+        else:
+            breakdown = carbon_data.get('breakdown') or {}
+            total = carbon_data.get('total', carbon_data.get('total_emission'))
+        
+        vector = np.zeros(len(state.activities))
+        detailed = {category: 0.0 for category in DEFAULT_COMPOSITION}
+        for key, value in breakdown.items():
+            if key in activity_index and key not in DEFAULT_COMPOSITION:
+                vector[activity_index[key]] += value or 0
+                category = self.category_of(key)
+                detailed[category] = detailed.get(category, 0.0) + (value or 0)
+        
+        if total is None:
+            # 活動層級的排放已包含在所屬類別的總量中
+            total = sum(value or 0 for key, value in breakdown.items() if key not in activity_index
+                        or key in DEFAULT_COMPOSITION)
+            total += sum(max(amount - (breakdown.get(category) or 0), 0) for category, amount in detailed.items())
+        
+        compositions = dict(DEFAULT_COMPOSITION)
+        transport = self._transport_composition(data.get('movement_data'), state)
+        if transport:
+            compositions['transportation'] = transport
+        
+        # 類別總量中未細分到活動的部分依組成分配
+        for category, composition in compositions.items():
+            remaining = (breakdown.get(category) or 0) - detailed.get(category, 0.0)
+            if remaining <= 0:
+                continue
+            for activity, share in composition.items():
+                vector[activity_index[activity]] += remaining * share
+        return vector, float(total or 0)
+    
+    def _transport_composition(self, movement_data, state: CandidateSet) -> Optional[Dict[str, float]]:
+        """由移動記錄估計各交通方式佔交通排放的比例"""
+        if isinstance(movement_data, dict):
+            movement_data = movement_data.get('movements')
+        if not movement_data:
+            return None
+        emissions: Dict[str, float] = {}
+        for movement in movement_data:
+            movement_type = movement.get('type')
+            if movement_type == 'driving':
+                fuel = (movement.get('metadata') or {}).get('fuelType') or movement.get('vehicle_type') or 'gasoline'
+                activity = f'driving_{fuel}' if f'driving_{fuel}' in state.activity_index else 'driving_gasoline'
+            elif movement_type == 'public_transport':
+                activity = movement.get('mode') if movement.get('mode') in state.activity_index else 'bus'
+            elif movement_type == 'flying':
+                activity = 'flight_domestic'
+            else:
+                continue
+            emission = (movement.get('distance') or 0) * state.factors.get(activity, 0.0)
+            emissions[activity] = emissions.get(activity, 0.0) + emission
+        total = sum(emissions.values())
+        if total <= 0:
+            return None
+        return {activity: emission / total for activity, emission in emissions.items()}
+    
+    def score(self, exposure: np.ndarray, state: Optional[CandidateSet] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """所有候選行動的 (減碳量, 分數)；exposure 可為 (活動數,) 或 (用戶數, 活動數)"""
+        state = state or self.state
+        saving = exposure[..., state.candidate_activity] * state.candidate_reduction
+        return saving, saving * (1 - self.difficulty_weight * state.candidate_difficulty)
+    
+    def generate_recommendations(self, data: Dict) -> List[Dict]:
+        """生成環保建議，依分數排序；同一活動只保留分數最高的行動"""
+        try:
+            preferences = data.get('user_preferences') or {}
+            category = data.get('category') or preferences.get('category')
+            max_difficulty = preferences.get('max_difficulty')
+            limit = int(data.get('limit') or preferences.get('limit') or self.limit)
+            state = self._sync_factors()
+            vector, total = self.exposure(data, state)
+            
+            user_id = str(data.get('user_id') or data.get('userId') or '')
+            profile = hashlib.sha1(np.round(vector, 3).tobytes())
+            profile.update(f'{total:.3f}|{category}|{max_difficulty}|{limit}|{state.snapshot.version}'.encode())
+            key = (user_id, profile.hexdigest())
+            cached = self._memo_get(key)
+            if cached is not None:
+                return cached
+            
+            saving, score = self.score(vector, state)
+            eligible = saving > 0
+            if category:
+                eligible &= state.candidate_category == category
+            if max_difficulty in DIFFICULTY_LEVELS:
+                eligible &= state.candidate_difficulty <= DIFFICULTY_LEVELS[max_difficulty]
+            
+            order = np.flatnonzero(eligible)
+            order = order[np.argsort(-score[order], kind='stable')]
+            _, first = np.unique(state.candidate_activity[order], return_index=True)
+            chosen = order[np.sort(first)][:limit]
+            
+            recommendations = [self._format(state.candidates[i], float(saving[i]), total) for i in chosen]
+            self._memo_put(key, recommendations)
+            return [dict(recommendation) for recommendation in recommendations]
+        
+        except Exception as e:
+            logger.error(f"建議生成失敗: {e}")
+            return []
+    
+    def _format(self, candidate: Dict, saving: float, total: float) -> Dict:
+        percent = saving / total * 100 if total > 0 else 0.0
+        if candidate['target'] is not None:
+            unit = UNIT_NAMES.get(candidate['unit'], candidate['unit'])
+            description = (f"將約 {candidate['share'] * 100:.0f}% 的{ACTIVITY_NAMES[candidate['activity']]}"
+                           f"改為{ACTIVITY_NAMES[candidate['target']]}，每{unit}減少 "
+                           f"{candidate['saving_per_unit']} kg CO2，預估可減少 {saving:.2f} kg CO2")
+        else:
+            description = f"預估可減少 {saving:.2f} kg CO2"
+        difficulty = candidate['difficulty']
+        return {
+            'id': candidate['id'],
+            'category': self.category_of(candidate['activity']),
+            'title': candidate['title'],
+            'description': description,
+            'potential_saving': round(saving, 3),
+            'saving_percent': round(percent, 1),
+            'saving_per_unit': candidate['saving_per_unit'],
+            'unit': candidate['unit'],
+            'difficulty': 'easy' if difficulty <= 0.3 else 'medium' if difficulty <= 0.6 else 'hard',
+            'priority': 'high' if percent >= 10 else 'medium' if percent >= 3 else 'low'
+        }
+    
+    def _memo_get(self, key: Tuple[str, str]) -> Optional[List[Dict]]:
+        now = time.monotonic()
+        with self.lock:
+            entry = self._memo.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._memo[key]
+                    self.metrics['evictions'] += 1
+                self.metrics['misses'] += 1
+                return None
+            self._memo.move_to_end(key)
+            self.metrics['hits'] += 1
+            return [dict(recommendation) for recommendation in entry[1]]
+    
+    def _memo_put(self, key: Tuple[str, str], recommendations: List[Dict]):
+        with self.lock:
+            self._memo[key] = (time.monotonic() + self.ttl, recommendations)
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+                self.metrics['evictions'] += 1
+    
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.metrics, entries=len(self._memo))
@@ -0,0 +1,267 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from services.carbon_calculator import CarbonCalculator
+from services.data_processor import CATEGORIES, DataProcessor, ProcessingRun
+from services.movement_analyzer import local_day
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('day', 'week', 'month')
+# 每個彙總桶為一個向量：各類別碳排放、活動筆數、有記錄的天數
+FIELDS = CATEGORIES + ('activity_count', 'days')
+ACTIVITY_COUNT = FIELDS.index('activity_count')
+DAYS = FIELDS.index('days')
+
+@lru_cache(maxsize=4096)
+def month_start(month: int) -> int:
+    """月序號（1970-01 起的月數）第一天的日序號（1970-01-01 起的天數）"""
+    return int(np.datetime64(month, 'M').astype('datetime64[D]').astype(np.int64))
+
+def period_bounds(level: str, key: int) -> Tuple[int, int]:
+    """彙總桶涵蓋的日序號範圍 [first, last]"""
+    if level == 'day':
+        return key, key
+    if level == 'week':
+        return key, key + 6
+    return month_start(key), month_start(key + 1) - 1
+
+def period_label(level: str, key: int) -> str:
+    if level == 'day':
+        return str(np.datetime64(key, 'D'))
+    if level == 'week':
+        year, week, _ = date.fromordinal(date(1970, 1, 1).toordinal() + key).isocalendar()
+        return f'{year}-W{week:02d}'
+    return str(np.datetime64(key, 'M'))
+
+@dataclass
+class UserRollup:
+    """單一用戶各層級的彙總桶：{層級: {日/週/月序號: 向量}}"""
+    buckets: Dict[str, Dict[int, np.ndarray]] = field(default_factory=lambda: {level: {} for level in LEVELS})
+
+class RollupStore:
+    """用戶碳足跡日、週、月彙總
+    
+    活動寫入時以 ingest 增量更新各用戶的日、週、月彙總桶（移除或修改活動時以 remove=True
+    扣除舊記錄），趨勢、比較與排行榜查詢只讀取彙總桶，不需掃描原始活動。
+    區間查詢以完整涵蓋的月、週彙總桶加上邊界的日彙總桶計算，成本與區間內的月數成正比。
+    彙總只保存在記憶體中，服務重新啟動後需重新匯入歷史記錄。
+    """
+    
+    def __init__(self, carbon_calculator: Optional[CarbonCalculator] = None, chunk_size: int = 10000,
+                 utc_offset: float = 8.0):
+        self.carbon_calculator = carbon_calculator or CarbonCalculator()
+        self.data_processor = DataProcessor(self.carbon_calculator, chunk_size=chunk_size, utc_offset=utc_offset)
+        # 日界線使用的時區（小時），預設為台灣時間
+        self.utc_offset = utc_offset
+        self.users: Dict[str, UserRollup] = {}
+        self.lock = threading.RLock()
+    
+    def ingest(self, records: Iterable, remove: bool = False, prefetch: bool = False) -> Dict:
+        """加入（remove=True 時扣除）活動記錄，記錄需包含 user_id 與時間
+        
+        記錄格式與 DataProcessor 相同；未提供 carbon_footprint 時以目前的係數計算。
+        """
+        run = ProcessingRun(max_errors=self.data_processor.max_errors)
+        for name in ('parse', 'validate', 'normalize', 'enrich', 'rollup'):
+            run.stage(name)
+        stats = run.stage('rollup')
+        sign = -1.0 if remove else 1.0
+        applied = 0
+        
+        for chunk in self.data_processor.iter_chunks(records, run, prefetch=prefetch):
+            start = time.perf_counter()
+            users = [record.get('user_id') for record in chunk.records]
+            usable = np.isfinite(chunk.timestamp) & np.array([user is not None for user in users], dtype=bool)
+            for i in np.flatnonzero(~usable).tolist():
+                if users[i] is None:
+                    run.reject(int(chunk.index[i]), 'user_id', '缺少 user_id')
+                else:
+                    run.reject(int(chunk.index[i]), 'timestamp', '缺少時間')
+            
+            rows = np.flatnonzero(usable)
+            if len(rows):
+                emission = self.carbon_calculator._round_batch(chunk.emission[rows])
+                days = ((chunk.timestamp[rows] + self.utc_offset * 3600) // 86400).astype(np.int64)
+                names, user_codes = np.unique(np.array([str(users[i]) for i in rows]), return_inverse=True)
+                with self.lock:
+                    self._apply(names, user_codes, days, chunk.category[rows], emission * sign, sign)
+                applied += len(rows)
+            
+            stats.seconds += time.perf_counter() - start
+            stats.records_in += len(chunk)
+            stats.records_out += len(rows)
+            stats.chunks += 1
+        
+        return {
+            'record_count': run.stage('parse').records_in,
+            'removed_count' if remove else 'ingested_count': applied,
+            'invalid_count': sum(run.error_counts.values()),
+            'user_count': len(self.users),
+            'errors': {'by_reason': dict(run.error_counts), 'samples': run.error_samples},
+            'stages': {name: stage.to_dict() for name, stage in run.stages.items()}
+        }
+    
+    def _apply(self, names: np.ndarray, user_codes: np.ndarray, days: np.ndarray, categories: np.ndarray,
+               emission: np.ndarray, sign: float):
+        """將一段記錄依 (用戶, 日) 分組後併入日彙總桶，再把差額傳遞到週、月彙總桶"""
+        groups, inverse = np.unique(np.stack([user_codes, days]), axis=1, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        size = groups.shape[1]
+        deltas = np.zeros((size, len(FIELDS)))
+        for code in range(len(CATEGORIES)):
+            members = categories == code
+            deltas[:, code] = np.bincount(inverse[members], weights=emission[members], minlength=size)
+        deltas[:, ACTIVITY_COUNT] = np.bincount(inverse, minlength=size) * sign
+        
+        user_codes, days = groups
+        # 週以週一開始（1970-01-01 為週四）
+        weeks = days - (days + 3) % 7
+        months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+        for user_code, day, week, month, delta in zip(user_codes.tolist(), days.tolist(), weeks.tolist(),
+                                                      months.tolist(), deltas):
+            buckets = self.users.setdefault(str(names[user_code]), UserRollup()).buckets
+            daily = buckets['day'].get(day)
+            before = daily[ACTIVITY_COUNT] if daily is not None else 0.0
+            after = before + delta[ACTIVITY_COUNT]
+            # 天數只在日彙總桶出現或清空時改變
+            delta[DAYS] = int(after > 0) - int(before > 0)
+            for level, key in (('day', day), ('week', week), ('month', month)):
+                bucket = buckets[level].get(key)
+                bucket = delta.copy() if bucket is None else bucket + delta
+                if bucket[ACTIVITY_COUNT] > 0:
+                    buckets[level][key] = bucket
+                else:
+                    buckets[level].pop(key, None)
+    
+    def _day(self, value) -> Optional[int]:
+        """ISO 8601 日期/時間或 Unix 時間轉為當地日序號（只有日期時即為當地日期）；None 保持 None"""
+        if value is None or value == '':
+            return None
+        try:
+            day = local_day(value, self.utc_offset)
+        except (ValueError, TypeError, AttributeError, OverflowError):
+            raise ValueError(f'無效的日期: {value}')
+        return day
+    
+    @staticmethod
+    def _periods(buckets: Dict[str, Dict[int, np.ndarray]], level: str, first: Optional[int],
+                 last: Optional[int]) -> List[Tuple[int, np.ndarray]]:
+        """[first, last] 內有記錄的各期彙總；只部分落在區間內的期間以日彙總桶加總"""
+        result = []
+        daily = buckets['day']
+        for key in sorted(buckets[level]):
+            begin, end = period_bounds(level, key)
+            if (first is not None and end < first) or (last is not None and begin > last):
+                continue
+            if (first is None or begin >= first) and (last is None or end <= last):
+                result.append((key, buckets[level][key]))
+                continue
+            begin = begin if first is None else max(begin, first)
+            end = end if last is None else min(end, last)
+            total = np.zeros(len(FIELDS))
+            for day in range(begin, end + 1):
+                if day in daily:
+                    total += daily[day]
+            if total[ACTIVITY_COUNT] > 0:
+                result.append((key, total))
+        return result
+    
+    def _range_total(self, buckets: Dict[str, Dict[int, np.ndarray]], first: Optional[int],
+                     last: Optional[int]) -> np.ndarray:
+        total = np.zeros(len(FIELDS))
+        for _, bucket in self._periods(buckets, 'month', first, last):
+            total += bucket
+        return total
+    
+    @staticmethod
+    def _summary(vector: np.ndarray) -> Dict:
+        total = float(vector[:len(CATEGORIES)].sum())
+        days = int(round(vector[DAYS]))
+        return {
+            'total_emission': round(total, 3),
+            'breakdown': {name: round(float(vector[code]), 3) for code, name in enumerate(CATEGORIES)},
+            'activity_count': int(round(vector[ACTIVITY_COUNT])),
+            'days_count': days,
+            'average_daily': round(total / days, 3) if days else 0.0
+        }
+    
+    def trends(self, user_id: str, start=None, end=None, group_by: str = 'day') -> List[Dict]:
+        """[start, end] 內每日、每週或每月的碳排放（日期皆為當地日期，包含 end 當天）"""
+        if group_by not in LEVELS:
+            raise ValueError(f'不支援的分組方式: {group_by}')
+        first, last = self._day(start), self._day(end)
+        with self.lock:
+            rollup = self.users.get(str(user_id))
+            periods = self._periods(rollup.buckets, group_by, first, last) if rollup else []
+        return [dict(period=period_label(group_by, key), **self._summary(vector)) for key, vector in periods]
+    
+    def daily_footprint(self, user_id: str, day) -> Dict:
+        """單日碳足跡，格式與 CarbonCalculator.calculate_daily_footprint 相同"""
+        key = self._day(day)
+        with self.lock:
+            rollup = self.users.get(str(user_id))
+            vector = rollup.buckets['day'].get(key) if rollup else None
+        summary = self._summary(vector if vector is not None else np.zeros(len(FIELDS)))
+        count = summary['activity_count']
+        return {
+            'date': period_label('day', key),
+            'total_emission': summary['total_emission'],
+            'breakdown': summary['breakdown'],
+            'activity_count': count,
+            'average_per_activity': round(summary['total_emission'] / count, 3) if count else 0.0
+        }
+    
+    def daily_series(self, user_id: str) -> Tuple[np.ndarray, np.ndarray]:
+        """用戶有記錄的日序號（遞增）與每日總碳排放"""
+        with self.lock:
+            rollup = self.users.get(str(user_id))
+            daily = dict(rollup.buckets['day']) if rollup else {}
+        days = np.array(sorted(daily), dtype=np.int64)
+        totals = np.array([daily[day][:len(CATEGORIES)].sum() for day in days.tolist()], dtype=np.float64)
+        return days, totals
+    
+    def leaderboard(self, start=None, end=None, limit: int = 10) -> List[Dict]:
+        """[start, end] 內平均每日碳排放最低的用戶（越低越好）"""
+        first, last = self._day(start), self._day(end)
+        with self.lock:
+            totals = [(user_id, self._range_total(rollup.buckets, first, last)) for user_id, rollup in self.users.items()]
+        rows = [dict(user_id=user_id, **self._summary(vector)) for user_id, vector in totals if vector[DAYS] > 0]
+        rows.sort(key=lambda row: (row['average_daily'], row['user_id']))
+        return [dict(row, rank=rank) for rank, row in enumerate(rows[:limit], 1)]
+    
+    def comparison(self, user_id: str, start, end) -> Dict:
+        """用戶在 [start, end] 的碳排放與前一個等長區間、所有用戶平均的比較"""
+        first, last = self._day(start), self._day(end)
+        if first is None or last is None or last < first:
+            raise ValueError('比較需要有效的 start 與 end')
+        length = last - first + 1
+        with self.lock:
+            rollup = self.users.get(str(user_id))
+            current = self._range_total(rollup.buckets, first, last) if rollup else np.zeros(len(FIELDS))
+            previous = self._range_total(rollup.buckets, first - length, first - 1) if rollup else np.zeros(len(FIELDS))
+            others = [self._range_total(other.buckets, first, last) for other in self.users.values()]
+        
+        average = current[:len(CATEGORIES)].sum() / current[DAYS] if current[DAYS] > 0 else None
+        current, previous = self._summary(current), self._summary(previous)
+        averages = [vector[:len(CATEGORIES)].sum() / vector[DAYS] for vector in others if vector[DAYS] > 0]
+        community = float(np.mean(averages)) if averages else 0.0
+        change = None
+        if previous['average_daily']:
+            change = round((current['average_daily'] - previous['average_daily']) / previous['average_daily'] * 100, 1)
+        return {
+            'current': current,
+            'previous': previous,
+            'change_percent': change,
+            'community': {'average_daily': round(community, 3), 'user_count': len(averages)},
+            # 平均每日碳排放高於此用戶的用戶比例
+            'percentile': round(float(np.mean([value > average for value in averages])) * 100, 1)
+            if average is not None else None
+        }
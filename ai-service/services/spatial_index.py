@@ -0,0 +1,326 @@
+import logging
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = EARTH_RADIUS_M * np.pi / 180
+
+# 網格鍵：列、欄編號加上偏移後組成 int64（列在高 32 位元），依鍵排序即為逐列、逐欄排序
+_ROW_OFFSET = 1 << 30
+_COL_OFFSET = 1 << 31
+_COL_MASK = (1 << 32) - 1
+
+# 聚類結果中不屬於任何群集的點
+NOISE = -1
+
+def haversine_m(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """向量化 Haversine 距離（公尺）"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def _row_scale(row, cell_size: float) -> np.ndarray:
+    """各列中心緯度上每度經度的公尺數"""
+    center = (row + 0.5) * cell_size / METERS_PER_DEGREE
+    return METERS_PER_DEGREE * np.maximum(np.cos(np.radians(center)), 1e-6)
+
+def cell_coordinates(latitude, longitude, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """座標所在網格的 (列, 欄)
+    
+    列為 cell_size 公尺寬的緯度帶；欄寬依各列中心緯度換算，使每格約為 cell_size 公尺見方。
+    """
+    row = np.floor(np.asarray(latitude, dtype=np.float64) * METERS_PER_DEGREE / cell_size).astype(np.int64)
+    col = np.floor(np.asarray(longitude, dtype=np.float64) * _row_scale(row, cell_size) / cell_size)
+    return row, col.astype(np.int64)
+
+def cell_center(row, col, cell_size: float) -> Tuple[np.ndarray, np.ndarray]:
+    """網格中心座標"""
+    return (row + 0.5) * cell_size / METERS_PER_DEGREE, (col + 0.5) * cell_size / _row_scale(row, cell_size)
+
+def _cell_key(row, col) -> np.ndarray:
+    return ((row + _ROW_OFFSET) << 32) | (col + _COL_OFFSET)
+
+def _split_key(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return (keys >> 32) - _ROW_OFFSET, (keys & _COL_MASK) - _COL_OFFSET
+
+def _expand(lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """將 (查詢點數, 列數) 的排序位置範圍 [lo, hi) 展開為 (查詢點索引, 排序位置)"""
+    counts = (hi - lo).ravel()
+    offsets = np.cumsum(counts) - counts
+    query = np.repeat(np.arange(counts.size) // lo.shape[1], counts)
+    position = np.repeat(lo.ravel() - offsets, counts) + np.arange(counts.sum())
+    return query, position
+
+class _Grid:
+    """依網格鍵排序的點編號（keys 已排序，order 為對應的點編號）"""
+    
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.order = np.zeros(0, dtype=np.int64)
+    
+    def add(self, latitude: np.ndarray, longitude: np.ndarray, ids: np.ndarray):
+        """將一批點合併進已排序的鍵（只移動一次既有陣列）"""
+        keys = _cell_key(*cell_coordinates(latitude, longitude, self.cell_size))
+        sort = np.argsort(keys, kind='stable')
+        keys, ids = keys[sort], ids[sort]
+        if len(self.keys):
+            position = np.searchsorted(self.keys, keys, side='right')
+            self.keys = np.insert(self.keys, position, keys)
+            self.order = np.insert(self.order, position, ids)
+        else:
+            self.keys, self.order = keys, ids
+    
+    def ranges(self, latitude: np.ndarray, longitude: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+        """查詢點 radius 公尺內的網格在排序後的位置範圍 [lo, hi)，每列一個範圍
+        
+        回傳形狀為 (查詢點數, 列數)；不處理跨越 180 度經線與極區的範圍。
+        """
+        y = latitude * METERS_PER_DEGREE
+        first_row = np.floor((y - radius) / self.cell_size).astype(np.int64)
+        last_row = np.floor((y + radius) / self.cell_size).astype(np.int64)
+        span = int((last_row - first_row).max()) + 1 if len(first_row) else 1
+        rows = first_row[:, None] + np.arange(span)
+        
+        # 經度方向的半徑（度）以離赤道較遠一側的緯度換算
+        far_latitude = np.minimum(np.abs(latitude) + radius / METERS_PER_DEGREE, 89.0)
+        half_width = (radius / (METERS_PER_DEGREE * np.cos(np.radians(far_latitude))))[:, None]
+        scale = _row_scale(rows, self.cell_size) / self.cell_size
+        first_col = np.floor((longitude[:, None] - half_width) * scale).astype(np.int64)
+        last_col = np.floor((longitude[:, None] + half_width) * scale).astype(np.int64)
+        
+        lo = np.searchsorted(self.keys, _cell_key(rows, first_col), side='left')
+        hi = np.searchsorted(self.keys, _cell_key(rows, last_col), side='right')
+        return lo, np.where(rows <= last_row[:, None], hi, lo)
+    
+    def pairs_within(self, latitude: np.ndarray, longitude: np.ndarray, points: np.ndarray, radius: float,
+                     block_pairs: int, chunk_size: int = 65536) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """產生 points 中各點與 radius 公尺內所有點（含自身）的配對
+        
+        每批回傳 (本批查詢點, 配對的查詢點索引, 配對的點編號)，且包含本批查詢點的所有配對；
+        每批的候選配對數約為 block_pairs，記憶體用量與總點數無關。距離以局部平面近似計算。
+        """
+        radius_sq = radius * radius
+        for chunk_start in range(0, len(points), chunk_size):
+            chunk = points[chunk_start:chunk_start + chunk_size]
+            lo, hi = self.ranges(latitude[chunk], longitude[chunk], radius)
+            total = np.cumsum((hi - lo).sum(axis=1))
+            start = 0
+            while start < len(chunk):
+                done = total[start - 1] if start else 0
+                end = max(int(np.searchsorted(total, done + block_pairs, side='right')), start + 1)
+                query, position = _expand(lo[start:end], hi[start:end])
+                block = chunk[start:end]
+                p, q = block[query], self.order[position]
+                dy = (latitude[p] - latitude[q]) * METERS_PER_DEGREE
+                dx = (longitude[p] - longitude[q]) * METERS_PER_DEGREE * np.cos(np.radians(latitude[p]))
+                within = dx * dx + dy * dy <= radius_sq
+                yield block, query[within], q[within]
+                start = end
+
+def _connected_components(size: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """以連結與路徑壓縮計算無向圖的連通元件，回傳各節點所屬元件的最小節點編號"""
+    label = np.arange(size)
+    while len(a):
+        root_a, root_b = label[a], label[b]
+        if np.array_equal(root_a, root_b):
+            break
+        low = np.minimum(root_a, root_b)
+        np.minimum.at(label, root_a, low)
+        np.minimum.at(label, root_b, low)
+        while True:
+            compressed = label[label]
+            if np.array_equal(compressed, label):
+                break
+            label = compressed
+    return label
+
+def cluster_summary(latitude: np.ndarray, longitude: np.ndarray, labels: np.ndarray,
+                    weights: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+    """各群集的點數、中心座標、半徑（離中心最遠的點，公尺）與權重總和"""
+    assigned = labels != NOISE
+    labels = labels[assigned]
+    latitude, longitude = latitude[assigned], longitude[assigned]
+    size = int(labels.max()) + 1 if len(labels) else 0
+    
+    count = np.bincount(labels, minlength=size)
+    center_lat = np.bincount(labels, weights=latitude, minlength=size) / np.maximum(count, 1)
+    center_lon = np.bincount(labels, weights=longitude, minlength=size) / np.maximum(count, 1)
+    radius = np.zeros(size)
+    np.maximum.at(radius, labels, haversine_m(latitude, longitude, center_lat[labels], center_lon[labels]))
+    
+    summary = {'count': count, 'latitude': center_lat, 'longitude': center_lon, 'radius': radius}
+    if weights is not None:
+        summary['weight'] = np.bincount(labels, weights=np.asarray(weights)[assigned], minlength=size)
+    return summary
+
+class SpatialIndex:
+    """網格空間索引
+    
+    點依所在網格（約 cell_size 公尺見方）的鍵排序存放，半徑查詢只檢查範圍內各列的連續區段，
+    再以實際距離篩選。插入時只附加座標，查詢前才把新的點一次合併進排序後的鍵，
+    因此逐筆或分批插入的成本都與批次排序相當。編號依插入順序從 0 開始。
+    """
+    
+    def __init__(self, cell_size: float = 100.0, capacity: int = 1024):
+        if cell_size < 1:
+            raise ValueError('cell_size 需至少 1 公尺')
+        self.cell_size = cell_size
+        self._latitude = np.empty(capacity)
+        self._longitude = np.empty(capacity)
+        self._size = 0
+        self._indexed = 0
+        self._grid = _Grid(cell_size)
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    @property
+    def latitude(self) -> np.ndarray:
+        return self._latitude[:self._size]
+    
+    @property
+    def longitude(self) -> np.ndarray:
+        return self._longitude[:self._size]
+    
+    def insert(self, latitude, longitude) -> np.ndarray:
+        """加入一個或一批點，回傳其編號"""
+        latitude = np.atleast_1d(np.asarray(latitude, dtype=np.float64))
+        longitude = np.atleast_1d(np.asarray(longitude, dtype=np.float64))
+        if latitude.shape != longitude.shape or latitude.ndim != 1:
+            raise ValueError('緯度與經度數量不一致')
+        if not (np.all(np.abs(latitude) <= 90) and np.all(np.abs(longitude) <= 180)):
+            raise ValueError('座標超出範圍')
+        
+        start, end = self._size, self._size + len(latitude)
+        if end > len(self._latitude):
+            capacity = max(end, 2 * len(self._latitude))
+            for name in ('_latitude', '_longitude'):
+                grown = np.empty(capacity)
+                grown[:start] = getattr(self, name)[:start]
+                setattr(self, name, grown)
+        self._latitude[start:end] = latitude
+        self._longitude[start:end] = longitude
+        self._size = end
+        return np.arange(start, end)
+    
+    def _flush(self):
+        """將尚未索引的點合併進排序後的網格"""
+        if self._indexed < self._size:
+            ids = np.arange(self._indexed, self._size)
+            self._grid.add(self._latitude[ids], self._longitude[ids], ids)
+            self._indexed = self._size
+    
+    def query_radius(self, latitude: float, longitude: float, radius: float, return_distance: bool = False):
+        """半徑 radius 公尺內的點編號（由近到遠）；return_distance 時一併回傳距離"""
+        self._flush()
+        lo, hi = self._grid.ranges(np.array([latitude], dtype=np.float64),
+                                   np.array([longitude], dtype=np.float64), radius)
+        _, position = _expand(lo, hi)
+        ids = self._grid.order[position]
+        distance = haversine_m(latitude, longitude, self._latitude[ids], self._longitude[ids])
+        within = distance <= radius
+        ids, distance = ids[within], distance[within]
+        sort = np.argsort(distance, kind='stable')
+        return (ids[sort], distance[sort]) if return_distance else ids[sort]
+    
+    def heatmap(self, cell_size: Optional[float] = None, weights: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """各網格的點數（與權重總和）及網格中心座標；cell_size 與索引相同時直接使用已排序的鍵"""
+        cell_size = cell_size or self.cell_size
+        if cell_size == self.cell_size:
+            self._flush()
+            keys, order = self._grid.keys, self._grid.order
+        else:
+            keys = _cell_key(*cell_coordinates(self.latitude, self.longitude, cell_size))
+            order = np.argsort(keys, kind='stable')
+            keys = keys[order]
+        
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.zeros(0, int)
+        row, col = _split_key(keys[starts])
+        latitude, longitude = cell_center(row, col, cell_size)
+        result = {'latitude': latitude, 'longitude': longitude, 'count': np.diff(np.append(starts, len(keys)))}
+        if weights is not None:
+            ordered = np.asarray(weights, dtype=np.float64)[order]
+            result['weight'] = np.add.reduceat(ordered, starts) if len(starts) else np.zeros(0)
+        return result
+    
+    def cluster(self, eps: float, min_points: int = 5, block_pairs: int = 1 << 21) -> np.ndarray:
+        """DBSCAN 式密度聚類，回傳各點的群集編號（依群集大小由大到小編號，雜訊為 NOISE）
+        
+        與 DBSCAN 相同：eps 公尺內（含自身）至少 min_points 個點的為核心點，核心點彼此可達者
+        為同一群集，非核心點歸入 eps 內任一核心點的群集。以邊長 eps/√2 的網格加速：同一格內
+        任兩點都在 eps 內，點數達 min_points 的網格其點必為核心點而不需計算距離；只有稀疏網格
+        的點需要與鄰近網格的點比對。相鄰的兩個密集網格直接視為連通（近似，可能合併相距略
+        超過 eps 的群集），其餘核心點之間的連通以實際距離判斷。
+        """
+        n = self._size
+        labels = np.full(n, NOISE, dtype=np.int64)
+        if n == 0:
+            return labels
+        side = eps / np.sqrt(2)
+        if side < 1:
+            raise ValueError('eps 需至少 1.5 公尺')
+        latitude, longitude = self.latitude, self.longitude
+        
+        grid = _Grid(side)
+        grid.add(latitude, longitude, np.arange(n))
+        keys = grid.keys
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        counts = np.diff(np.append(starts, n))
+        cell = np.empty(n, dtype=np.int64)
+        cell[grid.order] = np.repeat(np.arange(len(starts)), counts)
+        dense_cell = counts >= min_points
+        core = dense_cell[cell]
+        
+        # 稀疏網格的點：計算 eps 內的點數；核心點與其他網格鄰居的連結先記錄，
+        # 鄰居在密集網格時必為核心點，否則待所有點判定後再確認
+        edges, pending = [], []
+        for block, query, neighbor in grid.pairs_within(latitude, longitude, np.flatnonzero(~core), eps,
+                                                        block_pairs):
+            core[block] = np.bincount(query, minlength=len(block)) >= min_points
+            point = block[query]
+            link = core[point] & (cell[point] != cell[neighbor])
+            to_dense = link & dense_cell[cell[neighbor]]
+            edges.append((cell[point[to_dense]], cell[neighbor[to_dense]]))
+            pending.append((point[link & ~to_dense], neighbor[link & ~to_dense]))
+        for point, neighbor in pending:
+            confirmed = core[neighbor]
+            edges.append((cell[point[confirmed]], cell[neighbor[confirmed]]))
+        
+        # 相鄰（含對角）的密集網格：同列下一欄與上一列鄰近三欄
+        dense = np.flatnonzero(dense_cell)
+        if len(dense):
+            dense_keys = keys[starts[dense]]
+            row, col = _split_key(dense_keys)
+            _, center_lon = cell_center(row, col, side)
+            above = np.floor(center_lon * _row_scale(row + 1, side) / side).astype(np.int64)
+            for neighbor_row, neighbor_col in ((row, col + 1), (row + 1, above - 1), (row + 1, above),
+                                               (row + 1, above + 1)):
+                target = _cell_key(neighbor_row, neighbor_col)
+                found = np.minimum(np.searchsorted(dense_keys, target), len(dense_keys) - 1)
+                hit = dense_keys[found] == target
+                edges.append((dense[hit], dense[found[hit]]))
+        
+        a = np.concatenate([edge[0] for edge in edges]) if edges else np.zeros(0, dtype=np.int64)
+        b = np.concatenate([edge[1] for edge in edges]) if edges else np.zeros(0, dtype=np.int64)
+        component = _connected_components(len(starts), a, b)
+        labels[core] = component[cell[core]]
+        
+        # 非核心點歸入 eps 內第一個核心點的群集
+        for block, query, neighbor in grid.pairs_within(latitude, longitude, np.flatnonzero(~core), eps,
+                                                        block_pairs):
+            reachable = core[neighbor]
+            query, neighbor = query[reachable], neighbor[reachable]
+            _, first = np.unique(query, return_index=True)
+            labels[block[query[first]]] = component[cell[neighbor[first]]]
+        
+        # 依群集大小重新編號
+        assigned = labels != NOISE
+        roots, inverse, sizes = np.unique(labels[assigned], return_inverse=True, return_counts=True)
+        rank = np.empty(len(roots), dtype=np.int64)
+        rank[np.argsort(-sizes, kind='stable')] = np.arange(len(roots))
+        labels[assigned] = rank[inverse]
+        return labels
@@ -0,0 +1,264 @@
+import base64
+import logging
+import struct
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+# 可編碼的欄位與整數化比例：座標 1e-6 度（約 0.1 公尺），時間與累計停靠時間為毫秒
+CHANNEL_SCALES = {
+    'latitude': 1e6,
+    'longitude': 1e6,
+    'timestamp': 1e3,
+    'dwell_time': 1e3
+}
+TRACE_KEYS = ('latitude', 'longitude', 'timestamp')
+
+# 各欄位差值的整數型別：座標差值不超過 360 度，以 int32 儲存；時間與累計停靠時間的差值
+# 可能超過 int32 毫秒（約 24.8 天，例如跨週的軌跡），以 int64 儲存
+DELTA_TYPES = {
+    'latitude': '<i4',
+    'longitude': '<i4',
+    'timestamp': '<i8',
+    'dwell_time': '<i8'
+}
+
+def _delta_dtype(channels: Tuple[str, ...]) -> np.dtype:
+    return np.dtype([(name, DELTA_TYPES[name]) for name in channels])
+
+class CompactTrace:
+    """差分編碼的軌跡
+    
+    各欄位依 CHANNEL_SCALES 轉為整數；第一點為絕對值（int64），之後各點只存與前一點的
+    差值（型別依 DELTA_TYPES）。除座標與時間外，可附帶 dwell_time 等累計值欄位。
+    """
+    
+    # 點數、欄位位元遮罩
+    HEADER = struct.Struct('<IB')
+    
+    def __init__(self, channels: Tuple[str, ...], origin: Optional[np.ndarray], deltas: np.ndarray):
+        # origin: (欄位數,) int64；deltas: (n - 1,) 結構陣列，每個欄位一個差值
+        self.channels = channels
+        self.origin = origin
+        self.deltas = deltas
+    
+    def __len__(self) -> int:
+        return len(self.deltas) + 1 if self.origin is not None else 0
+    
+    @classmethod
+    def empty(cls, channels: Tuple[str, ...] = TRACE_KEYS) -> 'CompactTrace':
+        return cls(channels, None, np.zeros(0, dtype=_delta_dtype(channels)))
+    
+    @classmethod
+    def encode(cls, columns: Dict[str, np.ndarray]) -> 'CompactTrace':
+        """由 {'latitude', 'longitude', 'timestamp'（UNIX 秒數）, ...} 陣列建立"""
+        channels = tuple(name for name in CHANNEL_SCALES if name in columns)
+        if len(columns['timestamp']) == 0:
+            return cls.empty(channels)
+        absolute = np.column_stack([
+            np.round(np.asarray(columns[name], dtype=np.float64) * CHANNEL_SCALES[name]) for name in channels
+        ]).astype(np.int64)
+        return cls._from_absolute(channels, absolute)
+    
+    @classmethod
+    def _from_absolute(cls, channels: Tuple[str, ...], absolute: np.ndarray) -> 'CompactTrace':
+        differences = np.diff(absolute, axis=0)
+        deltas = np.empty(len(differences), dtype=_delta_dtype(channels))
+        for i, name in enumerate(channels):
+            limit = np.iinfo(deltas.dtype[name]).max
+            if len(differences) and np.abs(differences[:, i]).max() > limit:
+                raise ValueError(f'{name} 相鄰兩點的差值超出範圍')
+            deltas[name] = differences[:, i]
+        return cls(channels, absolute[0].copy(), deltas)
+    
+    @classmethod
+    def concatenate(cls, traces: Iterable['CompactTrace']) -> 'CompactTrace':
+        """串接多個片段（例如串流壓縮產生的各段；欄位需相同）"""
+        traces = [trace for trace in traces if len(trace)]
+        if not traces:
+            return cls.empty()
+        return cls._from_absolute(traces[0].channels, np.concatenate([trace.absolute() for trace in traces]))
+    
+    def absolute(self) -> np.ndarray:
+        if self.origin is None:
+            return np.zeros((0, len(self.channels)), dtype=np.int64)
+        deltas = np.column_stack([self.deltas[name].astype(np.int64) for name in self.channels])
+        return np.cumsum(np.vstack((self.origin, deltas)), axis=0, dtype=np.int64)
+    
+    def decode(self) -> Dict[str, np.ndarray]:
+        """還原為 {'latitude', 'longitude', 'timestamp', ...} 陣列"""
+        absolute = self.absolute()
+        return {name: absolute[:, i] / CHANNEL_SCALES[name] for i, name in enumerate(self.channels)}
+    
+    @property
+    def nbytes(self) -> int:
+        origin_bytes = 8 * len(self.channels) if self.origin is not None else 0
+        return self.HEADER.size + origin_bytes + self.deltas.nbytes
+    
+    def to_bytes(self) -> bytes:
+        mask = sum(1 << i for i, name in enumerate(CHANNEL_SCALES) if name in self.channels)
+        header = self.HEADER.pack(len(self), mask)
+        if self.origin is None:
+            return header
+        return header + self.origin.astype('<i8').tobytes() + self.deltas.tobytes()
+    
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CompactTrace':
+        count, mask = cls.HEADER.unpack_from(data)
+        channels = tuple(name for i, name in enumerate(CHANNEL_SCALES) if mask & (1 << i))
+        if count == 0:
+            return cls.empty(channels)
+        width = len(channels)
+        origin = np.frombuffer(data, dtype='<i8', count=width, offset=cls.HEADER.size).astype(np.int64)
+        deltas = np.frombuffer(data, dtype=_delta_dtype(channels), count=count - 1, offset=cls.HEADER.size + 8 * width)
+        return cls(channels, origin, deltas.copy())
+    
+    def to_dict(self) -> Dict:
+        """JSON 格式（二進位內容以 base64 編碼）"""
+        return {
+            'encoding': 'delta-v2',
+            'channels': list(self.channels),
+            'points': len(self),
+            'data': base64.b64encode(self.to_bytes()).decode('ascii')
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CompactTrace':
+        return cls.from_bytes(base64.b64decode(data['data']))
+
+def smooth_positions(latitude: np.ndarray, longitude: np.ndarray, timestamp: np.ndarray,
+                     window: float) -> Tuple[np.ndarray, np.ndarray]:
+    """以前後各半個時間視窗（秒）內的平均位置去除定位雜訊"""
+    half = window / 2
+    low = np.searchsorted(timestamp, timestamp - half, side='left')
+    high = np.searchsorted(timestamp, timestamp + half, side='right')
+    count = high - low
+    latitude_sum = np.concatenate(([0.0], np.cumsum(latitude - latitude[0])))
+    longitude_sum = np.concatenate(([0.0], np.cumsum(longitude - longitude[0])))
+    return (latitude[0] + (latitude_sum[high] - latitude_sum[low]) / count,
+            longitude[0] + (longitude_sum[high] - longitude_sum[low]) / count)
+
+def simplify_mask(latitude: np.ndarray, longitude: np.ndarray, timestamp: np.ndarray,
+                  tolerance: float) -> np.ndarray:
+    """時間同步的 Douglas-Peucker 簡化，回傳保留點的布林遮罩
+    
+    誤差以同步歐氏距離（SED）計算：被移除的點與起訖點依時間內插位置的距離（公尺）不超過
+    tolerance，因此簡化後的軌跡仍保留速度與停留資訊。同一層的所有區段一次以向量化運算處理。
+    """
+    n = len(timestamp)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    
+    # 以第一點為原點投影為平面座標（公尺）
+    lat0 = np.radians(latitude[0])
+    x = np.radians(longitude - longitude[0]) * EARTH_RADIUS_M * np.cos(lat0)
+    y = np.radians(latitude - latitude[0]) * EARTH_RADIUS_M
+    
+    starts = np.array([0])
+    ends = np.array([n - 1])
+    while len(starts):
+        lengths = ends - starts - 1
+        has_interior = lengths > 0
+        starts, ends, lengths = starts[has_interior], ends[has_interior], lengths[has_interior]
+        if not len(starts):
+            break
+        
+        # 展開所有區段的內部點
+        segment = np.repeat(np.arange(len(starts)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        index = starts[segment] + 1 + (np.arange(lengths.sum()) - offsets[segment])
+        first, last = starts[segment], ends[segment]
+        
+        span = timestamp[last] - timestamp[first]
+        ratio = np.divide(timestamp[index] - timestamp[first], span, out=np.zeros(len(index)), where=span > 0)
+        error = np.hypot(x[index] - (x[first] + ratio * (x[last] - x[first])),
+                         y[index] - (y[first] + ratio * (y[last] - y[first])))
+        
+        # 各區段誤差最大的點超過容許值時保留並切分
+        segment_max = np.maximum.reduceat(error, offsets)
+        split = segment_max > tolerance
+        candidates = np.flatnonzero((error == segment_max[segment]) & split[segment])
+        _, first_candidate = np.unique(segment[candidates], return_index=True)
+        chosen = candidates[first_candidate]
+        picked, picked_segment = index[chosen], segment[chosen]
+        keep[picked] = True
+        
+        starts = np.concatenate((starts[picked_segment], picked))
+        ends = np.concatenate((picked, ends[picked_segment]))
+    
+    return keep
+
+class TrajectoryCompactor:
+    """串流軌跡壓縮
+    
+    逐段接收 GPS 點（依時間排序），先以 smoothing_window 秒的時間視窗平均去除定位雜訊，
+    再以時間同步的 Douglas-Peucker 簡化並輸出差分編碼的 CompactTrace 片段；輸出的點與
+    去除雜訊後的軌跡誤差不超過 tolerance 公尺。每段只保留最後一個確定點之後的尾端作為
+    下一段的開頭，因此整天的軌跡不需一次載入；尾端超過 max_buffer 點時強制輸出。
+    """
+    
+    def __init__(self, tolerance: float = 10.0, smoothing_window: Optional[float] = 30.0, max_buffer: int = 20000):
+        self.tolerance = tolerance
+        self.smoothing_window = smoothing_window
+        self.max_buffer = max_buffer
+    
+    def compact(self, chunks: Iterable[Dict[str, np.ndarray]]) -> Iterator[CompactTrace]:
+        """chunks 為 {'latitude', 'longitude', 'timestamp'} 陣列（可附帶 dwell_time 等欄位）；
+        產生壓縮後的片段"""
+        carry: Optional[Dict[str, np.ndarray]] = None
+        emitted_first = False
+        
+        for chunk in chunks:
+            if len(chunk['timestamp']) == 0:
+                continue
+            if carry is None:
+                buffer = {key: np.asarray(values, dtype=np.float64) for key, values in chunk.items()
+                          if key in CHANNEL_SCALES}
+            else:
+                buffer = {key: np.concatenate((carry[key], chunk[key])) for key in carry}
+            kept, smoothed = self._simplify(buffer)
+            
+            # 最後一點之後可能還有資料，暫不確定；從最後一個確定點開始保留為下一段的開頭
+            if len(kept) > 2 or len(buffer['timestamp']) > self.max_buffer:
+                boundary = kept[-2] if len(buffer['timestamp']) <= self.max_buffer else kept[-1]
+                confirmed = kept[kept <= boundary]
+                if emitted_first:
+                    confirmed = confirmed[1:]
+                emitted_first = True
+                carry = {key: values[boundary:] for key, values in buffer.items()}
+                if len(confirmed):
+                    yield CompactTrace.encode({key: values[confirmed] for key, values in smoothed.items()})
+            else:
+                carry = buffer
+        
+        if carry is not None:
+            kept, smoothed = self._simplify(carry)
+            if emitted_first:
+                kept = kept[1:]
+            if len(kept):
+                yield CompactTrace.encode({key: values[kept] for key, values in smoothed.items()})
+    
+    def compact_trace(self, columns: Dict[str, np.ndarray], chunk_size: int = 10000) -> CompactTrace:
+        """壓縮已在記憶體中的軌跡（依 chunk_size 分段處理）"""
+        size = len(columns['timestamp'])
+        chunks = (
+            {key: values[i:i + chunk_size] for key, values in columns.items() if key in CHANNEL_SCALES}
+            for i in range(0, size, chunk_size)
+        )
+        return CompactTrace.concatenate(self.compact(chunks))
+    
+    def _simplify(self, buffer: Dict[str, np.ndarray]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """回傳 (保留點的索引, 去除雜訊後的欄位)；buffer 保持原始座標供下一段使用"""
+        smoothed = dict(buffer)
+        if self.smoothing_window:
+            smoothed['latitude'], smoothed['longitude'] = smooth_positions(
+                buffer['latitude'], buffer['longitude'], buffer['timestamp'], self.smoothing_window
+            )
+        keep = simplify_mask(smoothed['latitude'], smoothed['longitude'], smoothed['timestamp'], self.tolerance)
+        return np.flatnonzero(keep), smoothed